@@ -0,0 +1,139 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from bitboard import BLACK
+from engine import board_from_fen, move_name
+from evaluation import Evaluator
+from search import Search
+from tablebase import Tablebase
+from transposition import TranspositionTable
+
+_analysis_search = None
+_analysis_limits = None
+
+
+def _init_analysis_worker(tt_mb, tablebase_path, weights_path, max_depth, time_limit):
+    global _analysis_search, _analysis_limits
+    tablebase = Tablebase(tablebase_path) if tablebase_path else None
+    evaluator = Evaluator(weights_path) if weights_path else None
+    _analysis_search = Search(TranspositionTable(tt_mb), tablebase, evaluator=evaluator)
+    _analysis_limits = (max_depth, time_limit)
+
+
+def analyze_position(search, text, max_depth=8, time_limit=None):
+    try:
+        board, side = board_from_fen(text)
+    except (ValueError, IndexError):
+        return {"fen": text, "error": "bad position"}
+    # Each position starts from a clear search, so results do not depend on
+    # how the input was chunked or where a run was resumed.
+    search.clear()
+    last = {}
+    search.on_iteration = last.update
+    try:
+        move = search.get_best_move(board, side, time_limit=time_limit, max_depth=max_depth)
+    finally:
+        search.on_iteration = None
+    # Scores are from the side to move, as in the engine protocol.  A book
+    # move or a position without moves has no searched score.
+    value = last.get("value")
+    if value is not None and side != BLACK:
+        value = -value
+    return {"fen": text, "move": move_name(move) if move else None, "score": value,
+            "depth": search.completed_depth, "nodes": search.nodes}
+
+
+def _analyze_chunk(chunk):
+    max_depth, time_limit = _analysis_limits
+    return [analyze_position(_analysis_search, text, max_depth, time_limit) for text in chunk]
+
+
+def read_positions(lines):
+    # One FEN per line; blank lines and "#" comments are not positions.
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def analyze(positions, workers=None, max_depth=8, time_limit=None, chunk_size=32, start=0, tt_mb=16,
+            tablebase=None, weights=None, max_pending=None):
+    # Yields one result per position, in input order, numbered from `start`.
+    # Positions are read lazily and at most `max_pending` chunks are queued
+    # in the pool, so memory stays bounded however long the input is.
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 4
+    positions = itertools.islice(positions, start, None)
+    index = start
+    with ProcessPoolExecutor(workers, initializer=_init_analysis_worker,
+                             initargs=(tt_mb, tablebase, weights, max_depth, time_limit)) as pool:
+        pending = deque()
+        while True:
+            while len(pending) < max_pending:
+                chunk = list(itertools.islice(positions, chunk_size))
+                if not chunk:
+                    break
+                pending.append(pool.submit(_analyze_chunk, chunk))
+            if not pending:
+                break
+            for result in pending.popleft().result():
+                yield dict(index=index, **result)
+                index += 1
+
+
+def completed_lines(path):
+    # The number of whole result lines already written.  A line cut short by
+    # an interrupted run is dropped so that it is analyzed again.
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    return data.count(b"\n", 0, end)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a stream of FEN positions on a pool of processes.")
+    parser.add_argument("input", nargs="?", default="-", help="file with one FEN per line (default: stdin)")
+    parser.add_argument("--output", help="JSONL results (default: stdout)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--depth", type=int, default=8)
+    parser.add_argument("--movetime", type=float, default=None, help="seconds per position")
+    parser.add_argument("--chunk-size", type=int, default=32, help="positions sent to a worker at a time")
+    parser.add_argument("--hash", type=int, default=16, help="transposition table MB per worker")
+    parser.add_argument("--tablebase")
+    parser.add_argument("--weights", help="tuned evaluation weights")
+    parser.add_argument("--start", type=int, default=0, help="skip this many positions of the input")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue after the results already in --output")
+    args = parser.parse_args(argv)
+
+    start = args.start
+    if args.resume:
+        if not args.output:
+            parser.error("--resume needs --output")
+        start += completed_lines(args.output)
+    source = sys.stdin if args.input == "-" else open(args.input)
+    output = open(args.output, "a" if args.resume else "w") if args.output else sys.stdout
+    try:
+        for result in analyze(read_positions(source), args.workers, args.depth, args.movetime, args.chunk_size,
+                              start, args.hash, args.tablebase, args.weights):
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,481 @@
+import argparse
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+
+from history import MoveHistory
+
+MAGIC = b"CKGA"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHH")
+TRAILER = struct.Struct("<QQ4s")
+LENGTH = struct.Struct("<I")
+GAME = struct.Struct("<BBBH")
+MOVE = struct.Struct("<H")
+OFFSET = struct.Struct("<Q")
+
+CUSTOM_START = 1
+BLACK_STARTS = 2
+BLACK_TO_MOVE = 4
+HAS_TAGS = 8
+
+RESULTS = (None, "white", "black", "draw")
+PDN_RESULTS = {"white": "1-0", "black": "0-1", "draw": "1/2-1/2", None: "*"}
+COLORS = ("white", "black")
+
+# A game is a dict in the same shape tournament.py writes: "moves" is a list
+# of [start_row, start_col, end_row, end_col] hops, or of whole paths
+# [row, col, row, col, row, col, ...] through every landing square of a
+# multi-jump (iter_hops reads both), and "result" is "white",
+# "black", "draw" or None.  "start" optionally holds Board.cells() for a
+# position other than the opening one, "start_turn"/"turn" name the side to
+# move before the first and after the last move, and "tags" carries PDN tags.
+
+
+def iter_hops(moves):
+    for move in moves:
+        for index in range(0, len(move) - 2, 2):
+            yield tuple(move[index:index + 4])
+
+
+def pack_cells(cells):
+    cells = bytes(cells)
+    if len(cells) % 2:
+        cells += b"\0"
+    return bytes(cells[i] | cells[i + 1] << 4 for i in range(0, len(cells), 2))
+
+
+def unpack_cells(data, count):
+    cells = bytearray()
+    for byte in data:
+        cells.append(byte & 15)
+        cells.append(byte >> 4)
+    return bytes(cells[:count])
+
+
+def encode_game(game):
+    size = game.get("size", 8)
+    flags = 0
+    body = b""
+    if game.get("start") is not None:
+        flags |= CUSTOM_START
+        body += pack_cells(game["start"])
+    if game.get("start_turn", "white") == "black":
+        flags |= BLACK_STARTS
+    if game.get("turn") == "black":
+        flags |= BLACK_TO_MOVE
+    if game.get("tags"):
+        flags |= HAS_TAGS
+        tags = "".join(f"{key}\t{value}\n" for key, value in game["tags"].items()).encode()
+        body += LENGTH.pack(len(tags)) + tags
+    moves = list(iter_hops(game["moves"]))
+    if len(moves) > 0xFFFF:
+        raise ValueError("Too many moves to encode")
+    # Each hop packs into 16 bits as four 4-bit coordinates.
+    packed = b"".join(MOVE.pack(r1 << 12 | c1 << 8 | r2 << 4 | c2) for r1, c1, r2, c2 in moves)
+    return GAME.pack(size, flags, RESULTS.index(game.get("result")), len(moves)) + body + packed
+
+
+def decode_game(data):
+    size, flags, result, count = GAME.unpack_from(data)
+    offset = GAME.size
+    game = {"size": size, "result": RESULTS[result],
+            "start_turn": "black" if flags & BLACK_STARTS else "white",
+            "turn": "black" if flags & BLACK_TO_MOVE else "white"}
+    if flags & CUSTOM_START:
+        length = (size * size + 1) // 2
+        game["start"] = unpack_cells(data[offset:offset + length], size * size)
+        offset += length
+    else:
+        game["start"] = None
+    if flags & HAS_TAGS:
+        (length,) = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+        lines = bytes(data[offset:offset + length]).decode().splitlines()
+        game["tags"] = dict(line.split("\t", 1) for line in lines)
+        offset += length
+    game["moves"] = [[value >> 12, value >> 8 & 15, value >> 4 & 15, value & 15]
+                     for (value,) in MOVE.iter_unpack(data[offset:offset + count * MOVE.size])]
+    return game
+
+
+def initial_cells(size=8):
+    return bytes(0 if (row + col) % 2 == 0 else 3 if row < size // 2 - 1 else 1 if row > size // 2 else 0
+                 for row in range(size) for col in range(size))
+
+
+def game_from_history(history, result=None, size=8, tags=None):
+    start = history.checkpoints[0]
+    return {"size": size, "start": None if start == initial_cells(size) else start, "start_turn": history.start_turn,
+            "turn": history.turn, "result": result, "moves": [list(move) for move in history.moves()],
+            "tags": tags or {}}
+
+
+def history_from_game(board, game):
+    # Rebuilds a MoveHistory on `board`.  The side making each move is the
+    # owner of the piece it moves, so only the final side to move is stored.
+    # A jump is continued by the next hop when that hop is another jump
+    # from its landing square, which only the same piece can make, unless
+    # the jump promoted.
+    board.set_cells(game["start"] if game.get("start") is not None else initial_cells(board.size))
+    history = MoveHistory(board, game.get("start_turn", "white"))
+    hops = list(iter_hops(game["moves"]))
+    for index, (r1, c1, r2, c2) in enumerate(hops):
+        piece = board.board[r1][c1]
+        if piece is None:
+            raise ValueError(f"No piece to move at ({r1}, {c1})")
+        if abs(r1 - r2) not in (1, 2) or abs(r1 - r2) != abs(c1 - c2):
+            # Board.make_move would move the piece without taking anything.
+            raise ValueError(f"Not a single step or jump: ({r1}, {c1}) to ({r2}, {c2})")
+        undo = board.make_move(r1, c1, r2, c2)
+        following = hops[index + 1] if index + 1 < len(hops) else None
+        continues = (abs(r1 - r2) == 2 and not undo[2] and following is not None
+                     and following[:2] == (r2, c2) and abs(following[0] - following[2]) == 2)
+        other = board.colors[1] if piece.color == board.colors[0] else board.colors[0]
+        history.record(board, undo, piece.color, piece.color if continues else other)
+    history.turn = game.get("turn") or history.turn
+    return history
+
+
+class ArchiveWriter:
+    # Records are appended as a length and an encoded game.  Closing the
+    # writer adds an offset index and a trailer pointing at it; appending to an
+    # existing archive drops that index and writes a new one on close.
+    def __init__(self, path, append=False):
+        self.path = path
+        self.offsets = []
+        if append and os.path.exists(path) and os.path.getsize(path) > HEADER.size:
+            with ArchiveReader(path) as reader:
+                self.offsets = list(reader.iter_offsets())
+                end = reader.data_end
+            self.file = open(path, "r+b")
+            self.file.truncate(end)
+            self.file.seek(end)
+        else:
+            self.file = open(path, "wb")
+            self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0))
+
+    def add(self, game):
+        data = encode_game(game)
+        self.offsets.append(self.file.tell())
+        self.file.write(LENGTH.pack(len(data)))
+        self.file.write(data)
+
+    def close(self):
+        if self.file is None:
+            return
+        index_offset = self.file.tell()
+        for offset in self.offsets:
+            self.file.write(OFFSET.pack(offset))
+        self.file.write(TRAILER.pack(index_offset, len(self.offsets), MAGIC))
+        self.file.close()
+        self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ArchiveReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _ = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a checkers game archive")
+        self.index_offset = None
+        self.count = None
+        self.data_end = len(self.data)
+        if len(self.data) >= HEADER.size + TRAILER.size:
+            index_offset, count, trailer_magic = TRAILER.unpack_from(self.data, len(self.data) - TRAILER.size)
+            if trailer_magic == MAGIC and index_offset + count * OFFSET.size + TRAILER.size == len(self.data):
+                self.index_offset, self.count, self.data_end = index_offset, count, index_offset
+        if self.count is None:
+            # A writer that never closed left no index; fall back to scanning.
+            self.offsets = list(self.scan_offsets())
+            self.count = len(self.offsets)
+        else:
+            self.offsets = None
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def scan_offsets(self):
+        offset = HEADER.size
+        while offset + LENGTH.size <= self.data_end:
+            (length,) = LENGTH.unpack_from(self.data, offset)
+            if offset + LENGTH.size + length > self.data_end:
+                break
+            yield offset
+            offset += LENGTH.size + length
+        self.data_end = offset
+
+    def iter_offsets(self):
+        if self.offsets is not None:
+            yield from self.offsets
+        else:
+            for index in range(self.count):
+                yield OFFSET.unpack_from(self.data, self.index_offset + index * OFFSET.size)[0]
+
+    def offset(self, index):
+        if not -self.count <= index < self.count:
+            raise IndexError("game index out of range")
+        index %= self.count
+        if self.offsets is not None:
+            return self.offsets[index]
+        return OFFSET.unpack_from(self.data, self.index_offset + index * OFFSET.size)[0]
+
+    def read(self, offset):
+        (length,) = LENGTH.unpack_from(self.data, offset)
+        start = offset + LENGTH.size
+        return decode_game(self.data[start:start + length])
+
+    def __getitem__(self, index):
+        return self.read(self.offset(index))
+
+    def __iter__(self):
+        for offset in self.iter_offsets():
+            yield self.read(offset)
+
+
+def iter_archive(path, chunk_size=1 << 20):
+    # Streams games front to back with buffered reads and never touches the
+    # index, so it also works on an archive that is still being written.
+    with open(path, "rb") as f:
+        magic, version, _ = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a checkers game archive")
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        if end >= HEADER.size + TRAILER.size:
+            f.seek(end - TRAILER.size)
+            index_offset, count, trailer_magic = TRAILER.unpack(f.read(TRAILER.size))
+            if trailer_magic == MAGIC and index_offset + count * OFFSET.size + TRAILER.size == end:
+                end = index_offset
+        f.seek(HEADER.size)
+        remaining = end - HEADER.size
+        buffer = b""
+        while True:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            buffer += chunk
+            offset = 0
+            while offset + LENGTH.size <= len(buffer):
+                (length,) = LENGTH.unpack_from(buffer, offset)
+                if offset + LENGTH.size + length > len(buffer):
+                    break
+                yield decode_game(buffer[offset + LENGTH.size:offset + LENGTH.size + length])
+                offset += LENGTH.size + length
+            buffer = buffer[offset:]
+
+
+def pdn_square(row, col, size=8):
+    return (row * size + col) // 2 + 1
+
+
+def pdn_coords(number, size=8):
+    index = number - 1
+    row = index // (size // 2)
+    return row, 2 * (index % (size // 2)) + 1 - row % 2
+
+
+def pdn_moves(game):
+    # Consecutive hops by the same piece are joined into one multi-jump.
+    size = game.get("size", 8)
+    tokens = []
+    path = []
+    for r1, c1, r2, c2 in iter_hops(game["moves"]):
+        capture = abs(r1 - r2) == 2
+        if path and path[-1][:2] == (r1, c1) and path[-1][2] and capture:
+            path.append((r2, c2, capture))
+            continue
+        if path:
+            tokens.append(path)
+        path = [(r1, c1, capture), (r2, c2, capture)]
+    if path:
+        tokens.append(path)
+    return ["x".join(str(pdn_square(r, c, size)) for r, c, _ in path) if path[1][2]
+            else "-".join(str(pdn_square(r, c, size)) for r, c, _ in path) for path in tokens]
+
+
+def write_pdn(games, f):
+    for game in games:
+        tags = dict(game.get("tags") or {})
+        for key in ("white", "black"):
+            if isinstance(game.get(key), str) and key.capitalize() not in tags:
+                tags[key.capitalize()] = game[key]
+        tags["Result"] = PDN_RESULTS[game.get("result")]
+        if game.get("start") is not None:
+            tags["FEN"] = fen(game["start"], game.get("start_turn", "white"), game.get("size", 8))
+        for key, value in tags.items():
+            f.write(f'[{key} "{value}"]\n')
+        words = []
+        for number, move in enumerate(pdn_moves(game)):
+            if number % 2 == 0:
+                words.append(f"{number // 2 + 1}.")
+            words.append(move)
+        words.append(tags["Result"])
+        line = ""
+        for word in words:
+            if len(line) + len(word) >= 80:
+                f.write(line.rstrip() + "\n")
+                line = ""
+            line += word + " "
+        f.write(line.rstrip() + "\n\n")
+
+
+def fen(cells, turn, size=8):
+    fields = [turn[0].upper()]
+    for color, codes in (("W", (1, 2)), ("B", (3, 4))):
+        squares = [("K" if cells[index] == codes[1] else "") + str(pdn_square(index // size, index % size, size))
+                   for index in range(size * size) if cells[index] in codes]
+        fields.append(color + ",".join(squares))
+    return ":".join(fields)
+
+
+def parse_fen(text, size=8):
+    cells = bytearray(size * size)
+    turn = "white"
+    for field in text.strip().rstrip(".").split(":"):
+        if field in ("W", "B"):
+            turn = COLORS[field == "B"]
+        elif field[:1] in ("W", "B"):
+            base = 1 if field[0] == "W" else 3
+            for square in filter(None, field[1:].split(",")):
+                king = square.startswith("K")
+                row, col = pdn_coords(int(square.lstrip("K")), size)
+                cells[row * size + col] = base + king
+        elif field:
+            raise ValueError(f"Bad FEN field: {field}")
+    return bytes(cells), turn
+
+
+TAG = re.compile(r'\[(\w+)\s+"([^"]*)"\]')
+MOVE_TOKEN = re.compile(r"^\d+(?:[-x]\d+)+$")
+
+
+def pdn_path(board, word, size=8):
+    # The legal move on `board` that a PDN move names, as a full path.  A
+    # multi-jump may be written by its end points alone ("22x6"), so the
+    # landing squares come from the move generator; a move that matches no
+    # legal move, or more than one, is rejected.
+    squares = [pdn_coords(int(number), size) for number in re.split("[-x]", word)]
+    row, col = squares[0]
+    piece = board.board[row][col] if 0 <= row < size and 0 <= col < size else None
+    if piece is None:
+        raise ValueError(f"No piece to move for {word}")
+    matches = [path for path in board.get_all_moves(piece.color)
+               if path[:2] == squares[0] and path[-2:] == squares[-1]
+               and (len(squares) == 2 or [path[index:index + 2] for index in range(0, len(path), 2)] == squares)]
+    if len(matches) != 1:
+        raise ValueError(f"{'Ambiguous' if matches else 'Illegal'} move {word}")
+    return matches[0]
+
+
+def read_pdn(f, size=8):
+    # engine imports this module, so Board is imported when it is needed.
+    from engine import Board
+
+    tags = {}
+    words = []
+
+    def finish():
+        result = {value: key for key, value in PDN_RESULTS.items()}.get(tags.get("Result", "*"))
+        game = {"size": size, "result": result, "start": None, "start_turn": "white", "tags": dict(tags),
+                "moves": []}
+        if "FEN" in tags:
+            game["start"], game["start_turn"] = parse_fen(tags["FEN"], size)
+        # The game is replayed so each move can be checked and expanded.
+        board = Board(size)
+        board.set_cells(game["start"] if game["start"] is not None else initial_cells(size))
+        for word in words:
+            path = pdn_path(board, word, size)
+            board.make_path(path)
+            game["moves"].extend(list(hop) for hop in iter_hops([path]))
+        return game
+
+    text = ""
+    for line in f:
+        line = line.strip()
+        if line.startswith("["):
+            if words:
+                yield finish()
+                tags, words = {}, []
+            match = TAG.match(line)
+            if match:
+                tags[match.group(1)] = match.group(2)
+            continue
+        text = re.sub(r"\{[^}]*\}", " ", text + " " + line)
+        if "{" in text:
+            continue
+        for word in text.split():
+            word = word.split(".")[-1]
+            if word in ("1-0", "0-1", "1/2-1/2", "*"):
+                if tags or words:
+                    tags.setdefault("Result", word)
+                    yield finish()
+                tags, words = {}, []
+            elif MOVE_TOKEN.match(word):
+                words.append(word)
+        text = ""
+    if tags or words:
+        yield finish()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert checkers games between JSONL, PDN and archive files.")
+    parser.add_argument("inputs", nargs="+", help=".jsonl, .pdn or .ckga files")
+    parser.add_argument("--output", required=True, help=".ckga archive or .pdn file")
+    parser.add_argument("--append", action="store_true")
+    args = parser.parse_args(argv)
+
+    def games():
+        for path in args.inputs:
+            if path.endswith(".ckga"):
+                yield from iter_archive(path)
+            elif path.endswith(".pdn"):
+                with open(path) as f:
+                    yield from read_pdn(f)
+            else:
+                with open(path) as f:
+                    for line in f:
+                        if line.strip():
+                            game = json.loads(line)
+                            if "moves" in game:
+                                yield game
+
+    count = 0
+    if args.output.endswith(".pdn"):
+        with open(args.output, "a" if args.append else "w") as f:
+            for game in games():
+                write_pdn([game], f)
+                count += 1
+    else:
+        with ArchiveWriter(args.output, args.append) as writer:
+            for game in games():
+                writer.add(game)
+                count += 1
+    print(f"Wrote {count} games to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+from archive import parse_fen
+from engine import Board, board_from_fen
+from search import Search
+from variants import VARIANTS, VariantBoard
+
+# Leaf counts under the current move rules (captures compulsory, a multi-jump
+# is one move, a side without moves has no children), agreed on by BitBoard
+# and the list-based Board.  The start position matches the published
+# American checkers perft.  Changing RULES_VERSION means recomputing these.
+PERFT_POSITIONS = [
+    ("start", "W:W21,22,23,24,25,26,27,28,29,30,31,32:B1,2,3,4,5,6,7,8,9,10,11,12",
+     [7, 49, 302, 1469, 7361, 36768, 179740, 845931]),
+    ("middlegame", "W:W16,20,21,22,25,26,27,28,29,30,32:B1,2,3,4,5,6,7,8,9,19",
+     [9, 55, 288, 1718, 8780, 46943, 235242, 1187639]),
+    ("kings", "W:WK10,K14,19,22,27:BK23,1,2,5,6,12",
+     [1, 1, 5, 29, 147, 848, 3778, 20026, 91405, 483591]),
+    ("endgame", "B:WK5,K31,28:BK18,K26,3",
+     [9, 24, 143, 689, 4555, 24430, 161616, 900368]),
+]
+
+# Start-position perft for VariantBoard.  The American and international
+# counts match the published ones.  Brazilian is international rules on
+# 8x8, which separates the cost of the rules from the cost of board size.
+VARIANT_PERFT = [
+    ("american", [7, 49, 302, 1469, 7361, 36768, 179740, 845931]),
+    ("brazilian", [7, 49, 302, 1469, 7473, 37628, 187302]),
+    ("international", [9, 81, 658, 4265, 27117, 167140, 1049442]),
+    ("canadian", [11, 121, 1222, 10053, 79049]),
+]
+
+SEARCH_POSITIONS = [
+    ("start", "W:W21,22,23,24,25,26,27,28,29,30,31,32:B1,2,3,4,5,6,7,8,9,10,11,12", 12),
+    ("middlegame", "W:W16,20,21,22,25,26,27,28,29,30,32:B1,2,3,4,5,6,7,8,9,19", 11),
+    ("kings", "W:WK10,K14,19,22,27:BK23,1,2,5,6,12", 10),
+]
+
+
+def perft(board, side, depth):
+    if depth == 0:
+        return 1
+    moves = board.get_all_moves(side)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        undo = board.make_move(move)
+        nodes += perft(board, 1 - side, depth - 1)
+        board.unmake_move(undo)
+    return nodes
+
+
+def board_perft(board, color, depth):
+    # The same count through the list-of-lists Board, which exercises
+    # get_all_moves/get_capture_paths and make_path/unmake_path there.
+    if depth == 0:
+        return 1
+    moves = board.get_all_moves(color)
+    if depth == 1:
+        return len(moves)
+    other = board.colors[1] if color == board.colors[0] else board.colors[0]
+    nodes = 0
+    for move in moves:
+        undos = board.make_path(move)
+        nodes += board_perft(board, other, depth - 1)
+        board.unmake_path(undos)
+    return nodes
+
+
+def timed(function, repeat):
+    # Best of `repeat` runs, which is far less noisy than a single one.
+    best = None
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - started
+        if best is None or seconds < best[1]:
+            best = (result, seconds)
+    return best
+
+
+def run_perft(max_depth=None, legacy_depth=0, repeat=3):
+    results = []
+    for name, text, expected in PERFT_POSITIONS:
+        board, side = board_from_fen(text)
+        depth = len(expected) if max_depth is None else min(max_depth, len(expected))
+        nodes, seconds = timed(lambda: perft(board, side, depth), repeat)
+        result = {"position": name, "depth": depth, "nodes": nodes, "expected": expected[depth - 1],
+                  "ok": nodes == expected[depth - 1], "seconds": round(seconds, 4),
+                  "nps": round(nodes / seconds) if seconds else 0}
+        if legacy_depth:
+            legacy = Board()
+            cells, turn = parse_fen(text)
+            legacy.set_cells(cells)
+            depth = min(legacy_depth, len(expected))
+            nodes, seconds = timed(lambda: board_perft(legacy, turn, depth), repeat)
+            result["legacy"] = {"depth": depth, "nodes": nodes, "ok": nodes == expected[depth - 1],
+                                "seconds": round(seconds, 4), "nps": round(nodes / seconds) if seconds else 0}
+            result["ok"] = result["ok"] and result["legacy"]["ok"]
+        results.append(result)
+    return results
+
+
+def run_search(depth_offset=0, repeat=3):
+    results = []
+    for name, text, depth in SEARCH_POSITIONS:
+        board, side = board_from_fen(text)
+        depth = max(1, depth + depth_offset)
+
+        def deepen():
+            # Time-to-depth: searches to each depth in turn share the
+            # transposition table the way iterative deepening would.
+            search = Search()
+            times = []
+            nodes = 0
+            started = time.perf_counter()
+            for target in range(1, depth + 1):
+                move = search.get_best_move(board, side, max_depth=target)
+                nodes += search.nodes
+                times.append(round(time.perf_counter() - started, 4))
+            return move, nodes, times
+
+        (move, nodes, times), seconds = timed(deepen, repeat)
+        results.append({"position": name, "depth": depth, "nodes": nodes, "seconds": round(seconds, 4),
+                        "nps": round(nodes / seconds) if seconds else 0, "time_to_depth": times,
+                        "best_move": list(move[:2]) if move else None})
+    return results
+
+
+def sample_positions(variant, count, seed=1):
+    # Positions from random games, a few of each game, for timing move
+    # generation away from the opening.
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = VariantBoard(variant)
+        side = 0
+        for ply in range(rng.randrange(10, 120)):
+            moves = board.get_all_moves(side)
+            if not moves:
+                break
+            if ply % 7 == 0:
+                positions.append((board.copy(), side))
+            board.make_move(rng.choice(moves))
+            side = 1 - side
+    return positions[:count]
+
+
+def run_variants(max_depth=5, positions=500, repeat=3):
+    # Move generation through the per-size tables: perft from the start and
+    # the time to generate the moves of sampled positions.  The cost per
+    # square should stay roughly flat as the board grows.
+    results = []
+    for name, expected in VARIANT_PERFT:
+        squares = VARIANTS[name].size ** 2 // 2
+        board = VariantBoard(name)
+        depth = min(max_depth, len(expected))
+        nodes, seconds = timed(lambda: perft(board, 0, depth), repeat)
+        sample = sample_positions(name, positions)
+        generated, generation_seconds = timed(lambda: sum(len(position.get_all_moves(side))
+                                                          for position, side in sample), repeat)
+        per_position = generation_seconds / len(sample)
+        results.append({"position": name, "squares": squares, "depth": depth, "nodes": nodes,
+                        "expected": expected[depth - 1], "ok": nodes == expected[depth - 1],
+                        "seconds": round(seconds, 4), "nps": round(nodes / seconds) if seconds else 0,
+                        "generation_us": round(per_position * 1e6, 2),
+                        "generation_us_per_square": round(per_position * 1e6 / squares, 3),
+                        "moves_per_position": round(generated / len(sample), 1)})
+    return results
+
+
+def run(max_perft_depth=None, legacy_depth=0, depth_offset=0, repeat=3, variant_depth=5):
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "perft": run_perft(max_perft_depth, legacy_depth, repeat),
+        "search": run_search(depth_offset, repeat),
+        "variants": run_variants(variant_depth, repeat=repeat) if variant_depth else [],
+    }
+
+
+def compare(results, baseline, threshold=0.10):
+    # Returns a list of regressions: wrong perft counts, and throughput more
+    # than `threshold` below the baseline for the same position and depth.
+    problems = []
+    for result in results["perft"] + results.get("variants", []):
+        if not result["ok"]:
+            problems.append(f"perft {result['position']}: {result['nodes']} nodes, expected {result['expected']}")
+    for section in ("perft", "search", "variants"):
+        previous = {(entry["position"], entry["depth"]): entry for entry in baseline.get(section, [])}
+        for result in results.get(section, []):
+            old = previous.get((result["position"], result["depth"]))
+            if old is None or not old.get("nps"):
+                continue
+            ratio = result["nps"] / old["nps"]
+            if ratio < 1 - threshold:
+                problems.append(f"{section} {result['position']}: {result['nps']} nodes/s is "
+                                f"{(1 - ratio) * 100:.1f}% below baseline {old['nps']}")
+    return problems
+
+
+def format_results(results):
+    lines = []
+    for result in results["perft"]:
+        line = (f"perft {result['position']:<11} depth {result['depth']}: {result['nodes']:>9} nodes "
+                f"{result['seconds']:>8.3f}s {result['nps']:>9} n/s {'ok' if result['ok'] else 'MISMATCH'}")
+        if "legacy" in result:
+            line += f"  (Board depth {result['legacy']['depth']}: {result['legacy']['nps']} n/s)"
+        lines.append(line)
+    for result in results["search"]:
+        lines.append(f"search {result['position']:<10} depth {result['depth']}: {result['nodes']:>9} nodes "
+                     f"{result['seconds']:>8.3f}s {result['nps']:>9} n/s  time to depth "
+                     + " ".join(f"{seconds:.2f}" for seconds in result["time_to_depth"]))
+    for result in results.get("variants", []):
+        lines.append(f"variant {result['position']:<13} {result['squares']} squares, perft {result['depth']}: "
+                     f"{result['nodes']:>8} nodes {result['nps']:>8} n/s {'ok' if result['ok'] else 'MISMATCH'}; "
+                     f"movegen {result['generation_us']:.1f} us/position, "
+                     f"{result['generation_us_per_square']:.3f} us/square")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft and search benchmarks with baseline comparison.")
+    parser.add_argument("--perft-depth", type=int, default=None, help="cap on perft depth (default: deepest known)")
+    parser.add_argument("--legacy-depth", type=int, default=0, help="also run perft through engine.Board to this depth")
+    parser.add_argument("--depth-offset", type=int, default=0, help="added to each search benchmark depth")
+    parser.add_argument("--variant-depth", type=int, default=5, help="perft depth for the board variants (0 to skip)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark; the fastest is reported")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed fractional drop in nodes/s")
+    args = parser.parse_args(argv)
+
+    results = run(args.perft_depth, args.legacy_depth, args.depth_offset, args.repeat, args.variant_depth)
+    print(format_results(results))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    problems = [f"perft {result['position']}: {result['nodes']} nodes, expected {result['expected']}"
+                for result in results["perft"] + results["variants"] if not result["ok"]]
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(results, json.load(f), args.threshold)
+    for problem in problems:
+        print(f"REGRESSION: {problem}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,374 @@
+import random
+
+WHITE = 0
+BLACK = 1
+
+# Bumped whenever move generation changes which moves are legal, so files
+# derived from search results (tablebases, books) can be rejected.
+RULES_VERSION = 2
+
+# The 32 playable squares are numbered row by row from the top-left, four per
+# row, so square = row * 4 + col // 2.  Black starts on rows 0-2 and moves
+# down, white starts on rows 5-7 and moves up, as on Board.
+FULL = 0xFFFFFFFF
+EVEN_ROWS = 0x0F0F0F0F
+ODD_ROWS = 0xF0F0F0F0
+LEFT_EDGE = 0x10101010
+RIGHT_EDGE = 0x08080808
+TOP_ROW = 0x0000000F
+BOTTOM_ROW = 0xF0000000
+EVEN_NOT_RIGHT = EVEN_ROWS & ~RIGHT_EDGE
+ODD_NOT_LEFT = ODD_ROWS & ~LEFT_EDGE
+
+UP_LEFT = 0
+UP_RIGHT = 1
+DOWN_LEFT = 2
+DOWN_RIGHT = 3
+OPPOSITE = (DOWN_RIGHT, DOWN_LEFT, UP_RIGHT, UP_LEFT)
+FORWARD = ((UP_LEFT, UP_RIGHT), (DOWN_LEFT, DOWN_RIGHT))
+
+
+# The shifts only use masks and shifts, so they work on NumPy integer arrays
+# as well as on ints.
+def shift_up_left(bits):
+    return ((bits & EVEN_ROWS) >> 4) | ((bits & ODD_NOT_LEFT) >> 5)
+
+
+def shift_up_right(bits):
+    return ((bits & EVEN_NOT_RIGHT) >> 3) | ((bits & ODD_ROWS) >> 4)
+
+
+def shift_down_left(bits):
+    return (((bits & EVEN_ROWS) << 4) | ((bits & ODD_NOT_LEFT) << 3)) & FULL
+
+
+def shift_down_right(bits):
+    return (((bits & EVEN_NOT_RIGHT) << 5) | ((bits & ODD_ROWS) << 4)) & FULL
+
+
+SHIFTS = (shift_up_left, shift_up_right, shift_down_left, shift_down_right)
+
+# STEP[direction][square] is the neighbouring square in that direction, or -1.
+STEP = tuple(
+    tuple((shift(1 << sq).bit_length() - 1) for sq in range(32))
+    for shift in SHIFTS
+)
+
+
+# Zobrist keys are drawn from a fixed seed so position keys are stable
+# across processes and runs.
+_zobrist_random = random.Random(0x5EED)
+ZOBRIST = tuple(
+    tuple(_zobrist_random.getrandbits(64) for _ in range(32))
+    for _ in range(4)
+)
+ZOBRIST_SIDE = _zobrist_random.getrandbits(64)
+
+
+def square_index(row, col):
+    if not (0 <= row < 8 and 0 <= col < 8) or (row + col) % 2 == 0:
+        raise ValueError(f"({row}, {col}) is not a playable square")
+    return row * 4 + col // 2
+
+
+def square_coords(square):
+    row = square >> 2
+    return row, 2 * (square & 3) + 1 - (row & 1)
+
+
+def iter_bits(bits):
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class BitBoard:
+    __slots__ = ("white", "black", "kings", "key")
+
+    def __init__(self, white=0xFFF00000, black=0x00000FFF, kings=0):
+        self.white = white
+        self.black = black
+        self.kings = kings
+        self.key = self.compute_key()
+
+    @classmethod
+    def from_board(cls, board):
+        if board.size != 8:
+            raise ValueError("Bitboard positions require an 8x8 board")
+        white = black = kings = 0
+        for row in range(8):
+            for col in range(8):
+                piece = board.board[row][col]
+                if piece is None:
+                    continue
+                bit = 1 << square_index(row, col)
+                if piece.color == board.colors[0]:
+                    white |= bit
+                else:
+                    black |= bit
+                if piece.king:
+                    kings |= bit
+        return cls(white, black, kings)
+
+    @classmethod
+    def from_cells(cls, cells):
+        # Board.cells() layout: one byte per square of the 8x8 board.
+        white = black = kings = 0
+        for index, code in enumerate(cells):
+            if code:
+                bit = 1 << square_index(index // 8, index % 8)
+                if code <= 2:
+                    white |= bit
+                else:
+                    black |= bit
+                if code in (2, 4):
+                    kings |= bit
+        return cls(white, black, kings)
+
+    def copy(self):
+        return BitBoard(self.white, self.black, self.kings)
+
+    def __eq__(self, other):
+        return (isinstance(other, BitBoard) and self.white == other.white
+                and self.black == other.black and self.kings == other.kings)
+
+    def __hash__(self):
+        return self.key
+
+    def compute_key(self):
+        key = 0
+        for kind, bits in enumerate((self.white & ~self.kings, self.white & self.kings,
+                                     self.black & ~self.kings, self.black & self.kings)):
+            keys = ZOBRIST[kind]
+            for square in iter_bits(bits):
+                key ^= keys[square]
+        return key
+
+    def side_key(self, side):
+        return self.key ^ ZOBRIST_SIDE if side == BLACK else self.key
+
+    def __repr__(self):
+        return f"BitBoard(white={self.white:#010x}, black={self.black:#010x}, kings={self.kings:#010x})"
+
+    def print_board(self):
+        print("  " + " ".join(str(i) for i in range(8)))
+        for row in range(8):
+            cells = []
+            for col in range(8):
+                if (row + col) % 2 == 0:
+                    cells.append(".")
+                    continue
+                bit = 1 << square_index(row, col)
+                if self.white & bit:
+                    cells.append("Kw" if self.kings & bit else "w")
+                elif self.black & bit:
+                    cells.append("Kb" if self.kings & bit else "b")
+                else:
+                    cells.append(".")
+            print(row, " ".join(cells))
+        print()
+
+    def sides(self, side):
+        if side == WHITE:
+            return self.white, self.black
+        return self.black, self.white
+
+    def get_all_moves(self, side):
+        # Captures are compulsory, so quiet moves are only generated when the
+        # side has none.  A capture is the whole jump sequence as one move.
+        captures = self.get_captures(side)
+        if captures:
+            return captures
+        own, opp = self.sides(side)
+        empty = ~(self.white | self.black) & FULL
+        own_kings = own & self.kings
+        forward = FORWARD[side]
+        moves = []
+        for direction in range(4):
+            movers = own if direction in forward else own_kings
+            if not movers:
+                continue
+            back = STEP[OPPOSITE[direction]]
+            for to in iter_bits(SHIFTS[direction](movers) & empty):
+                moves.append((back[to], to, 0))
+        return moves
+
+    def get_captures(self, side):
+        # Most positions have no capture, and this runs at every quiescence
+        # leaf, so the test for one is written out with the shifts inline.
+        # Two steps in one direction is a plain shift (9 or 7 squares), which
+        # takes a landing square straight back to its jumper.
+        own, opp = self.sides(side)
+        empty = ~(self.white | self.black) & FULL
+        if side == WHITE:
+            up, down = own, own & self.kings
+        else:
+            up, down = own & self.kings, own
+        jumpers = 0
+        if up:
+            targets = (((up & EVEN_ROWS) >> 4) | ((up & ODD_NOT_LEFT) >> 5)) & opp
+            if targets:
+                jumpers |= ((((targets & EVEN_ROWS) >> 4) | ((targets & ODD_NOT_LEFT) >> 5)) & empty) << 9
+            targets = (((up & EVEN_NOT_RIGHT) >> 3) | ((up & ODD_ROWS) >> 4)) & opp
+            if targets:
+                jumpers |= ((((targets & EVEN_NOT_RIGHT) >> 3) | ((targets & ODD_ROWS) >> 4)) & empty) << 7
+        if down:
+            targets = (((down & EVEN_ROWS) << 4) | ((down & ODD_NOT_LEFT) << 3)) & opp
+            if targets:
+                jumpers |= ((((targets & EVEN_ROWS) << 4) | ((targets & ODD_NOT_LEFT) << 3)) & empty) >> 7
+            targets = (((down & EVEN_NOT_RIGHT) << 5) | ((down & ODD_ROWS) << 4)) & opp
+            if targets:
+                jumpers |= ((((targets & EVEN_NOT_RIGHT) << 5) | ((targets & ODD_ROWS) << 4)) & empty) >> 9
+        if not jumpers:
+            return []
+        promotion_row = TOP_ROW if side == WHITE else BOTTOM_ROW
+        own_kings = own & self.kings
+        forward = FORWARD[side]
+        moves = []
+        for frm in iter_bits(jumpers):
+            king = own_kings >> frm & 1
+            self.extend_jumps(frm, frm, 0, empty | 1 << frm, opp, range(4) if king else forward,
+                              0 if king else promotion_row, moves)
+        return moves
+
+    def extend_jumps(self, frm, square, captured, empty, opp, directions, promotion_row, moves):
+        # Depth-first over jump sequences.  Jumped pieces stay on the board
+        # until the move ends, so none can be jumped twice, and a man that
+        # reaches the far row is crowned and stops.
+        extended = False
+        for direction in directions:
+            middle = STEP[direction][square]
+            if middle < 0 or not opp >> middle & 1 or captured >> middle & 1:
+                continue
+            to = STEP[direction][middle]
+            if to < 0 or not empty >> to & 1:
+                continue
+            extended = True
+            if 1 << to & promotion_row:
+                move = (frm, to, captured | 1 << middle)
+                if move not in moves:
+                    moves.append(move)
+            else:
+                self.extend_jumps(frm, to, captured | 1 << middle, empty, opp, directions, promotion_row, moves)
+        if not extended and captured:
+            move = (frm, square, captured)
+            # A king can go round a ring of pieces either way; that is the
+            # same move.
+            if move not in moves:
+                moves.append(move)
+
+    def move_path(self, move):
+        # The squares a move passes through, from its start to its end, in
+        # the position before it is made.  A move only records its end
+        # points and the pieces it takes, so the jumps are found again: each
+        # one must take one of those pieces.
+        frm, to, captured = move
+        if not captured:
+            return [frm, to]
+        side = WHITE if self.white >> frm & 1 else BLACK
+        directions = range(4) if self.kings >> frm & 1 else FORWARD[side]
+        empty = ~(self.white | self.black) & FULL | 1 << frm
+
+        def extend(square, remaining, path):
+            if not remaining:
+                return path if square == to else None
+            for direction in directions:
+                middle = STEP[direction][square]
+                if middle < 0 or not remaining >> middle & 1:
+                    continue
+                landing = STEP[direction][middle]
+                if landing < 0 or not empty >> landing & 1:
+                    continue
+                found = extend(landing, remaining ^ 1 << middle, path + [landing])
+                if found is not None:
+                    return found
+            return None
+
+        path = extend(frm, captured, [frm])
+        if path is None:
+            raise ValueError(f"Not a legal capture: {move}")
+        return path
+
+    def has_moves(self, side):
+        own, opp = self.sides(side)
+        empty = ~(self.white | self.black) & FULL
+        own_kings = own & self.kings
+        forward = FORWARD[side]
+        for direction in range(4):
+            movers = own if direction in forward else own_kings
+            if not movers:
+                continue
+            shift = SHIFTS[direction]
+            if shift(movers) & empty or shift(shift(movers) & opp) & empty:
+                return True
+        return False
+
+    def make_move(self, move):
+        frm, to, captured = move
+        from_bit = 1 << frm
+        to_bit = 1 << to
+        moved = from_bit ^ to_bit
+        key = self.key
+        if self.white & from_bit:
+            self.white ^= moved
+            self.black ^= captured
+            mover = 0
+            promotion_row = TOP_ROW
+        else:
+            self.black ^= moved
+            self.white ^= captured
+            mover = 2
+            promotion_row = BOTTOM_ROW
+        captured_kings = self.kings & captured
+        promoted = 0
+        if self.kings & from_bit:
+            self.kings ^= moved
+            keys = ZOBRIST[mover + 1]
+            new_key = key ^ keys[frm] ^ keys[to]
+        else:
+            promoted = to_bit & promotion_row
+            self.kings |= promoted
+            new_key = key ^ ZOBRIST[mover][frm] ^ ZOBRIST[mover + (1 if promoted else 0)][to]
+        for square in iter_bits(captured):
+            new_key ^= ZOBRIST[2 - mover + (1 if captured_kings >> square & 1 else 0)][square]
+        self.kings ^= captured_kings
+        self.key = new_key
+        return move, captured_kings, promoted, key
+
+    def unmake_move(self, undo):
+        (frm, to, captured), captured_kings, promoted, self.key = undo
+        from_bit = 1 << frm
+        to_bit = 1 << to
+        moved = from_bit ^ to_bit
+        self.kings ^= promoted | captured_kings
+        if self.kings & to_bit:
+            self.kings ^= moved
+        if self.white & to_bit:
+            self.white ^= moved
+            self.black ^= captured
+        else:
+            self.black ^= moved
+            self.white ^= captured
+
+    def apply_move(self, move):
+        board = self.copy()
+        board.make_move(move)
+        return board
+
+    def get_winner(self):
+        if not self.white:
+            return BLACK
+        if not self.black:
+            return WHITE
+        if not self.has_moves(WHITE):
+            return BLACK
+        if not self.has_moves(BLACK):
+            return WHITE
+        return None
+
+    def evaluate(self):
+        white_kings = self.white & self.kings
+        black_kings = self.black & self.kings
+        return (self.black.bit_count() + 2 * black_kings.bit_count()
+                - self.white.bit_count() - 2 * white_kings.bit_count())
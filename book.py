@@ -0,0 +1,155 @@
+import argparse
+import json
+import mmap
+import struct
+import sys
+
+from bitboard import BitBoard, WHITE, BLACK, RULES_VERSION, square_index
+
+MAGIC = b"CKBK"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<4sHHI")
+# Position key, then the move (from, to, captured mask) and its game counts.
+# The captured mask is part of the move: two captures can share their end
+# points and take different pieces.
+RECORD = struct.Struct("<QBBIIII")
+
+
+def find_move(board, side, path):
+    # `path` is a move as game records hold it: [row, col, row, col, ...]
+    # through every landing square, so the pieces a jump takes are known
+    # even when two multi-jumps share their end points.
+    frm, to = square_index(path[0], path[1]), square_index(path[-2], path[-1])
+    captured = 0
+    for index in range(0, len(path) - 2, 2):
+        if abs(path[index] - path[index + 2]) == 2:
+            captured |= 1 << square_index((path[index] + path[index + 2]) // 2,
+                                          (path[index + 1] + path[index + 3]) // 2)
+    for move in board.get_all_moves(side):
+        if move[0] == frm and move[1] == to and move[2] == captured:
+            return move
+    return None
+
+
+class BookBuilder:
+    def __init__(self, max_plies=16):
+        self.max_plies = max_plies
+        self.positions = {}
+
+    def add_game(self, moves, result):
+        board = BitBoard()
+        for path in moves[:self.max_plies]:
+            bit = 1 << square_index(path[0], path[1])
+            if board.white & bit:
+                side = WHITE
+            elif board.black & bit:
+                side = BLACK
+            else:
+                raise ValueError(f"No piece to move at ({path[0]}, {path[1]})")
+            move = find_move(board, side, path)
+            if move is None:
+                raise ValueError(f"Illegal move in game record: {list(path)}")
+            stats = self.positions.setdefault(board.side_key(side), {}).setdefault(move, [0, 0, 0])
+            stats[0] += 1
+            if result == "draw":
+                stats[2] += 1
+            elif result == ("white", "black")[side]:
+                stats[1] += 1
+            board.make_move(move)
+
+    def add_records(self, lines):
+        for line in lines:
+            if line.strip():
+                game = json.loads(line)
+                if "moves" in game:
+                    self.add_game(game["moves"], game["result"])
+
+    def write(self, path, min_games=1):
+        records = []
+        for key, moves in self.positions.items():
+            for (frm, to, captured), (games, wins, draws) in moves.items():
+                if games >= min_games:
+                    records.append((key, frm, to, captured, games, wins, draws))
+        records.sort()
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, RULES_VERSION, len(records)))
+            for record in records:
+                f.write(RECORD.pack(*record))
+        return len(records)
+
+
+class OpeningBook:
+    def __init__(self, path, min_games=1, rng=None):
+        self.path = path
+        self.min_games = min_games
+        self.rng = rng
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, rules, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a checkers opening book")
+        if rules != RULES_VERSION:
+            self.close()
+            raise ValueError(f"{path} was built for different move rules")
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def entries(self, key):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if struct.unpack_from("<Q", self.data, HEADER.size + mid * RECORD.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        entries = []
+        while lo < self.count:
+            record = RECORD.unpack_from(self.data, HEADER.size + lo * RECORD.size)
+            if record[0] != key:
+                break
+            entries.append(record[1:])
+            lo += 1
+        return entries
+
+    def lookup(self, board, side, moves=None):
+        if moves is None:
+            moves = board.get_all_moves(side)
+        legal = set(moves)
+        candidates = [(tuple(move), games, wins, draws) for *move, games, wins, draws in self.entries(board.side_key(side))
+                      if games >= self.min_games and tuple(move) in legal]
+        if not candidates:
+            return None
+        if self.rng is not None:
+            move = self.rng.choices([entry[0] for entry in candidates], weights=[entry[1] for entry in candidates])[0]
+        else:
+            move = max(candidates, key=lambda entry: ((entry[2] + 0.5 * entry[3]) / entry[1], entry[1]))[0]
+        return move
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a checkers opening book from JSONL game records.")
+    parser.add_argument("inputs", nargs="+", help="JSONL files with 'moves' and 'result' per game, e.g. tournament output")
+    parser.add_argument("--output", default="opening.ckbk")
+    parser.add_argument("--max-plies", type=int, default=16)
+    parser.add_argument("--min-games", type=int, default=2)
+    args = parser.parse_args(argv)
+
+    builder = BookBuilder(args.max_plies)
+    for path in args.inputs:
+        with open(path) as f:
+            builder.add_records(f)
+    count = builder.write(args.output, args.min_games)
+    print(f"Wrote {count} book moves for {len(builder.positions)} positions to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+from bitboard import RULES_VERSION
+
+MAGIC = b"CKAC"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+RECORD = struct.Struct("<QBBIdB")
+# Rough size of one entry in the OrderedDict, used to turn max_mb into a
+# number of entries.
+ENTRY_BYTES = 256
+
+
+class AnalysisCache:
+    # Finished root searches keyed by position hash (side to move included):
+    # best move, score and completed depth.  Unlike the transposition table
+    # it survives from one get_best_move to the next, so a hint, the AI reply
+    # to the same position and a search after undo are answered at once when
+    # an earlier search went at least as deep.  Least recently used entries
+    # are evicted beyond max_mb.  Search mixes its evaluation weights and
+    # tablebase into the keys, so one file can serve several setups.
+    def __init__(self, max_mb=8, path=None):
+        self.capacity = max(1, max_mb * 1024 * 1024 // ENTRY_BYTES)
+        self.path = path
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, key, depth, moves):
+        # The cached move must still be legal, which guards against hash
+        # collisions.
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] >= depth and entry[0] in moves:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def store(self, key, move, value, depth):
+        # The file format holds 8x8 moves: squares 0-31 and a 32-bit mask.
+        if not (0 <= move[0] < 32 and 0 <= move[1] < 32 and 0 <= move[2] < 1 << 32):
+            raise ValueError(f"Only 8x8 moves can be cached: {move}")
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or depth >= entry[2]:
+                self.entries[key] = (move, value, depth)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def load(self, path):
+        for key, move, value, depth in read_records(path):
+            self.store(key, move, value, depth)
+
+    def save(self, path=None):
+        # Entries other processes saved since this cache was loaded are
+        # merged in, keeping the deeper search for a position, and the file
+        # is replaced in one step so readers never see half of it.
+        path = path or self.path
+        with self.lock:
+            merged = OrderedDict()
+            try:
+                for key, move, value, depth in read_records(path):
+                    merged[key] = (move, value, depth)
+            except FileNotFoundError:
+                pass
+            except ValueError:
+                # Written for other rules or damaged: start the file afresh.
+                merged.clear()
+            for key, entry in self.entries.items():
+                old = merged.pop(key, None)
+                merged[key] = entry if old is None or entry[2] >= old[2] else old
+        records = list(merged.items())[-self.capacity:]
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, RULES_VERSION, len(records)))
+            for key, (move, value, depth) in records:
+                f.write(RECORD.pack(key, move[0], move[1], move[2], value, depth))
+        os.replace(temp, path)
+        return len(records)
+
+
+def read_records(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is not a checkers analysis cache")
+    magic, version, rules, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != FORMAT_VERSION or len(data) < HEADER.size + count * RECORD.size:
+        raise ValueError(f"{path} is not a checkers analysis cache")
+    if rules != RULES_VERSION:
+        raise ValueError(f"{path} was written for different move rules")
+    for key, frm, to, captured, value, depth in RECORD.iter_unpack(data[HEADER.size:HEADER.size + count * RECORD.size]):
+        yield key, (frm, to, captured), value, depth
@@ -0,0 +1,629 @@
+import contextlib
+import sys
+import threading
+
+from archive import parse_fen
+from bitboard import BitBoard, WHITE, BLACK, RULES_VERSION, square_index, square_coords
+from book import OpeningBook
+from evaluation import Evaluator
+from search import Search, ParallelSearch, MAX_DEPTH
+from tablebase import Tablebase
+from transposition import TranspositionTable
+from variants import VARIANTS, VariantBoard
+
+# Everything a worker process or a headless tool needs lives here; nothing in
+# this module touches tkinter, so importing it is cheap and needs no display.
+
+ENGINE_NAME = "Checkers"
+
+
+class Piece:
+    def __init__(self, color):
+        self.color = color
+        self.king = False
+
+    def make_king(self):
+        self.king = True
+
+    def __repr__(self):
+        return f"{'K' if self.king else ''}{self.color[0]}"
+
+
+class Board:
+    def __init__(self, size=8, colors=("white", "black")):
+        self.size = size
+        self.colors = colors
+        self.board = self.create_board()
+        # Moves generated for the current position, by color.  Every change
+        # to the board clears it, so get_winner reuses the moves the caller
+        # already generated instead of scanning the board again.
+        self.move_cache = {}
+        self.recount()
+
+    def create_board(self):
+        board = [[None] * self.size for _ in range(self.size)]
+        for row in range(self.size // 2 - 1):
+            for col in range(self.size):
+                if (row + col) % 2 == 1:
+                    board[row][col] = Piece(self.colors[1])
+
+        for row in range(self.size // 2 + 1, self.size):
+            for col in range(self.size):
+                if (row + col) % 2 == 1:
+                    board[row][col] = Piece(self.colors[0])
+
+        return board
+
+    def recount(self):
+        self.move_cache.clear()
+        self.piece_counts = {color: 0 for color in self.colors}
+        self.king_counts = {color: 0 for color in self.colors}
+        for row in self.board:
+            for piece in row:
+                if piece:
+                    self.piece_counts[piece.color] = self.piece_counts.get(piece.color, 0) + 1
+                    if piece.king:
+                        self.king_counts[piece.color] = self.king_counts.get(piece.color, 0) + 1
+
+    def cells(self):
+        # One byte per square: 0 empty, 1/2 man/king of colors[0], 3/4 of colors[1].
+        return bytes(0 if piece is None else 1 + 2 * (piece.color == self.colors[1]) + piece.king
+                     for row in self.board for piece in row)
+
+    def set_cells(self, cells):
+        for index, code in enumerate(cells):
+            piece = None
+            if code:
+                piece = Piece(self.colors[(code - 1) // 2])
+                piece.king = (code - 1) % 2 == 1
+            self.board[index // self.size][index % self.size] = piece
+        self.recount()
+
+    def make_king(self, row, col):
+        piece = self.board[row][col]
+        if not piece.king:
+            piece.make_king()
+            self.king_counts[piece.color] = self.king_counts.get(piece.color, 0) + 1
+
+    def print_board(self):
+        print("  " + " ".join(str(i) for i in range(self.size)))
+        for i, row in enumerate(self.board):
+            print(i, " ".join([str(piece) if piece else '.' for piece in row]))
+        print()
+
+    def move_piece(self, start_row, start_col, end_row, end_col):
+        if self.board[start_row][start_col] is None:
+            raise ValueError("No piece at start position")
+        if self.board[end_row][end_col] is not None:
+            raise ValueError("End position already occupied")
+        
+        piece = self.board[start_row][start_col]
+        self.board[start_row][start_col] = None
+        self.board[end_row][end_col] = piece
+        self.move_cache.clear()
+
+        if (piece.color == self.colors[0] and end_row == 0) or (piece.color == self.colors[1] and end_row == self.size - 1):
+            self.make_king(end_row, end_col)
+
+    def capture_piece(self, start_row, start_col, end_row, end_col):
+        middle_row = (start_row + end_row) // 2
+        middle_col = (start_col + end_col) // 2
+        piece = self.board[middle_row][middle_col]
+        if piece is None:
+            raise ValueError("No piece to capture")
+        self.board[middle_row][middle_col] = None
+        self.move_cache.clear()
+        self.piece_counts[piece.color] -= 1
+        if piece.king:
+            self.king_counts[piece.color] -= 1
+
+    def valid_move(self, start_row, start_col, end_row, end_col):
+        if not (0 <= start_row < self.size and 0 <= start_col < self.size and 0 <= end_row < self.size and 0 <= end_col < self.size):
+            return False
+        if self.board[start_row][start_col] is None:
+            return False
+        if self.board[end_row][end_col] is not None:
+            return False
+        piece = self.board[start_row][start_col]
+        if piece.color == self.colors[0] and not piece.king and end_row >= start_row:
+            return False
+        if piece.color == self.colors[1] and not piece.king and end_row <= start_row:
+            return False
+        row_diff = abs(start_row - end_row)
+        col_diff = abs(start_col - end_col)
+        if row_diff == 1 and col_diff == 1:
+            return True
+        if row_diff == 2 and col_diff == 2:
+            middle_row = (start_row + end_row) // 2
+            middle_col = (start_col + end_col) // 2
+            if self.board[middle_row][middle_col] is None or self.board[middle_row][middle_col].color == piece.color:
+                return False
+            return True
+        return False
+
+    def perform_move(self, start_row, start_col, end_row, end_col):
+        if abs(start_row - end_row) == 2 and abs(start_col - end_col) == 2:
+            self.capture_piece(start_row, start_col, end_row, end_col)
+        self.move_piece(start_row, start_col, end_row, end_col)
+
+    def make_move(self, start_row, start_col, end_row, end_col):
+        piece = self.board[start_row][start_col]
+        was_king = piece.king if piece else False
+        captured = None
+        if abs(start_row - end_row) == 2 and abs(start_col - end_col) == 2:
+            middle_row = (start_row + end_row) // 2
+            middle_col = (start_col + end_col) // 2
+            captured = (middle_row, middle_col, self.board[middle_row][middle_col])
+        self.perform_move(start_row, start_col, end_row, end_col)
+        return (start_row, start_col, end_row, end_col), captured, piece.king and not was_king
+
+    def unmake_move(self, undo):
+        (start_row, start_col, end_row, end_col), captured, promoted = undo
+        piece = self.board[end_row][end_col]
+        self.board[end_row][end_col] = None
+        self.board[start_row][start_col] = piece
+        self.move_cache.clear()
+        if promoted:
+            piece.king = False
+            self.king_counts[piece.color] -= 1
+        if captured:
+            middle_row, middle_col, captured_piece = captured
+            self.board[middle_row][middle_col] = captured_piece
+            self.piece_counts[captured_piece.color] += 1
+            if captured_piece.king:
+                self.king_counts[captured_piece.color] += 1
+
+    def get_possible_moves(self, row, col):
+        piece = self.board[row][col]
+        if piece is None:
+            return []
+        directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+        moves = []
+        for dr, dc in directions:
+            new_row, new_col = row + dr, col + dc
+            if self.valid_move(row, col, new_row, new_col):
+                moves.append((new_row, new_col))
+        return moves
+
+    def get_possible_captures(self, row, col):
+        piece = self.board[row][col]
+        if piece is None:
+            return []
+        directions = [(-2, -2), (-2, 2), (2, -2), (2, 2)]
+        captures = []
+        for dr, dc in directions:
+            new_row, new_col = row + dr, col + dc
+            if self.valid_move(row, col, new_row, new_col):
+                captures.append((new_row, new_col))
+        return captures
+
+    def has_moves(self, color):
+        if color in self.move_cache:
+            return bool(self.move_cache[color])
+        for row in range(self.size):
+            for col in range(self.size):
+                if self.board[row][col] and self.board[row][col].color == color:
+                    if self.get_possible_moves(row, col) or self.get_possible_captures(row, col):
+                        return True
+        return False
+
+    def get_winner(self):
+        white_pieces = self.piece_counts.get(self.colors[0], 0)
+        black_pieces = self.piece_counts.get(self.colors[1], 0)
+        if white_pieces == 0:
+            return self.colors[1]
+        elif black_pieces == 0:
+            return self.colors[0]
+        elif not self.has_moves(self.colors[0]):
+            return self.colors[1]
+        elif not self.has_moves(self.colors[1]):
+            return self.colors[0]
+        return None
+
+    def evaluate(self):
+        white_pieces = self.piece_counts.get(self.colors[0], 0)
+        black_pieces = self.piece_counts.get(self.colors[1], 0)
+        white_kings = self.king_counts.get(self.colors[0], 0)
+        black_kings = self.king_counts.get(self.colors[1], 0)
+        return black_pieces + 2 * black_kings - (white_pieces + 2 * white_kings)
+
+    def get_capture_paths(self, row, col):
+        # Every complete jump sequence for the piece at (row, col), each as a
+        # flat (row, col, row, col, ...) path.
+        piece = self.board[row][col]
+        if piece is None:
+            return []
+        paths = []
+        self.extend_capture_path(piece, (row, col), [row, col], frozenset(), paths, set())
+        return paths
+
+    def extend_capture_path(self, piece, origin, path, captured, paths, seen):
+        # Jumped pieces stay on the board until the move ends, so none can be
+        # jumped twice, and a man that reaches the far row is crowned and stops.
+        row, col = path[-2], path[-1]
+        forward = -1 if piece.color == self.colors[0] else 1
+        last_row = 0 if piece.color == self.colors[0] else self.size - 1
+        extended = False
+        for dr, dc in ((-1, -1), (-1, 1), (1, -1), (1, 1)):
+            if not piece.king and dr != forward:
+                continue
+            middle_row, middle_col = row + dr, col + dc
+            end_row, end_col = row + 2 * dr, col + 2 * dc
+            if not (0 <= end_row < self.size and 0 <= end_col < self.size):
+                continue
+            middle = self.board[middle_row][middle_col]
+            if middle is None or middle.color == piece.color or (middle_row, middle_col) in captured:
+                continue
+            if self.board[end_row][end_col] is not None and (end_row, end_col) != origin:
+                continue
+            extended = True
+            step = path + [end_row, end_col]
+            step_captured = captured | {(middle_row, middle_col)}
+            if not piece.king and end_row == last_row:
+                self.add_capture_path(step, step_captured, paths, seen)
+            else:
+                self.extend_capture_path(piece, origin, step, step_captured, paths, seen)
+        if not extended and captured:
+            self.add_capture_path(path, captured, paths, seen)
+
+    def add_capture_path(self, path, captured, paths, seen):
+        # A king can go round a ring of pieces either way; that is one move.
+        key = (path[0], path[1], path[-2], path[-1], captured)
+        if key not in seen:
+            seen.add(key)
+            paths.append(tuple(path))
+
+    def get_all_moves(self, color):
+        # Captures are compulsory and each is a whole jump sequence, so a move
+        # is a flat path: (row, col, row, col) for a step or a single jump and
+        # longer for a multi-jump.  move_hops splits one into single hops.
+        cached = self.move_cache.get(color)
+        if cached is not None:
+            return list(cached)
+        captures = []
+        moves = []
+        for row in range(self.size):
+            for col in range(self.size):
+                if self.board[row][col] and self.board[row][col].color == color:
+                    captures.extend(self.get_capture_paths(row, col))
+                    if not captures:
+                        moves.extend([(row, col, end_row, end_col)
+                                      for end_row, end_col in self.get_possible_moves(row, col)])
+        self.move_cache[color] = captures or moves
+        return list(self.move_cache[color])
+
+    def make_path(self, move):
+        return [self.make_move(*hop) for hop in move_hops(move)]
+
+    def unmake_path(self, undos):
+        for undo in reversed(undos):
+            self.unmake_move(undo)
+
+    def find_move(self, color, move):
+        # The path on this board for a BitBoard move.
+        for path in self.get_all_moves(color):
+            if bitboard_move(path) == move:
+                return path
+        return None
+
+    def minimax(self, depth, maximizing_player, alpha, beta, tt=None):
+        return Search(tt).minimax(BitBoard.from_board(self), depth, maximizing_player, alpha, beta)
+
+    def get_best_move(self, color, difficulty=2, tt=None, time_limit=None, search=None):
+        if search is None:
+            search = Search(tt)
+        side = WHITE if color == self.colors[0] else BLACK
+        move = search.get_best_move(BitBoard.from_board(self), side, difficulty, time_limit)
+        if move is None:
+            return None
+        return self.find_move(color, move)
+
+
+def move_hops(move):
+    return [move[index:index + 4] for index in range(0, len(move) - 2, 2)]
+
+
+def bitboard_move(path):
+    captured = 0
+    for start_row, start_col, end_row, end_col in move_hops(path):
+        if abs(end_row - start_row) == 2:
+            captured |= 1 << square_index((start_row + end_row) // 2, (start_col + end_col) // 2)
+    return square_index(path[0], path[1]), square_index(path[-2], path[-1]), captured
+
+
+class MoveInput:
+    # Builds up a move hop by hop, the way the GUI and network peers enter
+    # multi-jumps.  The legal moves are fixed when the turn starts because
+    # the board changes under the later hops.
+    def __init__(self, board, color):
+        self.moves = board.get_all_moves(color)
+        self.path = ()
+
+    def add(self, start_row, start_col, end_row, end_col):
+        # Returns None for an illegal hop, otherwise whether the move is now
+        # complete.
+        if self.path and self.path[-2:] != (start_row, start_col):
+            return None
+        path = (self.path or (start_row, start_col)) + (end_row, end_col)
+        matches = [move for move in self.moves if move[:len(path)] == path]
+        if not matches:
+            return None
+        done = any(len(move) == len(path) for move in matches)
+        self.path = () if done else path
+        return done
+
+
+def start_board(variant="american"):
+    return BitBoard() if variant == "american" else VariantBoard(variant)
+
+
+def board_from_fen(text, variant="american"):
+    if variant == "american":
+        cells, turn = parse_fen(text)
+        board = BitBoard.from_cells(cells)
+    else:
+        cells, turn = parse_fen(text, VARIANTS[variant].size)
+        board = VariantBoard.from_cells(variant, cells)
+    return board, WHITE if turn == "white" else BLACK
+
+
+def move_name(move):
+    # PDN numbering: square n is board square n - 1, the playable squares
+    # counted row by row on any board size.
+    return f"{move[0] + 1}{'x' if move[2] else '-'}{move[1] + 1}"
+
+
+def board_geometry(board):
+    # (number of squares, square -> (row, col), (row, col) -> square).
+    tables = getattr(board, "tables", None)
+    if tables is None:
+        return 32, square_coords, square_index
+    return tables.squares, tables.coords.__getitem__, lambda row, col: tables.index[(row, col)]
+
+
+def parse_move(text, board, side):
+    # "22-17", "22x15" or a multi-jump given in full ("22x15x6") or by its
+    # end points ("22x6").
+    count, coords_of, index_of = board_geometry(board)
+    try:
+        squares = [int(square) - 1 for square in text.replace("x", "-").split("-")]
+    except ValueError:
+        raise ValueError(f"Bad move: {text}")
+    if len(squares) < 2 or not all(0 <= square < count for square in squares):
+        raise ValueError(f"Bad move: {text}")
+    coords = [coords_of(square) for square in squares]
+    hops = list(zip(coords, coords[1:]))
+    captured = None
+    if ((len(squares) > 2 or abs(coords[0][0] - coords[1][0]) == 2)
+            and all(abs(end[0] - start[0]) == abs(end[1] - start[1]) for start, end in hops)):
+        # The pieces taken are those between the ends of each hop; a flying
+        # king's hop may be longer than two squares.  The moving piece is
+        # not on its square any more once the move is under way.
+        occupied = (board.white | board.black) & ~(1 << squares[0])
+        captured = 0
+        for (start_row, start_col), (end_row, end_col) in hops:
+            row_step = 1 if end_row > start_row else -1
+            col_step = 1 if end_col > start_col else -1
+            for distance in range(1, abs(end_row - start_row)):
+                captured |= occupied & 1 << index_of(start_row + distance * row_step, start_col + distance * col_step)
+    for move in board.get_all_moves(side):
+        if move[0] == squares[0] and move[1] == squares[-1] and captured in (None, move[2]):
+            return move
+    raise ValueError(f"Illegal move: {text}")
+
+
+class EngineSession:
+    # A text engine protocol in the spirit of UCI.  Commands arrive one per
+    # line on stdin; replies go to stdout:
+    #
+    #   checkers                      -> id/option lines, then "checkersok"
+    #   isready                       -> readyok
+    #   setoption name <N> value <V>  Hash (MB), Threads, Tablebase, Book,
+    #                                 Weights (tuned evaluation file),
+    #                                 Variant (american, brazilian,
+    #                                 international or canadian)
+    #   newgame
+    #   position startpos|fen <FEN> [moves 22-17 11-15 ...]
+    #   go [depth N] [movetime MS] [wtime MS btime MS winc MS binc MS] [infinite]
+    #                                 -> info lines, then "bestmove 22-17"
+    #   stop                          ends a running search early
+    #   d                             prints the board
+    #   quit
+    def __init__(self, output=None):
+        self.output = output or sys.stdout
+        self.output_lock = threading.Lock()
+        self.options = {"Hash": 16, "Threads": 1, "Tablebase": "", "Book": "", "Weights": "",
+                        "Variant": "american"}
+        self.search = None
+        self.thread = None
+        self.set_position(start_board(self.options["Variant"]), WHITE, [])
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def create_search(self):
+        if self.options["Variant"] != "american":
+            # The tablebase, book, tuned evaluation and worker processes are
+            # all built for the 8x8 bitboard.
+            self.search = Search(TranspositionTable(int(self.options["Hash"])), on_iteration=self.report)
+            return self.search
+        tablebase = Tablebase(self.options["Tablebase"]) if self.options["Tablebase"] else None
+        book = OpeningBook(self.options["Book"]) if self.options["Book"] else None
+        evaluator = Evaluator(self.options["Weights"]) if self.options["Weights"] else None
+        tt = TranspositionTable(int(self.options["Hash"]))
+        threads = int(self.options["Threads"])
+        if threads > 1:
+            self.search = ParallelSearch(threads, tt, tablebase=tablebase, book=book, on_iteration=self.report,
+                                         evaluator=evaluator)
+        else:
+            self.search = Search(tt, tablebase, book, on_iteration=self.report, evaluator=evaluator)
+        return self.search
+
+    def drop_search(self):
+        if self.search is not None and hasattr(self.search, "close"):
+            self.search.close()
+        self.search = None
+
+    def set_position(self, board, side, moves):
+        self.board = board
+        self.side = side
+        for move in moves:
+            self.play(move)
+
+    def play(self, move):
+        self.board.make_move(move)
+        self.side = 1 - self.side
+
+    def report(self, iteration):
+        value = iteration["value"] if self.side == BLACK else -iteration["value"]
+        line = self.search.principal_variation(self.board, self.side, iteration["depth"])
+        pv = " ".join(move_name(move) for move in line) or move_name(iteration["move"])
+        self.send(f"info depth {iteration['depth']} score {value} nodes {iteration['total_nodes']} pv {pv}")
+
+    def handle(self, line):
+        # Returns False once the session should end.
+        words = line.split()
+        if not words:
+            return True
+        command, args = words[0], words[1:]
+        if command == "quit":
+            self.stop()
+            return False
+        if command == "checkers":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id rules {RULES_VERSION}")
+            for name, value in self.options.items():
+                self.send(f"option name {name} default {value}")
+            self.send("checkersok")
+        elif command == "isready":
+            self.wait()
+            self.send("readyok")
+        elif command == "setoption":
+            self.wait()
+            self.set_option(args)
+        elif command == "newgame":
+            self.wait()
+            self.drop_search()
+            self.set_position(start_board(self.options["Variant"]), WHITE, [])
+        elif command == "position":
+            self.wait()
+            self.position(args)
+        elif command == "go":
+            self.wait()
+            self.go(args)
+        elif command == "stop":
+            self.stop()
+        elif command == "d":
+            self.wait()
+            with self.output_lock, contextlib.redirect_stdout(self.output):
+                print(f"side {'white' if self.side == WHITE else 'black'}")
+                self.board.print_board()
+        else:
+            self.send(f"info string unknown command {command}")
+        return True
+
+    def set_option(self, args):
+        text = " ".join(args)
+        if not text.startswith("name ") or " value " not in text:
+            self.send("info string expected: setoption name <name> value <value>")
+            return
+        name, _, value = text[5:].partition(" value ")
+        if name not in self.options:
+            self.send(f"info string unknown option {name}")
+            return
+        if name == "Variant" and value not in VARIANTS:
+            self.send(f"info string unknown variant {value}")
+            return
+        changed = value != self.options[name]
+        self.options[name] = value
+        self.drop_search()
+        if name == "Variant" and changed:
+            self.set_position(start_board(value), WHITE, [])
+
+    def position(self, args):
+        if "moves" in args:
+            split = args.index("moves")
+            args, moves = args[:split], args[split + 1:]
+        else:
+            moves = []
+        try:
+            if args[:1] == ["startpos"]:
+                board, side = start_board(self.options["Variant"]), WHITE
+            elif args[:1] == ["fen"]:
+                board, side = board_from_fen(" ".join(args[1:]), self.options["Variant"])
+            else:
+                raise ValueError("expected startpos or fen")
+            self.set_position(board, side, [])
+            for text in moves:
+                self.play(parse_move(text, self.board, self.side))
+        except ValueError as e:
+            self.send(f"info string {e}")
+
+    def go(self, args):
+        limits = {}
+        index = 0
+        while index < len(args):
+            if args[index] == "infinite":
+                limits["infinite"] = True
+                index += 1
+            else:
+                try:
+                    limits[args[index]] = int(args[index + 1])
+                except (IndexError, ValueError):
+                    self.send(f"info string bad value for {args[index]}")
+                    return
+                index += 2
+        time_limit = limits["movetime"] / 1000 if "movetime" in limits else None
+        clock = limits.get("wtime" if self.side == WHITE else "btime")
+        if clock is not None:
+            increment = limits.get("winc" if self.side == WHITE else "binc", 0)
+            budget = (clock / 20 + increment) / 1000
+            time_limit = budget if time_limit is None else min(time_limit, budget)
+        max_depth = limits.get("depth")
+        if max_depth is None and (time_limit is None or limits.get("infinite")):
+            max_depth = MAX_DEPTH
+        search = self.search or self.create_search()
+        search.stop_requested = False
+        board = self.board.copy()
+        side = self.side
+        moves = board.get_all_moves(side)
+
+        def run():
+            move = search.get_best_move(board, side, time_limit=time_limit, max_depth=max_depth) if moves else None
+            if move is not None and move not in moves:
+                move = moves[0]
+            self.send(f"bestmove {move_name(move) if move else 'none'}")
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.search.stop()
+            self.wait()
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        self.stop()
+        self.drop_search()
+
+
+def main(stdin=None, stdout=None):
+    session = EngineSession(stdout)
+    try:
+        for line in stdin or sys.stdin:
+            if not session.handle(line):
+                break
+        session.wait()
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import argparse
+import hashlib
+import json
+import struct
+import sys
+
+from archive import iter_archive, iter_hops, read_pdn
+from bitboard import (BitBoard, WHITE, BLACK, FULL, TOP_ROW, BOTTOM_ROW, shift_up_left, shift_up_right,
+                      shift_down_left, shift_down_right, square_index)
+
+# Every feature is black's count minus white's, so a positive score favours
+# black, the maximizing side, just like BitBoard.evaluate.
+FEATURES = ("men", "kings", "advancement", "center", "back_rank", "mobility")
+DEFAULT_WEIGHTS = {"men": 1.0, "kings": 3.0, "advancement": 0.0, "center": 0.0, "back_rank": 0.0, "mobility": 0.0}
+
+ROWS = tuple(0xF << (4 * row) for row in range(8))
+# The eight squares of rows 2-5 that are not on the two outer files.
+CENTER = sum(1 << square_index(row, col) for row in range(2, 6) for col in range(2, 6) if (row + col) % 2)
+
+RESULT_VALUES = {"black": 1.0, "white": 0.0, "draw": 0.5}
+
+
+def compute_features(white, black, kings, count):
+    # `count` is a popcount, which lets the same code run on one position
+    # (ints) or on a batch (NumPy uint64 arrays).
+    empty = ~(white | black) & FULL
+    white_men = white & ~kings & FULL
+    black_men = black & ~kings & FULL
+    white_kings = white & kings
+    black_kings = black & kings
+    advancement = 0
+    for row in range(1, 7):
+        # Black men advance down the board from row 0, white men up from row 7.
+        advancement = advancement + row * count(black_men & ROWS[row]) - (7 - row) * count(white_men & ROWS[row])
+    mobility = (count(shift_down_left(black) & empty) + count(shift_down_right(black) & empty)
+                + count(shift_up_left(black_kings) & empty) + count(shift_up_right(black_kings) & empty)
+                - count(shift_up_left(white) & empty) - count(shift_up_right(white) & empty)
+                - count(shift_down_left(white_kings) & empty) - count(shift_down_right(white_kings) & empty))
+    return (count(black_men) - count(white_men),
+            count(black_kings) - count(white_kings),
+            advancement,
+            count(black & CENTER) - count(white & CENTER),
+            count(black_men & TOP_ROW) - count(white_men & BOTTOM_ROW),
+            mobility)
+
+
+def require_numpy():
+    # NumPy is imported on first use: the engine and its worker processes
+    # import this module and should not pay for it.
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Batch evaluation and tuning need NumPy (pip install numpy)")
+    return numpy
+
+
+def popcount(values):
+    np = require_numpy()
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values).astype(np.int64)
+    # Older NumPy: count the bits of each byte through a table.
+    table = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.int64)
+    return table[values.astype(np.uint64).view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def feature_matrix(white, black, kings):
+    # One row of FEATURES per position, from arrays of the three bitboards.
+    np = require_numpy()
+    white = np.asarray(white, dtype=np.uint64)
+    black = np.asarray(black, dtype=np.uint64)
+    kings = np.asarray(kings, dtype=np.uint64)
+    columns = compute_features(white, black, kings, popcount)
+    return np.stack([np.broadcast_to(column, white.shape) for column in columns], axis=1).astype(np.float64)
+
+
+class Evaluator:
+    # Linear evaluation over FEATURES.  The defaults reproduce the plain
+    # material count; tuned weights are loaded from the JSON file written by
+    # `python evaluation.py`.
+    def __init__(self, path=None, weights=None):
+        self.path = path
+        values = dict(DEFAULT_WEIGHTS)
+        if path is not None:
+            with open(path) as f:
+                data = json.load(f)
+            unknown = set(data["weights"]) - set(FEATURES)
+            if unknown:
+                raise ValueError(f"Unknown evaluation features in {path}: {', '.join(sorted(unknown))}")
+            values.update(data["weights"])
+        if weights is not None:
+            values.update(weights)
+        self.weights = tuple(float(values[name]) for name in FEATURES)
+
+    def fingerprint(self):
+        # Identifies the weights across processes and runs (unlike hash());
+        # the default weights score like BitBoard.evaluate and give 0.
+        if self.weights == tuple(float(DEFAULT_WEIGHTS[name]) for name in FEATURES):
+            return 0
+        digest = hashlib.blake2b(struct.pack(f"<{len(self.weights)}d", *self.weights), digest_size=8).digest()
+        return int.from_bytes(digest, "little")
+
+    def as_dict(self):
+        return dict(zip(FEATURES, self.weights))
+
+    def save(self, path, **info):
+        with open(path, "w") as f:
+            json.dump(dict(info, features=list(FEATURES), weights=self.as_dict()), f, indent=2)
+
+    def features(self, board):
+        return compute_features(board.white, board.black, board.kings, int.bit_count)
+
+    def evaluate(self, board):
+        return sum(weight * value for weight, value in zip(self.weights, self.features(board)))
+
+    def evaluate_batch(self, white, black, kings):
+        np = require_numpy()
+        return feature_matrix(white, black, kings) @ np.array(self.weights)
+
+
+def iter_games(paths):
+    # Tournament JSONL, game archives and PDN files.
+    for path in paths:
+        if path.endswith(".ckga"):
+            yield from iter_archive(path)
+        elif path.endswith(".pdn"):
+            with open(path) as f:
+                yield from read_pdn(f)
+        else:
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+def game_positions(game, skip_plies=8):
+    # Replays a game record and yields (white, black, kings) before each
+    # move.  Records list either whole paths (tournament output) or single
+    # hops (archives, PDN); hops are gathered until they make up a legal move.
+    # Positions where the side to move has a capture are skipped: their static
+    # value says little about the result.
+    if game.get("start") is not None:
+        board = BitBoard.from_cells(game["start"])
+        side = BLACK if game.get("start_turn") == "black" else WHITE
+    else:
+        board, side = BitBoard(), WHITE
+    ply = 0
+    start = None
+    for r1, c1, r2, c2 in iter_hops(game["moves"]):
+        if start is None:
+            if ply >= skip_plies and not board.get_captures(side):
+                yield board.white, board.black, board.kings
+            start = square_index(r1, c1)
+            captured = 0
+        if abs(r1 - r2) == 2:
+            captured |= 1 << square_index((r1 + r2) // 2, (c1 + c2) // 2)
+        to = square_index(r2, c2)
+        move = next((move for move in board.get_all_moves(side)
+                     if move[0] == start and move[1] == to and move[2] == captured), None)
+        if move is not None:
+            board.make_move(move)
+            side = 1 - side
+            ply += 1
+            start = None
+
+
+def iter_batches(paths, batch_size=65536, skip_plies=8):
+    # Streams (white, black, kings, result) arrays, batch_size positions at a
+    # time, so the record files never have to fit in memory.
+    require_numpy()
+    rows = []
+    for game in iter_games(paths):
+        result = RESULT_VALUES.get(game.get("result"))
+        if result is None:
+            continue
+        for position in game_positions(game, skip_plies):
+            rows.append(position + (result,))
+            if len(rows) == batch_size:
+                yield batch_arrays(rows)
+                rows = []
+    if rows:
+        yield batch_arrays(rows)
+
+
+def batch_arrays(rows):
+    np = require_numpy()
+    white, black, kings, results = zip(*rows)
+    return (np.array(white, dtype=np.uint64), np.array(black, dtype=np.uint64), np.array(kings, dtype=np.uint64),
+            np.array(results, dtype=np.float64))
+
+
+def logistic_loss(scores, results, scale):
+    np = require_numpy()
+    probabilities = 1 / (1 + np.exp(-scale * scores))
+    probabilities = np.clip(probabilities, 1e-12, 1 - 1e-12)
+    loss = -(results * np.log(probabilities) + (1 - results) * np.log(1 - probabilities))
+    return loss, probabilities
+
+
+def tune(paths, epochs=10, batch_size=65536, learning_rate=0.01, scale=1.0, l2=0.0, skip_plies=8,
+         evaluator=None, progress=None):
+    # Texel-style tuning: the predicted result of a position is
+    # sigmoid(scale * score) and the weights minimise the logistic loss
+    # against game outcomes.  Each epoch streams the records again and takes
+    # one Adam step per batch.
+    np = require_numpy()
+    weights = np.array((evaluator or Evaluator()).weights)
+    moment = np.zeros_like(weights)
+    velocity = np.zeros_like(weights)
+    beta1, beta2 = 0.9, 0.999
+    step = 0
+    history = []
+    for epoch in range(epochs):
+        total_loss = 0.0
+        positions = 0
+        for white, black, kings, results in iter_batches(paths, batch_size, skip_plies):
+            features = feature_matrix(white, black, kings)
+            loss, probabilities = logistic_loss(features @ weights, results, scale)
+            gradient = scale * features.T @ (probabilities - results) / len(results) + l2 * weights
+            step += 1
+            moment = beta1 * moment + (1 - beta1) * gradient
+            velocity = beta2 * velocity + (1 - beta2) * gradient * gradient
+            weights -= (learning_rate * (moment / (1 - beta1 ** step))
+                        / (np.sqrt(velocity / (1 - beta2 ** step)) + 1e-8))
+            total_loss += float(loss.sum())
+            positions += len(results)
+        if not positions:
+            raise ValueError("No positions with a known result in the game records")
+        history.append(total_loss / positions)
+        if progress is not None:
+            progress(epoch + 1, history[-1], positions)
+    return Evaluator(weights=dict(zip(FEATURES, weights.tolist()))), history
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit evaluation weights to game results (Texel tuning).")
+    parser.add_argument("inputs", nargs="+", help="tournament JSONL, .ckga archives or .pdn files")
+    parser.add_argument("--output", default="weights.json")
+    parser.add_argument("--initial", help="weights file to start from (default: material only)")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=65536)
+    parser.add_argument("--learning-rate", type=float, default=0.01)
+    parser.add_argument("--scale", type=float, default=1.0, help="score-to-probability scale of the sigmoid")
+    parser.add_argument("--l2", type=float, default=0.0)
+    parser.add_argument("--skip-plies", type=int, default=8, help="opening plies left out of the data")
+    args = parser.parse_args(argv)
+
+    evaluator, history = tune(args.inputs, args.epochs, args.batch_size, args.learning_rate, args.scale, args.l2,
+                              args.skip_plies, Evaluator(args.initial) if args.initial else None,
+                              progress=lambda epoch, loss, positions:
+                              print(f"epoch {epoch}: loss {loss:.5f} over {positions} positions", file=sys.stderr))
+    evaluator.save(args.output, scale=args.scale, loss=history[-1])
+    print(" ".join(f"{name}={weight:.4f}" for name, weight in evaluator.as_dict().items()))
+    print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
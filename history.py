@@ -0,0 +1,84 @@
+CHECKPOINT_INTERVAL = 16
+
+
+class MoveHistory:
+    # A game record kept as deltas.  Each entry is the undo record returned by
+    # Board.make_move (the move, the captured piece if any and whether the
+    # mover was promoted) together with the side that made it, and every
+    # `checkpoint_interval` plies the board is stored as one byte per square so
+    # any ply can be rebuilt by replaying at most that many moves.  A
+    # multi-jump is recorded hop by hop; a move ends where the turn passes,
+    # and `starts` holds the entry each move begins at so undo can take back
+    # the whole move.
+    def __init__(self, board, turn, checkpoint_interval=CHECKPOINT_INTERVAL):
+        self.start_turn = turn
+        self.turn = turn
+        self.checkpoint_interval = checkpoint_interval
+        self.entries = []
+        self.starts = []
+        self.checkpoints = [board.cells()]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    def record(self, board, undo, turn, next_turn):
+        if not self.entries or self.entries[-1][1] != self.turn:
+            self.starts.append(len(self.entries))
+        self.entries.append((undo, turn))
+        self.turn = next_turn
+        self.checkpoint(board)
+
+    def checkpoint(self, board):
+        if self.checkpoint_interval and len(self.entries) == len(self.checkpoints) * self.checkpoint_interval:
+            self.checkpoints.append(board.cells())
+
+    def undo(self, board):
+        # Takes back the last move, every hop of a multi-jump, and returns
+        # the side that made it.
+        start = self.starts[-1]
+        while len(self.entries) > start:
+            turn = self.undo_hop(board)
+        return turn
+
+    def undo_hop(self, board):
+        undo, turn = self.entries.pop()
+        board.unmake_move(undo)
+        if len(self.entries) == self.starts[-1]:
+            self.starts.pop()
+        if self.checkpoint_interval:
+            del self.checkpoints[len(self.entries) // self.checkpoint_interval + 1:]
+        self.turn = turn
+        return turn
+
+    def moves(self):
+        return [undo[0] for undo, _ in self.entries]
+
+    def move_ends(self):
+        # The ply after each move, for stepping through the game move by move.
+        return self.starts[1:] + [len(self.entries)] if self.entries else []
+
+    def paths(self):
+        # Each move as (side, path), a multi-jump as one path of squares.
+        moves = self.moves()
+        paths = []
+        for start, end in zip(self.starts, self.move_ends()):
+            path = tuple(moves[start][:2]) + tuple(square for move in moves[start:end] for square in move[2:])
+            paths.append((self.entries[start][1], path))
+        return paths
+
+    def turn_at(self, ply):
+        return self.entries[ply][1] if ply < len(self.entries) else self.turn
+
+    def seek(self, board, ply):
+        # Rebuilds the position after `ply` moves on `board` and returns the
+        # side to move there.  The history itself is left untouched.
+        if not 0 <= ply <= len(self.entries):
+            raise IndexError(f"ply {ply} is outside the game")
+        index = min(ply // self.checkpoint_interval, len(self.checkpoints) - 1) if self.checkpoint_interval else 0
+        board.set_cells(self.checkpoints[index])
+        for undo, _ in self.entries[index * self.checkpoint_interval:ply]:
+            board.make_move(*undo[0])
+        return self.turn_at(ply)
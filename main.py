@@ -1,218 +1,69 @@
 import random
-import copy
 import json
+import os
 import socket
 import threading
-import tkinter as tk
-from tkinter import messagebox, simpledialog, filedialog
-from PIL import Image, ImageTk
-
-class Piece:
-    def __init__(self, color):
-        self.color = color
-        self.king = False
-
-    def make_king(self):
-        self.king = True
-
-    def __repr__(self):
-        return f"{'K' if self.king else ''}{self.color[0]}"
-
-class Board:
-    def __init__(self, size=8, colors=("white", "black")):
-        self.size = size
-        self.colors = colors
-        self.board = self.create_board()
-
-    def create_board(self):
-        board = [[None] * self.size for _ in range(self.size)]
-        for row in range(self.size // 2 - 1):
-            for col in range(self.size):
-                if (row + col) % 2 == 1:
-                    board[row][col] = Piece(self.colors[1])
-
-        for row in range(self.size // 2 + 1, self.size):
-            for col in range(self.size):
-                if (row + col) % 2 == 1:
-                    board[row][col] = Piece(self.colors[0])
-
-        return board
-
-    def print_board(self):
-        print("  " + " ".join(str(i) for i in range(self.size)))
-        for i, row in enumerate(self.board):
-            print(i, " ".join([str(piece) if piece else '.' for piece in row]))
-        print()
-
-    def move_piece(self, start_row, start_col, end_row, end_col):
-        if self.board[start_row][start_col] is None:
-            raise ValueError("No piece at start position")
-        if self.board[end_row][end_col] is not None:
-            raise ValueError("End position already occupied")
-        
-        piece = self.board[start_row][start_col]
-        self.board[start_row][start_col] = None
-        self.board[end_row][end_col] = piece
-
-        if (piece.color == self.colors[0] and end_row == 0) or (piece.color == self.colors[1] and end_row == self.size - 1):
-            piece.make_king()
-
-    def capture_piece(self, start_row, start_col, end_row, end_col):
-        middle_row = (start_row + end_row) // 2
-        middle_col = (start_col + end_col) // 2
-        if self.board[middle_row][middle_col] is None:
-            raise ValueError("No piece to capture")
-        self.board[middle_row][middle_col] = None
-
-    def valid_move(self, start_row, start_col, end_row, end_col):
-        if not (0 <= start_row < self.size and 0 <= start_col < self.size and 0 <= end_row < self.size and 0 <= end_col < self.size):
-            return False
-        if self.board[start_row][start_col] is None:
-            return False
-        if self.board[end_row][end_col] is not None:
-            return False
-        piece = self.board[start_row][start_col]
-        if piece.color == self.colors[0] and not piece.king and end_row >= start_row:
-            return False
-        if piece.color == self.colors[1] and not piece.king and end_row <= start_row:
-            return False
-        row_diff = abs(start_row - end_row)
-        col_diff = abs(start_col - end_col)
-        if row_diff == 1 and col_diff == 1:
-            return True
-        if row_diff == 2 and col_diff == 2:
-            middle_row = (start_row + end_row) // 2
-            middle_col = (start_col + end_col) // 2
-            if self.board[middle_row][middle_col] is None or self.board[middle_row][middle_col].color == piece.color:
-                return False
-            return True
-        return False
+import time
+from bitboard import BitBoard, WHITE, BLACK
+from engine import Board, MoveInput, move_hops
+from search import Search, ParallelSearch, Ponderer
+from tablebase import Tablebase
+from book import OpeningBook
+from cache import AnalysisCache
+from storage import Storage
+from history import MoveHistory
+from archive import ArchiveReader, ArchiveWriter, game_from_history, history_from_game, read_pdn, write_pdn
+from protocol import Channel, ProtocolError, BINARY, TEXT, MSG_MOVE, MSG_CLOCK, MSG_SNAPSHOT, MSG_RESYNC
 
-    def perform_move(self, start_row, start_col, end_row, end_col):
-        if abs(start_row - end_row) == 2 and abs(start_col - end_col) == 2:
-            self.capture_piece(start_row, start_col, end_row, end_col)
-        self.move_piece(start_row, start_col, end_row, end_col)
-
-    def get_possible_moves(self, row, col):
-        piece = self.board[row][col]
-        if piece is None:
-            return []
-        directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
-        moves = []
-        for dr, dc in directions:
-            new_row, new_col = row + dr, col + dc
-            if self.valid_move(row, col, new_row, new_col):
-                moves.append((new_row, new_col))
-        return moves
-
-    def get_possible_captures(self, row, col):
-        piece = self.board[row][col]
-        if piece is None:
-            return []
-        directions = [(-2, -2), (-2, 2), (2, -2), (2, 2)]
-        captures = []
-        for dr, dc in directions:
-            new_row, new_col = row + dr, col + dc
-            if self.valid_move(row, col, new_row, new_col):
-                captures.append((new_row, new_col))
-        return captures
-
-    def has_moves(self, color):
-        for row in range(self.size):
-            for col in range(self.size):
-                if self.board[row][col] and self.board[row][col].color == color:
-                    if self.get_possible_moves(row, col) or self.get_possible_captures(row, col):
-                        return True
-        return False
+tk = messagebox = simpledialog = filedialog = None
 
-    def get_winner(self):
-        white_pieces = sum(1 for row in self.board for piece in row if piece and piece.color == self.colors[0])
-        black_pieces = sum(1 for row in self.board for piece in row if piece and piece.color == self.colors[1])
-        if white_pieces == 0:
-            return self.colors[1]
-        elif black_pieces == 0:
-            return self.colors[0]
-        elif not self.has_moves(self.colors[0]):
-            return self.colors[1]
-        elif not self.has_moves(self.colors[1]):
-            return self.colors[0]
-        return None
 
-    def evaluate(self):
-        white_pieces = sum(1 for row in self.board for piece in row if piece and piece.color == self.colors[0])
-        black_pieces = sum(1 for row in self.board for piece in row if piece and piece.color == self.colors[1])
-        white_kings = sum(1 for row in self.board for piece in row if piece and piece.color == self.colors[0] and piece.king)
-        black_kings = sum(1 for row in self.board for piece in row if piece and piece.color == self.colors[1] and piece.king)
-        return black_pieces + 2 * black_kings - (white_pieces + 2 * white_kings)
-
-    def get_all_moves(self, color):
-        moves = []
-        for row in range(self.size):
-            for col in range(self.size):
-                if self.board[row][col] and self.board[row][col].color == color:
-                    piece_moves = self.get_possible_moves(row, col)
-                    piece_captures = self.get_possible_captures(row, col)
-                    moves.extend([(row, col, end_row, end_col) for end_row, end_col in piece_moves])
-                    moves.extend([(row, col, end_row, end_col) for end_row, end_col in piece_captures])
-        return moves
-
-    def minimax(self, depth, maximizing_player, alpha, beta):
-        if depth == 0 or self.get_winner():
-            return self.evaluate()
-
-        if maximizing_player:
-            max_eval = float('-inf')
-            for move in self.get_all_moves(self.colors[1]):
-                new_board = copy.deepcopy(self)
-                new_board.perform_move(*move)
-                eval = new_board.minimax(depth - 1, False, alpha, beta)
-                max_eval = max(max_eval, eval)
-                alpha = max(alpha, eval)
-                if beta <= alpha:
-                    break
-            return max_eval
-        else:
-            min_eval = float('inf')
-            for move in self.get_all_moves(self.colors[0]):
-                new_board = copy.deepcopy(self)
-                new_board.perform_move(*move)
-                eval = new_board.minimax(depth - 1, True, alpha, beta)
-                min_eval = min(min_eval, eval)
-                beta = min(beta, eval)
-                if beta <= alpha:
-                    break
-            return min_eval
-
-    def get_best_move(self, color, difficulty=2):
-        best_move = None
-        best_value = float('-inf') if color == self.colors[1] else float('inf')
-        depth = 4 if color == self.colors[1] else 3
-        depth = depth + difficulty if color == self.colors[1] else depth - difficulty
-
-        for move in self.get_all_moves(color):
-            new_board = copy.deepcopy(self)
-            new_board.perform_move(*move)
-            board_value = new_board.minimax(depth, color == self.colors[1], float('-inf'), float('inf'))
-            if (color == self.colors[1] and board_value > best_value) or (color == self.colors[0] and board_value < best_value):
-                best_value = board_value
-                best_move = move
+def load_gui():
+    # tkinter is only imported when a window is opened, so the engine and the
+    # other headless tools can import this module without a display.
+    global tk, messagebox, simpledialog, filedialog
+    import tkinter as tk
+    from tkinter import messagebox, simpledialog, filedialog
 
-        return best_move
 
 class Game:
-    def __init__(self):
+    def __init__(self, search_workers=1, ponder=False, protocol=TEXT):
+        load_gui()
         self.board = Board()
         self.current_turn = "white"
-        self.move_history = []
+        self.history = MoveHistory(self.board, self.current_turn)
         self.move_count = 0
         self.difficulty = 2
-        self.user_profiles = self.load_profiles()
+        self.tablebase = self.load_tablebase()
+        self.book = self.load_book()
+        self.cache = self.load_cache()
+        if search_workers > 1:
+            self.search = ParallelSearch(search_workers, tablebase=self.tablebase, book=self.book,
+                                         on_iteration=self.record_progress, cache=self.cache)
+        else:
+            self.search = Search(tablebase=self.tablebase, book=self.book, on_iteration=self.record_progress,
+                                 cache=self.cache)
+        self.time_limit = None
+        self.ponderer = Ponderer(tablebase=self.tablebase) if ponder else None
+        self.storage = self.load_storage()
         self.current_profile = None
-        self.stats = {"white_wins": 0, "black_wins": 0, "draws": 0}
-        self.multiplayer_stats = {"white": {}, "black": {}}
         self.server_socket = None
         self.client_socket = None
+        self.channel = None
+        # The hello that offers the binary format is opt-in for the client: a
+        # peer from before it existed reads its first line as a move and
+        # drops the connection.  The server side accepts either.
+        self.protocol = protocol
+        self.clocks = None
         self.networked_mode = False
+        self.ai_color = "black"
+        self.ai_thread = None
+        self.ai_result = None
+        self.ai_progress = None
+        self.ai_generation = 0
+        self.selected = None
+        self.move_input = None
+        self.drawn = {}
 
         self.window = tk.Tk()
         self.window.title("Checkers")
@@ -243,6 +94,9 @@ class Game:
         self.load_button = tk.Button(self.info_frame, text="Load Game", command=self.load_game)
         self.load_button.pack()
 
+        self.move_now_button = tk.Button(self.info_frame, text="Move Now", command=self.move_now)
+        self.move_now_button.pack()
+
         self.board_buttons = [[None for _ in range(self.board.size)] for _ in range(self.board.size)]
         for r in range(self.board.size):
             for c in range(self.board.size):
@@ -253,36 +107,233 @@ class Game:
         self.update_gui()
 
     def on_square_click(self, row, col):
-        # Add functionality for handling square clicks
-        pass
+        if (self.networked_mode or self.ai_thread is not None or self.current_turn == self.ai_color
+                or self.board.get_winner()):
+            return
+        piece = self.board.board[row][col]
+        if piece and piece.color == self.current_turn:
+            self.select_square((row, col))
+        elif self.selected is not None:
+            start_row, start_col = self.selected
+            if self.check_hop(start_row, start_col, row, col) is not None:
+                self.select_square(None)
+                self.play_move((start_row, start_col, row, col))
+            else:
+                self.info_label.config(text="Invalid move, try again")
+
+    def select_square(self, square):
+        previous, self.selected = self.selected, square
+        self.update_gui([sq for sq in (previous, square) if sq is not None])
+
+    def check_hop(self, start_row, start_col, end_row, end_col):
+        # None if the hop is not part of a legal move for the side to move,
+        # otherwise whether it completes the move.  Checking does not consume
+        # the hop; play_hop does.
+        move_input = self.move_input or MoveInput(self.board, self.current_turn)
+        path = move_input.path
+        done = move_input.add(start_row, start_col, end_row, end_col)
+        move_input.path = path
+        return done
+
+    def play_hop(self, start_row, start_col, end_row, end_col):
+        # Plays one hop of a move; a multi-jump keeps the turn until its last
+        # hop.  Returns the undo record, or None if the hop is illegal.
+        if self.move_input is None:
+            self.move_input = MoveInput(self.board, self.current_turn)
+        done = self.move_input.add(start_row, start_col, end_row, end_col)
+        if done is None:
+            return None
+        turn = self.current_turn
+        undo = self.board.make_move(start_row, start_col, end_row, end_col)
+        if done:
+            self.move_input = None
+            self.current_turn = "black" if self.current_turn == "white" else "white"
+        self.save_state(undo, turn)
+        self.move_count += 1
+        return undo
+
+    def play_move(self, move):
+        turn = self.current_turn
+        squares = []
+        for hop in move_hops(move):
+            undo = self.play_hop(*hop)
+            if undo is None:
+                break
+            squares.extend(self.changed_squares(undo))
+        self.update_gui(squares)
+        winner = self.board.get_winner()
+        if winner:
+            self.info_label.config(text=f"{winner.capitalize()} wins!")
+            self.record_result(winner, "single")
+            return
+        if self.current_turn == turn:
+            self.select_square(tuple(move[-2:]))
+            self.info_label.config(text="Continue the jump")
+        elif self.current_turn == self.ai_color:
+            self.info_label.config(text="AI is thinking...")
+            self.start_ai_move(self.on_ai_move)
+        else:
+            self.info_label.config(text=f"{self.current_turn.capitalize()} to move")
+            if turn == self.ai_color:
+                self.start_pondering()
+
+    def on_ai_move(self, move):
+        path = self.ai_path(move)
+        if path is not None:
+            self.play_move(path)
+
+    def ai_path(self, move):
+        # The engine's BitBoard move as a path on self.board, or a random
+        # legal move if the search came back empty.
+        path = self.board.find_move(self.current_turn, move) if move is not None else None
+        if path is None:
+            moves = self.board.get_all_moves(self.current_turn)
+            path = random.choice(moves) if moves else None
+        return path
+
+    def changed_squares(self, undo):
+        (start_row, start_col, end_row, end_col), captured, _ = undo
+        squares = [(start_row, start_col), (end_row, end_col)]
+        if captured:
+            squares.append(captured[:2])
+        return squares
+
+    def record_progress(self, iteration):
+        # Runs on the search thread; the Tk thread picks it up when polling.
+        self.ai_progress = iteration
+
+    def compute_ai_move(self, board, side, ponder=True):
+        if ponder and self.ponderer is not None:
+            move = self.ponderer.resolve(board, side, self.difficulty, self.time_limit)
+            if move is not None:
+                return move
+        return self.search.get_best_move(board, side, self.difficulty, self.time_limit)
+
+    def start_ai_move(self, on_done, ponder=True):
+        # The search runs on a worker thread with its own copy of the
+        # position; the result comes back to the Tk thread through after().
+        # Hints pass ponder=False so they leave the pondered search alone.
+        self.cancel_ai_move()
+        side = WHITE if self.current_turn == self.board.colors[0] else BLACK
+        board = BitBoard.from_board(self.board)
+        self.ai_generation += 1
+        generation = self.ai_generation
+        self.ai_progress = None
+        self.ai_result = None
+        self.search.stop_requested = False
+
+        def run():
+            self.ai_result = self.compute_ai_move(board, side, ponder)
+
+        self.ai_thread = threading.Thread(target=run, daemon=True)
+        self.ai_thread.start()
+        self.window.after(50, self.poll_ai_move, generation, on_done)
+
+    def poll_ai_move(self, generation, on_done):
+        if generation != self.ai_generation:
+            return
+        if self.ai_thread.is_alive():
+            progress = self.ai_progress
+            if progress is not None:
+                self.info_label.config(text=f"AI is thinking... depth {progress['depth']}, "
+                                            f"{progress['total_nodes']} nodes")
+            self.window.after(50, self.poll_ai_move, generation, on_done)
+            return
+        self.ai_thread = None
+        on_done(self.ai_result)
+
+    def stop_search(self):
+        # Reaches a search in worker processes too, and a pondered search
+        # that compute_ai_move is waiting for.
+        self.search.stop()
+        if self.ponderer is not None:
+            self.ponderer.interrupt()
+
+    def move_now(self):
+        if self.ai_thread is not None:
+            self.stop_search()
+
+    def cancel_ai_move(self):
+        if self.ai_thread is not None:
+            self.ai_generation += 1
+            self.stop_search()
+            self.ai_thread.join()
+            self.ai_thread = None
+
+    def wait_for_ai_move(self):
+        # For the dialog-driven play loops: keep the window alive while the
+        # search runs instead of blocking inside it.
+        result = []
+        self.start_ai_move(result.append)
+        while not result and self.ai_thread is not None:
+            self.window.update()
+            time.sleep(0.02)
+        return self.ai_path(result[0]) if result else None
+
+    def update_gui(self, squares=None):
+        # Only squares whose text or colour changed are reconfigured; pass
+        # `squares` to limit the check to the ones a move touched.
+        if squares is None:
+            squares = [(r, c) for r in range(self.board.size) for c in range(self.board.size)]
+        for r, c in squares:
+            piece = self.board.board[r][c]
+            if piece:
+                state = (str(piece), 'light grey' if piece.color == "white" else 'dark grey')
+            else:
+                state = ("", 'white' if (r + c) % 2 == 0 else 'black')
+            if (r, c) == self.selected:
+                state = (state[0], 'gold')
+            if self.drawn.get((r, c)) != state:
+                self.drawn[(r, c)] = state
+                self.board_buttons[r][c].config(text=state[0], bg=state[1])
+
+    def load_storage(self):
+        storage = Storage("checkers.db")
+        # Win/loss counts from the old profiles.json are imported once.
+        try:
+            with open("profiles.json", "r") as f:
+                storage.import_profiles(json.load(f))
+        except FileNotFoundError:
+            return storage
+        os.replace("profiles.json", "profiles.json.imported")
+        return storage
 
-    def update_gui(self):
-        for r in range(self.board.size):
-            for c in range(self.board.size):
-                piece = self.board.board[r][c]
-                if piece:
-                    self.board_buttons[r][c].config(text=str(piece), bg='light grey' if piece.color == "white" else 'dark grey')
-                else:
-                    self.board_buttons[r][c].config(text="", bg='white' if (r + c) % 2 == 0 else 'black')
+    def load_tablebase(self):
+        try:
+            return Tablebase("tablebase.cktb")
+        except FileNotFoundError:
+            return None
 
-    def load_profiles(self):
+    def load_book(self):
         try:
-            with open("profiles.json", "r") as f:
-                return json.load(f)
+            return OpeningBook("opening.ckbk")
         except FileNotFoundError:
-            return {}
+            return None
 
-    def save_profiles(self):
-        with open("profiles.json", "w") as f:
-            json.dump(self.user_profiles, f)
+    def load_cache(self):
+        # Searches from earlier sessions (and other windows) are kept in
+        # analysis.ckac; a file for other rules is ignored and replaced.
+        try:
+            return AnalysisCache(path="analysis.ckac")
+        except ValueError:
+            return AnalysisCache()
 
     def start(self):
         self.window.mainloop()
+        if self.ponderer is not None:
+            self.ponderer.close()
+        self.cache.save("analysis.ckac")
+        self.storage.close()
 
     def restart_game(self):
+        self.cancel_ai_move()
+        if self.ponderer is not None:
+            self.ponderer.stop()
+        self.selected = None
+        self.move_input = None
         self.board = Board()
         self.current_turn = "white"
-        self.move_history = []
+        self.history = MoveHistory(self.board, self.current_turn)
         self.move_count = 0
         self.update_gui()
 
@@ -303,59 +354,83 @@ class Game:
         print("Waiting for a client to connect...")
         self.client_socket, _ = self.server_socket.accept()
         print("Client connected.")
-        threading.Thread(target=self.listen_for_client, daemon=True).start()
+        # The wire format is settled by the client's hello, if it sends one.
+        self.channel = Channel(self.client_socket)
+        threading.Thread(target=self.listen_for_peer, daemon=True).start()
 
     def start_client(self):
         self.networked_mode = True
         self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.client_socket.connect(('localhost', 12345))
         print("Connected to server.")
-        threading.Thread(target=self.listen_for_server, daemon=True).start()
+        self.channel = Channel(self.client_socket)
+        if self.protocol == BINARY:
+            self.channel.negotiate()
+        else:
+            self.channel.negotiated = True
+        threading.Thread(target=self.listen_for_peer, daemon=True).start()
 
-    def listen_for_client(self):
+    def listen_for_peer(self):
         while True:
             try:
-                message = self.client_socket.recv(1024).decode()
-                if message:
-                    start_row, start_col, end_row, end_col = map(int, message.split())
-                    self.handle_remote_move(start_row, start_col, end_row, end_col)
-                else:
+                message = self.channel.receive()
+                if message is None:
                     break
-            except Exception as e:
+                self.handle_peer_message(message)
+            except (OSError, ProtocolError) as e:
                 print(f"Error: {e}")
                 break
 
-    def listen_for_server(self):
-        while True:
+    def handle_peer_message(self, message):
+        kind = message[0]
+        if kind == MSG_MOVE:
+            path = message[1]
+            self.handle_remote_move(tuple(square for step in path for square in step))
+        elif kind == MSG_CLOCK:
+            self.clocks = {"white": message[1], "black": message[2]}
+        elif kind == MSG_SNAPSHOT:
+            _, turn, size, cells = message
+            if size == self.board.size:
+                self.board.set_cells(cells)
+                self.current_turn = self.board.colors[turn]
+                self.move_input = None
+                self.update_gui()
+        elif kind == MSG_RESYNC:
+            self.send_snapshot()
+
+    def send_move(self, path):
+        if self.networked_mode and self.channel:
             try:
-                message = self.client_socket.recv(1024).decode()
-                if message:
-                    start_row, start_col, end_row, end_col = map(int, message.split())
-                    self.handle_remote_move(start_row, start_col, end_row, end_col)
-                else:
-                    break
-            except Exception as e:
-                print(f"Error: {e}")
-                break
+                self.channel.send_move(path)
+            except OSError as e:
+                print(f"Failed to send message: {e}")
 
-    def send_message(self, message):
-        if self.networked_mode:
+    def send_snapshot(self):
+        if self.networked_mode and self.channel:
             try:
-                if self.server_socket:
-                    self.client_socket.sendall(message.encode())
-                else:
-                    self.client_socket.sendall(message.encode())
-            except Exception as e:
+                self.channel.send_snapshot(self.board.colors.index(self.current_turn), self.board.size, self.board.cells())
+            except OSError as e:
                 print(f"Failed to send message: {e}")
 
-    def handle_remote_move(self, start_row, start_col, end_row, end_col):
-        if self.board.valid_move(start_row, start_col, end_row, end_col):
-            self.board.perform_move(start_row, start_col, end_row, end_col)
+    def handle_remote_move(self, move):
+        undo = None
+        for hop in move_hops(move):
+            undo = self.play_hop(*hop)
+            if undo is None:
+                break
+        if undo is not None:
             self.update_gui()
             if self.board.get_winner():
                 self.handle_end_game()
+            return True
+        # The peer's board has drifted from ours; in binary mode it is brought
+        # back in line with a snapshot of this one.
+        self.move_input = None
+        if self.channel and self.channel.mode == BINARY:
+            self.send_snapshot()
         else:
             messagebox.showerror("Invalid Move", "The move is not valid!")
+        return False
 
     def play_single_player(self):
         while True:
@@ -363,8 +438,7 @@ class Game:
             winner = self.board.get_winner()
             if winner:
                 messagebox.showinfo("Game Over", f"{winner.capitalize()} wins!")
-                self.update_profile(winner)
-                self.update_stats(winner)
+                self.record_result(winner, "single")
                 break
 
             if self.current_turn == "white":
@@ -400,22 +474,23 @@ class Game:
                     self.view_leaderboard()
                     continue
                 try:
-                    start_row, start_col, end_row, end_col = map(int, user_input.split())
+                    move = tuple(map(int, user_input.split()))
+                    if len(move) != 4:
+                        raise ValueError
                 except ValueError:
                     messagebox.showerror("Invalid Input", "Invalid input format. Please enter four integers separated by spaces.")
                     continue
             else:
-                start_row, start_col, end_row, end_col = self.get_ai_move()
-                messagebox.showinfo("AI Move", f"AI moves: {start_row} {start_col} -> {end_row} {end_col}")
+                move = self.wait_for_ai_move() or self.get_ai_move()
+                messagebox.showinfo("AI Move", "AI moves: " + " -> ".join(f"{move[index]} {move[index + 1]}"
+                                                                         for index in range(0, len(move), 2)))
 
-            if self.board.valid_move(start_row, start_col, end_row, end_col):
-                self.save_state(start_row, start_col, end_row, end_col)
-                self.board.perform_move(start_row, start_col, end_row, end_col)
-                if self.board.get_possible_captures(end_row, end_col):
+            turn = self.current_turn
+            if all(self.play_hop(*hop) for hop in move_hops(move)):
+                if self.current_turn == turn:
                     messagebox.showinfo("Capture", f"{self.current_turn} must continue capturing")
-                else:
-                    self.current_turn = "black" if self.current_turn == "white" else "white"
-                self.move_count += 1
+                elif turn == "black":
+                    self.start_pondering()
             else:
                 messagebox.showerror("Invalid Move", "Invalid move, try again")
 
@@ -425,8 +500,7 @@ class Game:
             winner = self.board.get_winner()
             if winner:
                 messagebox.showinfo("Game Over", f"{winner.capitalize()} wins!")
-                self.update_stats(winner)
-                self.update_multiplayer_stats(winner)
+                self.record_result(winner, "multiplayer")
                 break
 
             if self.current_turn == "white":
@@ -454,30 +528,31 @@ class Game:
                 except ValueError:
                     messagebox.showerror("Invalid Input", "Invalid input format. Please enter four integers separated by spaces.")
                     continue
-                self.send_message(f"{start_row} {start_col} {end_row} {end_col}")
             else:
-                message = self.receive_message()
-                if message:
-                    start_row, start_col, end_row, end_col = map(int, message.split())
-                    self.handle_remote_move(start_row, start_col, end_row, end_col)
-
-            if self.board.valid_move(start_row, start_col, end_row, end_col):
-                self.save_state(start_row, start_col, end_row, end_col)
-                self.board.perform_move(start_row, start_col, end_row, end_col)
-                if self.board.get_possible_captures(end_row, end_col):
+                move = self.receive_message()
+                if move:
+                    self.handle_remote_move(move)
+                continue
+
+            turn = self.current_turn
+            if self.play_hop(start_row, start_col, end_row, end_col):
+                self.send_move(((start_row, start_col), (end_row, end_col)))
+                if self.current_turn == turn:
                     messagebox.showinfo("Capture", f"{self.current_turn} must continue capturing")
-                else:
-                    self.current_turn = "black" if self.current_turn == "white" else "white"
-                self.move_count += 1
             else:
                 messagebox.showerror("Invalid Move", "Invalid move, try again")
 
     def receive_message(self):
-        if self.networked_mode and self.client_socket:
+        if self.networked_mode and self.channel:
             try:
-                message = self.client_socket.recv(1024).decode()
-                return message
-            except Exception as e:
+                while True:
+                    message = self.channel.receive()
+                    if message is None:
+                        return None
+                    if message[0] == MSG_MOVE:
+                        return tuple(square for step in message[1] for square in step)
+                    self.handle_peer_message(message)
+            except (OSError, ProtocolError) as e:
                 print(f"Failed to receive message: {e}")
                 return None
         return None
@@ -498,92 +573,109 @@ class Game:
                     results["draws"] += 1
             messagebox.showinfo("Tournament Results", f"White Wins: {results['white_wins']}\nBlack Wins: {results['black_wins']}\nDraws: {results['draws']}")
 
-    def update_profile(self, winner):
-        if self.current_profile:
-            if winner == self.current_profile:
-                self.user_profiles[self.current_profile]["wins"] += 1
-            else:
-                self.user_profiles[self.current_profile]["losses"] += 1
-            self.save_profiles()
-
-    def update_stats(self, winner):
-        if winner == "white":
-            self.stats["white_wins"] += 1
-        elif winner == "black":
-            self.stats["black_wins"] += 1
-        else:
-            self.stats["draws"] += 1
+    def player_name(self, color, mode):
+        # The local player is white; the other side is the engine or the
+        # peer, who is not tracked by name.
+        if color == "white":
+            return self.current_profile or "Player"
+        if mode == "single":
+            return f"AI level {self.difficulty}"
+        return None
 
-    def update_multiplayer_stats(self, winner):
-        if winner == "white":
-            self.multiplayer_stats["white"]["white"] = self.multiplayer_stats["white"].get("white", 0) + 1
-            self.multiplayer_stats["black"]["black"] = self.multiplayer_stats["black"].get("black", 0) + 1
-        else:
-            self.multiplayer_stats["white"]["black"] = self.multiplayer_stats["white"].get("black", 0) + 1
-            self.multiplayer_stats["black"]["white"] = self.multiplayer_stats["black"].get("white", 0) + 1
+    def record_result(self, winner, mode):
+        self.storage.record_result(self.player_name("white", mode), self.player_name("black", mode), winner, mode)
+
+    def handle_end_game(self):
+        winner = self.board.get_winner()
+        self.info_label.config(text=f"{winner.capitalize()} wins!")
+        self.record_result(winner, "multiplayer")
 
     def view_stats(self):
-        stats_str = (f"White Wins: {self.stats['white_wins']}\n"
-                     f"Black Wins: {self.stats['black_wins']}\n"
-                     f"Draws: {self.stats['draws']}\n"
-                     "Multiplayer Stats:")
-        for color, stats in self.multiplayer_stats.items():
-            stats_str += f"\n{color.capitalize()}:"
-            for opponent, wins in stats.items():
-                stats_str += f"\n  {opponent}: {wins} wins"
-        messagebox.showinfo("Statistics", stats_str)
+        stats_str = ""
+        for title, mode in (("Single Player", "single"), ("Multiplayer", "multiplayer")):
+            stats = self.storage.stats(mode)
+            stats_str += (f"{title}:\n"
+                          f"  White Wins: {stats['white_wins']}\n"
+                          f"  Black Wins: {stats['black_wins']}\n"
+                          f"  Draws: {stats['draws']}\n")
+        messagebox.showinfo("Statistics", stats_str.rstrip())
 
     def view_leaderboard(self):
-        leaderboard = requests.get("https://example.com/leaderboard").json()
+        leaderboard = self.storage.leaderboard()
         leaderboard_str = "Leaderboard:"
         for rank, player in enumerate(leaderboard, start=1):
-            leaderboard_str += f"\nRank {rank}: {player['name']} - Wins: {player['wins']}"
+            leaderboard_str += (f"\nRank {rank}: {player['name']} - Rating: {player['rating']:.0f}, "
+                                f"Wins: {player['wins']}, Losses: {player['losses']}, Draws: {player['draws']}")
+        if not leaderboard:
+            leaderboard_str += "\nNo games recorded yet."
         messagebox.showinfo("Leaderboard", leaderboard_str)
 
+    def start_pondering(self):
+        if self.ponderer is None:
+            return
+        board = BitBoard.from_board(self.board)
+        side = BLACK if self.current_turn == self.board.colors[0] else WHITE
+        predicted = self.ponderer.predict(self.search, board, side)
+        self.ponderer.start(board, side, predicted, self.difficulty, self.time_limit)
+
     def get_ai_move(self):
-        move = self.board.get_best_move(self.current_turn, self.difficulty)
-        if move:
-            return move
-        return random.choice(self.board.get_all_moves(self.current_turn))
+        side = WHITE if self.current_turn == self.board.colors[0] else BLACK
+        return self.ai_path(self.compute_ai_move(BitBoard.from_board(self.board), side))
 
     def undo_move(self):
-        if self.move_history:
-            last_move = self.move_history.pop()
-            self.board = last_move["board"]
-            self.current_turn = last_move["turn"]
-            self.move_count = last_move["move_count"]
+        self.cancel_ai_move()
+        if self.ponderer is not None:
+            self.ponderer.stop()
+        if self.history:
+            # A multi-jump is taken back whole, never left half made.
+            self.current_turn = self.history.undo(self.board)
+            self.move_input = None
+            self.move_count = len(self.history)
             self.update_gui()
         else:
             messagebox.showwarning("Undo", "No moves to undo!")
 
     def save_game(self):
-        file = filedialog.asksaveasfile(defaultextension=".json", filetypes=[("JSON files", "*.json")])
-        if file:
-            game_data = {
-                "board": self.board.board,
-                "current_turn": self.current_turn,
-                "move_history": self.move_history,
-                "move_count": self.move_count
-            }
-            json.dump(game_data, file)
-            file.close()
+        path = filedialog.asksaveasfilename(defaultextension=".ckga", filetypes=[("Game archives", "*.ckga"), ("PDN files", "*.pdn")])
+        if path:
+            game = game_from_history(self.history, size=self.board.size)
+            if path.endswith(".pdn"):
+                with open(path, "w") as f:
+                    write_pdn([game], f)
+            else:
+                with ArchiveWriter(path) as writer:
+                    writer.add(game)
 
     def load_game(self):
-        file = filedialog.askopenfile(defaultextension=".json", filetypes=[("JSON files", "*.json")])
-        if file:
-            game_data = json.load(file)
-            self.board.board = game_data["board"]
-            self.current_turn = game_data["current_turn"]
-            self.move_history = game_data["move_history"]
-            self.move_count = game_data["move_count"]
-            file.close()
+        path = filedialog.askopenfilename(defaultextension=".ckga", filetypes=[("Game archives", "*.ckga"), ("PDN files", "*.pdn")])
+        if path:
+            self.cancel_ai_move()
+            try:
+                if path.endswith(".pdn"):
+                    with open(path) as f:
+                        game = next(read_pdn(f, self.board.size), None)
+                else:
+                    with ArchiveReader(path) as reader:
+                        game = reader[-1] if len(reader) else None
+                if game is None:
+                    messagebox.showerror("Load Game", "No game found in that file.")
+                    return
+                board = Board(game.get("size", self.board.size))
+                history = history_from_game(board, game)
+            except ValueError as e:
+                messagebox.showerror("Load Game", f"Could not load the game: {e}")
+                return
+            self.board = board
+            self.history = history
+            self.current_turn = self.history.turn
+            self.move_input = None
+            self.move_count = len(self.history)
             self.update_gui()
 
     def replay_game(self):
-        if self.move_history:
-            replay_board = Board()
-            for move in self.move_history:
-                replay_board.board = copy.deepcopy(move["board"])
+        if self.history:
+            for ply in [0] + self.history.move_ends():
+                self.history.seek(self.board, ply)
                 self.update_gui()
                 self.window.update()
                 self.window.after(1000)  # 1-second delay between moves
@@ -591,9 +683,18 @@ class Game:
             messagebox.showwarning("Replay", "No move history to replay!")
 
     def show_hint(self):
-        move = self.board.get_best_move(self.current_turn, self.difficulty)
-        if move:
-            messagebox.showinfo("Hint", f"Try moving from ({move[0]}, {move[1]}) to ({move[2]}, {move[3]})")
+        # Searched in the background like an AI move, so the window stays
+        # responsive; the answer is shown when the search is done.
+        if self.ai_thread is not None:
+            return
+        self.info_label.config(text="Looking for a hint...")
+        self.start_ai_move(self.on_hint, ponder=False)
+
+    def on_hint(self, move):
+        self.info_label.config(text=f"{self.current_turn.capitalize()} to move")
+        path = self.board.find_move(self.current_turn, move) if move is not None else None
+        if path:
+            messagebox.showinfo("Hint", f"Try moving from ({path[0]}, {path[1]}) to ({path[-2]}, {path[-1]})")
         else:
             messagebox.showinfo("Hint", "No hints available.")
 
@@ -610,15 +711,15 @@ class Game:
             self.update_gui()
 
     def view_history(self):
-        history_str = "\n".join(f"Move {i+1}: {move}" for i, move in enumerate(self.move_history))
-        messagebox.showinfo("Move History", history_str)
-
-    def save_state(self, start_row, start_col, end_row, end_col):
-        self.move_history.append({
-            "board": copy.deepcopy(self.board),
-            "turn": self.current_turn,
-            "move_count": self.move_count
-        })
+        # One line per move, a multi-jump listing every landing square.
+        lines = []
+        for i, (turn, path) in enumerate(self.history.paths()):
+            squares = " -> ".join(f"{path[j]} {path[j + 1]}" for j in range(0, len(path), 2))
+            lines.append(f"Move {i+1}: {turn} {squares}")
+        messagebox.showinfo("Move History", "\n".join(lines))
+
+    def save_state(self, undo, turn):
+        self.history.record(self.board, undo, turn, self.current_turn)
 
 if __name__ == "__main__":
     game = Game()
@@ -0,0 +1,302 @@
+import struct
+import threading
+from collections import deque
+
+PROTOCOL_VERSION = 1
+TEXT = "text"
+BINARY = "binary"
+HELLO = b"CHECKERS"
+
+# A binary frame is a header followed by `length` bytes of records.  Each
+# record is a type byte and a body length, so a frame can batch any mix of
+# moves, clock updates and snapshots, and unknown record types are skipped.
+FRAME = struct.Struct("<IIH")
+RECORD = struct.Struct("<BH")
+STEP = struct.Struct("<BB")
+CLOCK = struct.Struct("<II")
+SNAPSHOT = struct.Struct("<BB")
+MAX_FRAME = 1 << 20
+
+MSG_TEXT = 0
+MSG_MOVE = 1
+MSG_CLOCK = 2
+MSG_SNAPSHOT = 3
+MSG_RESYNC = 4
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def hello_line(modes):
+    return HELLO + f" {PROTOCOL_VERSION} {modes}\n".encode()
+
+
+def parse_hello(line, modes=(BINARY, TEXT)):
+    # Picks the first of our modes that the peer offered; anything
+    # unrecognised falls back to text.
+    fields = line.decode(errors="replace").split() if isinstance(line, bytes) else line.split()
+    offered = fields[2].split(",") if len(fields) > 2 else [TEXT]
+    return next((mode for mode in modes if mode in offered), TEXT)
+
+
+def encode_record(message):
+    kind = message[0]
+    if kind == MSG_TEXT:
+        body = message[1].encode()
+    elif kind == MSG_MOVE:
+        # A move is its path of squares, so a multi-jump travels as one record.
+        body = b"".join(STEP.pack(row, col) for row, col in message[1])
+    elif kind == MSG_CLOCK:
+        body = CLOCK.pack(round(message[1] * 1000), round(message[2] * 1000))
+    elif kind == MSG_SNAPSHOT:
+        body = SNAPSHOT.pack(message[1], message[2]) + bytes(message[3])
+    elif kind == MSG_RESYNC:
+        body = b""
+    else:
+        raise ProtocolError(f"Unknown message type {kind}")
+    return RECORD.pack(kind, len(body)) + body
+
+
+def decode_record(kind, body):
+    if kind == MSG_TEXT:
+        return MSG_TEXT, body.decode(errors="replace")
+    if kind == MSG_MOVE:
+        if len(body) < 2 * STEP.size or len(body) % STEP.size:
+            raise ProtocolError("Malformed move")
+        return MSG_MOVE, [step for step in STEP.iter_unpack(body)]
+    if kind == MSG_CLOCK:
+        if len(body) != CLOCK.size:
+            raise ProtocolError("Malformed clock")
+        white_ms, black_ms = CLOCK.unpack(body)
+        return MSG_CLOCK, white_ms / 1000, black_ms / 1000
+    if kind == MSG_SNAPSHOT:
+        if len(body) < SNAPSHOT.size:
+            raise ProtocolError("Malformed snapshot")
+        turn, size = SNAPSHOT.unpack_from(body)
+        cells = body[SNAPSHOT.size:]
+        if len(cells) != size * size:
+            raise ProtocolError("Malformed snapshot")
+        return MSG_SNAPSHOT, turn, size, cells
+    if kind == MSG_RESYNC:
+        return (MSG_RESYNC,)
+    return None
+
+
+def encode_payload(messages):
+    # The records of a frame without its header.  Only the header depends on
+    # the connection (its sequence number), so a payload can be encoded once
+    # and sent to many peers with frame_header.
+    payload = b"".join(encode_record(message) for message in messages)
+    if len(payload) > MAX_FRAME:
+        raise ProtocolError("Frame too large")
+    return payload
+
+
+def frame_header(seq, payload, count):
+    return FRAME.pack(len(payload), seq, count)
+
+
+def encode_frame(seq, messages):
+    payload = encode_payload(messages)
+    return frame_header(seq, payload, len(messages)) + payload
+
+
+def decode_payload(payload, count):
+    messages = []
+    offset = 0
+    for _ in range(count):
+        if offset + RECORD.size > len(payload):
+            raise ProtocolError("Truncated frame")
+        kind, length = RECORD.unpack_from(payload, offset)
+        offset += RECORD.size
+        if offset + length > len(payload):
+            raise ProtocolError("Truncated frame")
+        message = decode_record(kind, bytes(payload[offset:offset + length]))
+        offset += length
+        if message is not None:
+            messages.append(message)
+    return messages
+
+
+def encode_text(message):
+    if message[0] == MSG_MOVE:
+        path = message[1]
+        return "".join(f"{start[0]} {start[1]} {end[0]} {end[1]}\n" for start, end in zip(path, path[1:])).encode()
+    if message[0] == MSG_TEXT:
+        return message[1].encode() + b"\n"
+    # Clocks, snapshots and resync requests have no text form; peers that
+    # only speak text never expect them.
+    return b""
+
+
+class FrameDecoder:
+    def __init__(self):
+        self.buffer = bytearray()
+        self.expected_seq = 0
+
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        while len(self.buffer) >= FRAME.size:
+            length, seq, count = FRAME.unpack_from(self.buffer)
+            if length > MAX_FRAME:
+                raise ProtocolError("Frame too large")
+            if len(self.buffer) < FRAME.size + length:
+                break
+            payload = self.buffer[FRAME.size:FRAME.size + length]
+            del self.buffer[:FRAME.size + length]
+            frames.append((seq, decode_payload(payload, count)))
+        return frames
+
+    def check_seq(self, seq):
+        # Returns False when frames were lost or reordered, after which the
+        # receiver should ask for a snapshot.  Counting resumes from `seq`.
+        ok = seq == self.expected_seq
+        self.expected_seq = (seq + 1) & 0xFFFFFFFF
+        return ok
+
+
+class TextDecoder:
+    # The original peer protocol sends bare "r c r c" strings with no
+    # delimiter, so the stream is read as integer tokens in groups of four.
+    # Once a peer is seen terminating moves with newlines, a token is only
+    # taken as complete when a delimiter follows it.
+    def __init__(self):
+        self.buffer = b""
+        self.tokens = []
+        self.delimited = False
+
+    def feed(self, data):
+        self.buffer += data
+        if b"\n" in data:
+            self.delimited = True
+        if self.delimited:
+            split = max(self.buffer.rfind(b" "), self.buffer.rfind(b"\n")) + 1
+        else:
+            split = len(self.buffer)
+        complete, self.buffer = self.buffer[:split], self.buffer[split:]
+        try:
+            self.tokens.extend(int(token) for token in complete.split())
+        except ValueError:
+            raise ProtocolError("Expected start_row start_col end_row end_col")
+        messages = []
+        while len(self.tokens) >= 4:
+            start_row, start_col, end_row, end_col = self.tokens[:4]
+            del self.tokens[:4]
+            messages.append((MSG_MOVE, [(start_row, start_col), (end_row, end_col)]))
+        return messages
+
+    def flush(self):
+        return self.feed(b"\n")
+
+
+class Channel:
+    def __init__(self, sock, mode=TEXT):
+        self.sock = sock
+        self.mode = mode
+        self.negotiated = False
+        self.send_seq = 0
+        self.pending = deque()
+        self.decoder = FrameDecoder() if mode == BINARY else TextDecoder()
+        self.send_lock = threading.Lock()
+        self.receive_lock = threading.Lock()
+
+    def negotiate(self, modes=(BINARY, TEXT), timeout=5.0):
+        # Client side: offer the modes in order of preference.  A peer that
+        # does not answer with a hello line only speaks the text protocol.
+        self.sock.sendall(hello_line(",".join(modes)))
+        self.negotiated = True
+        previous = self.sock.gettimeout()
+        self.sock.settimeout(timeout)
+        data = b""
+        try:
+            while b"\n" not in data:
+                chunk = self.sock.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+        except TimeoutError:
+            pass
+        finally:
+            self.sock.settimeout(previous)
+        if data.startswith(HELLO) and b"\n" in data:
+            line, data = data.split(b"\n", 1)
+            self.set_mode(parse_hello(line))
+        else:
+            self.set_mode(TEXT)
+        if data:
+            self.pending.extend(self.decode(data))
+        return self.mode
+
+    def accept_hello(self, data, modes=(BINARY, TEXT)):
+        # Server side: the first bytes from the peer are either a hello line or
+        # a move from a client that predates negotiation.
+        if not HELLO.startswith(data[:len(HELLO)]):
+            self.negotiated = True
+            return data
+        if b"\n" not in data:
+            return None
+        self.negotiated = True
+        line, data = data.split(b"\n", 1)
+        mode = parse_hello(line, modes)
+        with self.send_lock:
+            self.sock.sendall(hello_line(mode))
+            self.set_mode(mode)
+        return data
+
+    def set_mode(self, mode):
+        self.mode = mode
+        self.decoder = FrameDecoder() if mode == BINARY else TextDecoder()
+
+    def decode(self, data):
+        if self.mode == TEXT:
+            return self.decoder.feed(data)
+        messages = []
+        for seq, frame in self.decoder.feed(data):
+            if not self.decoder.check_seq(seq):
+                messages.append((MSG_RESYNC,))
+            messages.extend(frame)
+        return messages
+
+    def send(self, *messages):
+        with self.send_lock:
+            if self.mode == BINARY:
+                data = encode_frame(self.send_seq, messages)
+                self.send_seq = (self.send_seq + 1) & 0xFFFFFFFF
+            else:
+                data = b"".join(encode_text(message) for message in messages)
+            if data:
+                self.sock.sendall(data)
+
+    def send_move(self, path):
+        self.send((MSG_MOVE, list(path)))
+
+    def send_clock(self, white_seconds, black_seconds):
+        self.send((MSG_CLOCK, white_seconds, black_seconds))
+
+    def send_snapshot(self, turn, size, cells):
+        self.send((MSG_SNAPSHOT, turn, size, cells))
+
+    def receive(self):
+        with self.receive_lock:
+            pending = b""
+            while not self.pending:
+                data = self.sock.recv(4096)
+                if not data:
+                    if self.mode == TEXT:
+                        self.pending.extend(self.decoder.flush())
+                    if not self.pending:
+                        return None
+                    break
+                if not self.negotiated:
+                    pending += data
+                    data = self.accept_hello(pending)
+                    if data is None:
+                        continue
+                    pending = b""
+                self.pending.extend(self.decode(data))
+            return self.pending.popleft()
+
+    def close(self):
+        self.sock.close()
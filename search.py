@@ -0,0 +1,751 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bitboard import BitBoard, BLACK, WHITE
+from evaluation import Evaluator
+from tablebase import Tablebase, WIN, LOSS
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+MAX_DEPTH = 64
+# History counters are indexed by from and to square; 72 covers the 12x12
+# variants.
+HISTORY_SQUARES = 72
+TIME_CHECK_INTERVAL = 1024
+# Decided games score far outside material range.  Adding the remaining depth
+# prefers quicker wins while keeping scores independent of the path taken.
+WIN_SCORE = 1000
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchStats:
+    COUNTERS = ("nodes", "leaf_evaluations", "interior_nodes", "moves_generated", "beta_cutoffs",
+                "first_move_cutoffs", "tt_probes", "tt_hits", "tt_cutoffs", "tablebase_hits", "quiescence_nodes")
+
+    def __init__(self):
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        self.iterations = []
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    def counters(self):
+        return tuple(getattr(self, name) for name in self.COUNTERS)
+
+    def add(self, counters):
+        for name, value in zip(self.COUNTERS, counters):
+            setattr(self, name, getattr(self, name) + value)
+
+    def end_iteration(self, depth, nodes, move, value):
+        elapsed = time.monotonic() - self.started
+        previous = self.iterations[-1] if self.iterations else None
+        iteration_nodes = nodes - (previous["total_nodes"] if previous else 0)
+        self.iterations.append({
+            "depth": depth,
+            "nodes": iteration_nodes,
+            "total_nodes": nodes,
+            "seconds": elapsed - (previous["elapsed"] if previous else 0.0),
+            "elapsed": elapsed,
+            "move": move,
+            "value": value,
+            # Effective branching factor: how much more work this depth took
+            # than the one before it.
+            "branching_factor": iteration_nodes / previous["nodes"] if previous and previous["nodes"] else None,
+        })
+        return self.iterations[-1]
+
+    def finish(self, nodes):
+        self.nodes = nodes
+        self.elapsed = time.monotonic() - self.started
+
+    def cutoff_rate(self):
+        return self.beta_cutoffs / self.interior_nodes if self.interior_nodes else 0.0
+
+    def first_move_cutoff_rate(self):
+        return self.first_move_cutoffs / self.beta_cutoffs if self.beta_cutoffs else 0.0
+
+    def branching_factor(self):
+        return self.moves_generated / self.interior_nodes if self.interior_nodes else 0.0
+
+    def tt_hit_rate(self):
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    def as_dict(self):
+        return dict({name: getattr(self, name) for name in self.COUNTERS},
+                    elapsed=self.elapsed, nodes_per_second=self.nodes / self.elapsed if self.elapsed else 0.0,
+                    cutoff_rate=self.cutoff_rate(), first_move_cutoff_rate=self.first_move_cutoff_rate(),
+                    branching_factor=self.branching_factor(), tt_hit_rate=self.tt_hit_rate(),
+                    iterations=self.iterations)
+
+    def __str__(self):
+        lines = [f"{self.nodes} nodes in {self.elapsed:.3f}s, {self.leaf_evaluations} evaluations, "
+                 f"{self.quiescence_nodes} quiescence nodes, cutoffs {self.cutoff_rate():.1%} of interior nodes ({self.first_move_cutoff_rate():.1%} on the "
+                 f"first move), branching {self.branching_factor():.2f}, TT hits {self.tt_hit_rate():.1%}"]
+        for iteration in self.iterations:
+            ebf = iteration["branching_factor"]
+            lines.append(f"  depth {iteration['depth']}: {iteration['nodes']} nodes in {iteration['seconds']:.3f}s"
+                         + (f", EBF {ebf:.2f}" if ebf else ""))
+        return "\n".join(lines)
+
+
+def difficulty_depth(side, difficulty):
+    depth = 4 + difficulty if side == BLACK else 3 - difficulty
+    return max(depth, 0) + 1
+
+
+def win_score(winner, depth, distance=0):
+    score = WIN_SCORE + depth - distance
+    return score if winner == BLACK else -score
+
+
+class Search:
+    # With `instrument` set, every get_best_move leaves a SearchStats in
+    # self.stats.  Otherwise self.stats stays None and the search only pays
+    # for one None check at each counted event.  `on_iteration` is called with
+    # each completed depth's summary either way.
+    def __init__(self, tt=None, tablebase=None, book=None, instrument=False, on_iteration=None, evaluator=None,
+                 cache=None):
+        self.tt = tt if tt is not None else TranspositionTable()
+        self.cache = cache
+        self.tablebase = tablebase
+        self.book = book
+        self.evaluator = evaluator
+        self.instrument = instrument
+        self.on_iteration = on_iteration
+        self.stats = None
+        self.killers = [[None, None] for _ in range(MAX_DEPTH + 1)]
+        self.history = [[[0] * HISTORY_SQUARES for _ in range(HISTORY_SQUARES)] for _ in range(2)]
+        self.nodes = 0
+        self.deadline = None
+        self.stop_requested = False
+        self.completed_depth = 0
+
+    def check_time(self):
+        if self.stop_requested or time.monotonic() >= self.deadline:
+            raise SearchTimeout()
+
+    def stop(self):
+        # May be called from another thread; the search returns the best move
+        # of its last completed depth at the next time check.  The caller
+        # clears stop_requested before starting the next search.
+        self.stop_requested = True
+
+    def clear(self):
+        # Forgets everything learned from earlier searches, so the next one
+        # gives the same result however the positions before it went.
+        self.tt.clear()
+        self.killers = [[None, None] for _ in range(MAX_DEPTH + 1)]
+        self.history = [[[0] * HISTORY_SQUARES for _ in range(HISTORY_SQUARES)] for _ in range(2)]
+
+    def order_moves(self, moves, side, ply, tt_move):
+        killers = self.killers[ply]
+        history = self.history[side]
+
+        def score(move):
+            if move == tt_move:
+                return 1 << 40
+            if move[2]:
+                return 1 << 39
+            if move == killers[0]:
+                return 1 << 38
+            if move == killers[1]:
+                return 1 << 37
+            return history[move[0]][move[1]]
+
+        moves.sort(key=score, reverse=True)
+        return moves
+
+    def record_cutoff(self, move, side, ply, depth):
+        if move[2]:
+            return
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self.history[side][move[0]][move[1]] += depth * depth
+
+    def minimax(self, board, depth, maximizing_player, alpha, beta, ply=0):
+        self.nodes += 1
+        if self.deadline is not None and not self.nodes % TIME_CHECK_INTERVAL:
+            self.check_time()
+        stats = self.stats
+        if not board.white:
+            return win_score(BLACK, depth)
+        if not board.black:
+            return win_score(WHITE, depth)
+        side = BLACK if maximizing_player else WHITE
+        if self.tablebase is not None:
+            probe = self.tablebase.probe(board, side)
+            if probe is not None:
+                if stats is not None:
+                    stats.tablebase_hits += 1
+                result, distance = probe
+                if result == WIN:
+                    return win_score(side, depth, distance)
+                if result == LOSS:
+                    return win_score(1 - side, depth, distance)
+                return 0
+        if depth <= 0:
+            return self.quiesce(board, maximizing_player, alpha, beta)
+
+        key = board.side_key(side)
+        tt_move = None
+        entry = self.tt.probe(key)
+        if stats is not None:
+            stats.tt_probes += 1
+            stats.tt_hits += entry is not None
+        if entry is not None:
+            _, entry_depth, flag, value, tt_move, _ = entry
+            if entry_depth == depth and (flag == EXACT or (flag == LOWER and value >= beta)
+                                         or (flag == UPPER and value <= alpha)):
+                if stats is not None:
+                    stats.tt_cutoffs += 1
+                return value
+        moves = board.get_all_moves(side)
+        if not moves:
+            return win_score(1 - side, depth)
+        if stats is not None:
+            stats.interior_nodes += 1
+            stats.moves_generated += len(moves)
+        alpha_orig, beta_orig = alpha, beta
+        moves = self.order_moves(moves, side, min(ply, MAX_DEPTH), tt_move)
+
+        best_move = None
+        if maximizing_player:
+            best_eval = float('-inf')
+            for move in moves:
+                undo = board.make_move(move)
+                eval = self.minimax(board, depth - 1, False, alpha, beta, ply + 1)
+                board.unmake_move(undo)
+                if eval > best_eval:
+                    best_eval = eval
+                    best_move = move
+                alpha = max(alpha, eval)
+                if beta <= alpha:
+                    self.record_cutoff(move, side, min(ply, MAX_DEPTH), depth)
+                    if stats is not None:
+                        stats.beta_cutoffs += 1
+                        stats.first_move_cutoffs += move is moves[0]
+                    break
+        else:
+            best_eval = float('inf')
+            for move in moves:
+                undo = board.make_move(move)
+                eval = self.minimax(board, depth - 1, True, alpha, beta, ply + 1)
+                board.unmake_move(undo)
+                if eval < best_eval:
+                    best_eval = eval
+                    best_move = move
+                beta = min(beta, eval)
+                if beta <= alpha:
+                    self.record_cutoff(move, side, min(ply, MAX_DEPTH), depth)
+                    if stats is not None:
+                        stats.beta_cutoffs += 1
+                        stats.first_move_cutoffs += move is moves[0]
+                    break
+
+        if best_eval <= alpha_orig:
+            flag = UPPER
+        elif best_eval >= beta_orig:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt.store(key, depth, flag, best_eval, best_move)
+        return best_eval
+
+    def quiesce(self, board, maximizing_player, alpha, beta):
+        # Captures are compulsory, so a position with one pending has no
+        # static value of its own: keep resolving jumps until it is quiet.
+        # There is no stand-pat option for the side that must capture.
+        stats = self.stats
+        if not board.white:
+            return win_score(BLACK, 0)
+        if not board.black:
+            return win_score(WHITE, 0)
+        moves = board.get_captures(BLACK if maximizing_player else WHITE)
+        if not moves:
+            if stats is not None:
+                stats.leaf_evaluations += 1
+            if self.evaluator is not None:
+                return self.evaluator.evaluate(board)
+            return board.evaluate()
+        self.nodes += 1
+        if self.deadline is not None and not self.nodes % TIME_CHECK_INTERVAL:
+            self.check_time()
+        if stats is not None:
+            stats.quiescence_nodes += 1
+        best_eval = float('-inf') if maximizing_player else float('inf')
+        for move in moves:
+            undo = board.make_move(move)
+            eval = self.quiesce(board, not maximizing_player, alpha, beta)
+            board.unmake_move(undo)
+            if maximizing_player:
+                best_eval = max(best_eval, eval)
+                alpha = max(alpha, eval)
+            else:
+                best_eval = min(best_eval, eval)
+                beta = min(beta, eval)
+            if beta <= alpha:
+                break
+        return best_eval
+
+    def search_root(self, board, side, depth, moves):
+        maximizing = side == BLACK
+        alpha, beta = float('-inf'), float('inf')
+        best_move = None
+        best_value = float('-inf') if maximizing else float('inf')
+        for move in moves:
+            undo = board.make_move(move)
+            value = self.minimax(board, depth - 1, not maximizing, alpha, beta, 1)
+            board.unmake_move(undo)
+            if maximizing and value > best_value:
+                best_value, best_move = value, move
+                alpha = value
+            elif not maximizing and value < best_value:
+                best_value, best_move = value, move
+                beta = value
+        return best_move, best_value
+
+    def principal_variation(self, board, side, depth):
+        board = board.copy()
+        line = []
+        seen = set()
+        while len(line) < depth:
+            entry = self.tt.probe(board.side_key(side))
+            if entry is None or entry[4] is None or entry[0] in seen:
+                break
+            if entry[4] not in board.get_all_moves(side):
+                break
+            seen.add(entry[0])
+            line.append(entry[4])
+            board.make_move(entry[4])
+            side = 1 - side
+        return line
+
+    def iteration_done(self, depth, move, value):
+        self.completed_depth = depth
+        if self.stats is not None:
+            iteration = self.stats.end_iteration(depth, self.nodes, move, value)
+        elif self.on_iteration is not None:
+            iteration = {"depth": depth, "total_nodes": self.nodes, "move": move, "value": value}
+        else:
+            return
+        if self.on_iteration is not None:
+            self.on_iteration(iteration)
+
+    def cache_key(self, board, side):
+        # Searches with other evaluation weights or another tablebase score
+        # positions differently, so their entries are kept apart.  The cache
+        # file only holds 8x8 moves.
+        if self.cache is None or not isinstance(board, BitBoard):
+            return None
+        key = board.side_key(side)
+        if self.evaluator is not None:
+            key ^= self.evaluator.fingerprint()
+        if self.tablebase is not None:
+            key ^= (self.tablebase.max_pieces * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        return key
+
+    def cached_move(self, board, side, max_depth, moves):
+        # A cached search at least max_depth deep answers the request; it is
+        # reported like a completed iteration.
+        key = self.cache_key(board, side)
+        if key is None:
+            return None
+        entry = self.cache.lookup(key, max_depth, moves)
+        if entry is None:
+            return None
+        move, value, depth = entry
+        self.iteration_done(depth, move, value)
+        return move
+
+    def remember(self, board, side, move, value):
+        key = self.cache_key(board, side)
+        if key is not None and self.completed_depth:
+            self.cache.store(key, move, value, self.completed_depth)
+
+    def get_best_move(self, board, side, difficulty=2, time_limit=None, max_depth=None):
+        board = board.copy()
+        self.tt.new_search()
+        self.nodes = 0
+        self.completed_depth = 0
+        self.stats = SearchStats() if self.instrument else None
+        # Without a time limit the deadline is infinite rather than None so
+        # that stop() is still noticed.
+        self.deadline = time.monotonic() + time_limit if time_limit is not None else float('inf')
+        if max_depth is None:
+            max_depth = MAX_DEPTH if time_limit is not None else difficulty_depth(side, difficulty)
+
+        moves = board.get_all_moves(side)
+        if not moves:
+            return None
+        if self.book is not None:
+            move = self.book.lookup(board, side, moves)
+            if move is not None:
+                return move
+        move = self.cached_move(board, side, max_depth, moves)
+        if move is not None:
+            return move
+        entry = self.tt.probe(board.side_key(side))
+        moves = self.order_moves(moves, side, 0, entry[4] if entry is not None else None)
+        best_move = moves[0]
+        best_value = None
+        try:
+            for depth in range(1, max_depth + 1):
+                move, value = self.search_root(board, side, depth, moves)
+                best_move, best_value = move, value
+                self.iteration_done(depth, move, value)
+                self.tt.store(board.side_key(side), depth, EXACT, value, move)
+                moves.remove(move)
+                moves.insert(0, move)
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+            if self.stats is not None:
+                self.stats.finish(self.nodes)
+        self.remember(board, side, best_move, best_value)
+        return best_move
+
+
+_worker_search = None
+_worker_bound = None
+_worker_iteration = None
+
+
+class _WorkerSearch(Search):
+    # The shared bound array also carries the last iteration the parent
+    # stopped, so stop() reaches the workers at their next time check.
+    def __init__(self, bound, tt=None, tablebase=None, instrument=False, evaluator=None):
+        super().__init__(tt, tablebase, instrument=instrument, evaluator=evaluator)
+        self.bound = bound
+        self.iteration = 0
+
+    def check_time(self):
+        if self.bound[2] >= self.iteration:
+            raise SearchTimeout()
+        super().check_time()
+
+
+def _init_worker(bound, tt_mb, tablebase_path, instrument=False, weights_path=None):
+    global _worker_search, _worker_bound
+    tablebase = Tablebase(tablebase_path) if tablebase_path else None
+    evaluator = Evaluator(weights_path) if weights_path else None
+    _worker_search = _WorkerSearch(bound, TranspositionTable(tt_mb), tablebase, instrument, evaluator)
+    _worker_bound = bound
+
+
+def _search_root_move(position, side, move, depth, iteration, deadline, full_window):
+    global _worker_iteration
+    board = BitBoard(*position)
+    search = _worker_search
+    if iteration != _worker_iteration:
+        _worker_iteration = iteration
+        search.tt.new_search()
+    search.iteration = iteration
+    search.nodes = 0
+    search.stats = SearchStats() if search.instrument else None
+    alpha, beta = float('-inf'), float('inf')
+    if not full_window:
+        with _worker_bound.get_lock():
+            bound = _worker_bound[1] if _worker_bound[0] == iteration else float('-inf')
+        if side == BLACK:
+            alpha = bound
+        else:
+            beta = -bound
+    # Without a time limit the deadline is infinite rather than None so that
+    # the stop flag is still polled.
+    search.deadline = time.monotonic() + (deadline - time.time()) if deadline is not None else float('inf')
+    board.make_move(move)
+    try:
+        value = search.minimax(board, depth - 1, side == WHITE, alpha, beta, 1)
+    except SearchTimeout:
+        return None
+    finally:
+        search.deadline = None
+    if alpha < value < beta:
+        score = value if side == BLACK else -value
+        with _worker_bound.get_lock():
+            if _worker_bound[0] == iteration and score > _worker_bound[1]:
+                _worker_bound[1] = score
+    return value, alpha, beta, search.nodes, search.stats.counters() if search.stats is not None else None
+
+
+class ParallelSearch(Search):
+    def __init__(self, workers=None, tt=None, worker_tt_mb=16, tablebase=None, book=None, instrument=False,
+                 on_iteration=None, evaluator=None, cache=None):
+        super().__init__(tt, tablebase, book, instrument, on_iteration, evaluator, cache)
+        self.workers = workers or os.cpu_count() or 1
+        self.worker_tt_mb = worker_tt_mb
+        self.iteration = 0
+        self.bound = None
+        self.pool = None
+
+    def start(self):
+        if self.pool is None:
+            # [iteration, best root score so far, last stopped iteration]
+            self.bound = multiprocessing.Array('d', [0.0, float('-inf'), 0.0])
+            self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                            initargs=(self.bound, self.worker_tt_mb,
+                                                      self.tablebase.path if self.tablebase else None,
+                                                      self.instrument,
+                                                      self.evaluator.path if self.evaluator else None))
+        return self.pool
+
+    def stop(self):
+        super().stop()
+        if self.bound is not None:
+            self.bound[2] = self.iteration
+
+    def close(self):
+        if self.pool is not None:
+            self.stop()
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_worker_result(self, result):
+        self.nodes += result[3]
+        if self.stats is not None and result[4] is not None:
+            self.stats.add(result[4])
+
+    def search_root_parallel(self, board, side, depth, moves, deadline):
+        pool = self.start()
+        self.iteration += 1
+        with self.bound.get_lock():
+            self.bound[0] = self.iteration
+            self.bound[1] = float('-inf')
+        # stop() marks the iteration it saw; one that came just before this
+        # iteration started is caught here instead.
+        if self.stop_requested:
+            raise SearchTimeout()
+        position = (board.white, board.black, board.kings)
+
+        def submit(move, full_window=False):
+            return pool.submit(_search_root_move, position, side, move, depth,
+                               self.iteration, deadline, full_window)
+
+        # Young Brothers Wait at the root: the first (principal) move sets the
+        # bound before its siblings are searched in parallel.
+        results = [submit(moves[0]).result()]
+        if results[0] is None or self.stop_requested:
+            raise SearchTimeout()
+        futures = {submit(move): index for index, move in enumerate(moves[1:], 1)}
+        results.extend([None] * len(futures))
+        timed_out = False
+        for future in as_completed(futures):
+            result = future.result()
+            if result is None or self.stop_requested:
+                timed_out = True
+                for pending in futures:
+                    pending.cancel()
+                break
+            results[futures[future]] = result
+        if timed_out:
+            raise SearchTimeout()
+        for result in results:
+            self.add_worker_result(result)
+
+        # Pick the first move with the best score in root order, exactly as the
+        # serial root does.  A sibling that failed low against a bound equal to
+        # the best score might tie it, so those are re-searched with a full
+        # window before they can be ruled out.
+        sign = 1 if side == BLACK else -1
+        best = max(sign * value for value, alpha, beta, *_ in results if alpha < value < beta)
+        for index, (value, alpha, beta, *_) in enumerate(results):
+            if not alpha < value < beta and sign * value >= best:
+                result = submit(moves[index], True).result()
+                if result is None:
+                    raise SearchTimeout()
+                value = result[0]
+                self.add_worker_result(result)
+            if sign * value == best:
+                return moves[index], value
+        raise RuntimeError("Parallel root search lost the best move")
+
+    def get_best_move(self, board, side, difficulty=2, time_limit=None, max_depth=None):
+        if self.workers <= 1:
+            return super().get_best_move(board, side, difficulty, time_limit, max_depth)
+        self.tt.new_search()
+        self.nodes = 0
+        self.completed_depth = 0
+        self.stats = SearchStats() if self.instrument else None
+        deadline = time.time() + time_limit if time_limit is not None else None
+        if max_depth is None:
+            max_depth = MAX_DEPTH if time_limit is not None else difficulty_depth(side, difficulty)
+
+        moves = board.get_all_moves(side)
+        if not moves:
+            return None
+        if self.book is not None:
+            move = self.book.lookup(board, side, moves)
+            if move is not None:
+                return move
+        move = self.cached_move(board, side, max_depth, moves)
+        if move is not None:
+            return move
+        entry = self.tt.probe(board.side_key(side))
+        moves = self.order_moves(moves, side, 0, entry[4] if entry is not None else None)
+        best_move = moves[0]
+        best_value = None
+        try:
+            for depth in range(1, max_depth + 1):
+                move, value = self.search_root_parallel(board, side, depth, moves, deadline)
+                best_move, best_value = move, value
+                self.iteration_done(depth, move, value)
+                self.tt.store(board.side_key(side), depth, EXACT, value, move)
+                moves.remove(move)
+                moves.insert(0, move)
+        except SearchTimeout:
+            pass
+        finally:
+            if self.stats is not None:
+                self.stats.finish(self.nodes)
+        self.remember(board, side, best_move, best_value)
+        return best_move
+
+
+_ponder_search = None
+
+
+class _PonderSearch(Search):
+    # The deadline and a generation number live in shared memory, so the
+    # parent can extend the deadline on a ponder hit or abort a stale search
+    # by bumping the generation.
+    def __init__(self, control, tt=None, tablebase=None, evaluator=None):
+        super().__init__(tt, tablebase, evaluator=evaluator)
+        self.control = control
+        self.generation = 0
+
+    def check_time(self):
+        if self.control[1] != self.generation or time.time() >= self.control[0]:
+            raise SearchTimeout()
+
+
+def _init_ponder_worker(control, tt_mb, tablebase_path, weights_path=None):
+    global _ponder_search
+    tablebase = Tablebase(tablebase_path) if tablebase_path else None
+    evaluator = Evaluator(weights_path) if weights_path else None
+    _ponder_search = _PonderSearch(control, TranspositionTable(tt_mb), tablebase, evaluator)
+
+
+def _ponder(position, side, max_depth, generation):
+    search = _ponder_search
+    search.generation = generation
+    # A time limit is passed only so that check_time runs; the real deadline
+    # is the shared one.
+    move = search.get_best_move(BitBoard(*position), side, time_limit=float(1 << 30), max_depth=max_depth)
+    return move, search.completed_depth, search.nodes
+
+
+class Ponderer:
+    # Searches the position after the predicted reply in a background process
+    # while the opponent thinks.  resolve() keeps that work when the reply
+    # was predicted and aborts it otherwise.
+    def __init__(self, tt_mb=64, tablebase=None, max_time=60.0, evaluator=None):
+        self.tt_mb = tt_mb
+        self.tablebase = tablebase
+        self.evaluator = evaluator
+        self.max_time = max_time
+        self.control = None
+        self.generation = 0
+        self.pool = None
+        self.future = None
+        self.key = None
+        self.started = None
+        self.hits = self.misses = 0
+
+    def start_pool(self):
+        if self.pool is None:
+            self.control = multiprocessing.Array('d', [0.0, 0.0])
+            self.pool = ProcessPoolExecutor(1, initializer=_init_ponder_worker,
+                                            initargs=(self.control, self.tt_mb,
+                                                      self.tablebase.path if self.tablebase else None,
+                                                      self.evaluator.path if self.evaluator else None))
+        return self.pool
+
+    def close(self):
+        self.stop()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def __enter__(self):
+        self.start_pool()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def predict(self, search, board, side):
+        # The reply the last search expected, from its transposition table,
+        # or failing that a shallow search of the opponent's options.
+        line = search.principal_variation(board, 1 - side, 1)
+        if line:
+            return line[0]
+        return Search(TranspositionTable(1)).get_best_move(board, 1 - side, max_depth=4)
+
+    def start(self, board, side, predicted, difficulty=2, time_limit=None, max_depth=None):
+        # `board` is the position after our move with the opponent (1 - side)
+        # to move, and `predicted` the reply we expect from them.
+        self.stop()
+        if predicted is None or predicted not in board.get_all_moves(1 - side):
+            return False
+        board = board.apply_move(predicted)
+        if max_depth is None:
+            max_depth = MAX_DEPTH if time_limit is not None else difficulty_depth(side, difficulty)
+        pool = self.start_pool()
+        self.generation += 1
+        with self.control.get_lock():
+            self.control[0] = time.time() + self.max_time
+            self.control[1] = self.generation
+        self.key = (board.side_key(side), max_depth)
+        self.started = time.time()
+        self.future = pool.submit(_ponder, (board.white, board.black, board.kings), side, max_depth,
+                                  self.generation)
+        return True
+
+    def stop(self):
+        if self.future is not None:
+            self.generation += 1
+            self.control[1] = self.generation
+            self.future = None
+            self.key = None
+
+    def interrupt(self):
+        # Ends a search that resolve() is waiting for: the shared deadline is
+        # moved to now, so the worker returns the move of its last completed
+        # depth.  May be called from another thread.
+        if self.control is not None:
+            self.control[0] = 0.0
+
+    def resolve(self, board, side, difficulty=2, time_limit=None, max_depth=None):
+        # Returns the pondered move on a hit, or None (after aborting the
+        # background search) when the game went elsewhere.
+        if self.future is None:
+            return None
+        if max_depth is None:
+            max_depth = MAX_DEPTH if time_limit is not None else difficulty_depth(side, difficulty)
+        if self.key != (board.side_key(side), max_depth):
+            self.misses += 1
+            self.stop()
+            return None
+        self.hits += 1
+        if time_limit is not None:
+            # Time already spent pondering counts towards this move's budget.
+            self.control[0] = max(time.time(), self.started + time_limit)
+        future = self.future
+        self.future = None
+        self.key = None
+        move, _, _ = future.result()
+        return move
@@ -0,0 +1,641 @@
+import argparse
+import asyncio
+import itertools
+import random
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from bitboard import BitBoard, WHITE, BLACK
+from history import MoveHistory
+from engine import Board, MoveInput
+from protocol import (FrameDecoder, ProtocolError, encode_payload, frame_header, hello_line, parse_hello, BINARY,
+                      TEXT, HELLO, MSG_TEXT, MSG_MOVE, MSG_SNAPSHOT, MSG_RESYNC)
+from search import Search
+from storage import Storage
+
+_engine_search = None
+
+
+def engine_move(position, side, difficulty, time_limit):
+    global _engine_search
+    if _engine_search is None:
+        _engine_search = Search()
+    board = BitBoard(*position)
+    moves = board.get_all_moves(side)
+    if not moves:
+        return None
+    move = _engine_search.get_best_move(board, side, difficulty, time_limit)
+    if move not in moves:
+        move = moves[0]
+    return move
+
+
+class Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.name = None
+        self.game = None
+        self.color = None
+        self.mode = TEXT
+        self.send_seq = 0
+        self.decoder = None
+        self.watching = None
+        # When the connection last sent something or was last asked to.
+        self.active = time.monotonic()
+
+    async def send(self, line):
+        await self.send_messages([(MSG_TEXT, line)])
+
+    async def send_messages(self, messages):
+        await self.send_encoded(EncodedMessages(messages))
+
+    async def send_encoded(self, encoded):
+        if self.writer.is_closing():
+            return
+        if self.mode == BINARY:
+            # The payload is shared; only the header carries this
+            # connection's sequence number.
+            self.writer.write(frame_header(self.send_seq, encoded.payload, len(encoded.messages)))
+            self.writer.write(encoded.payload)
+            self.send_seq = (self.send_seq + 1) & 0xFFFFFFFF
+        else:
+            self.writer.write(encoded.text)
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+
+    def set_mode(self, mode):
+        self.mode = mode
+        self.decoder = FrameDecoder() if mode == BINARY else None
+
+    def close(self):
+        if not self.writer.is_closing():
+            self.writer.close()
+
+
+def text_lines(message):
+    if message[0] == MSG_TEXT:
+        return message[1] + "\n"
+    if message[0] == MSG_MOVE:
+        path = message[1]
+        return "".join(f"MOVE {start[0]} {start[1]} {end[0]} {end[1]}\n" for start, end in zip(path, path[1:]))
+    if message[0] == MSG_SNAPSHOT:
+        _, turn, size, cells = message
+        return f"BOARD {('white', 'black')[turn]} {size} {''.join(str(cell) for cell in cells)}\n"
+    return ""
+
+
+async def read_line(reader):
+    # readline gives up with ValueError once a line outgrows the stream's
+    # buffer limit (64 KiB by default); no command is anywhere near that.
+    try:
+        return await reader.readline()
+    except ValueError:
+        raise ProtocolError("Line too long")
+
+
+class EncodedMessages:
+    # A group of messages serialized at most once per wire format, however
+    # many connections it is sent to.
+    def __init__(self, messages):
+        self.messages = messages
+        self._payload = None
+        self._text = None
+
+    @property
+    def payload(self):
+        if self._payload is None:
+            self._payload = encode_payload(self.messages)
+        return self._payload
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = "".join(text_lines(message) for message in self.messages).encode()
+        return self._text
+
+
+class Spectator:
+    # One watcher's stream of a game.  Broadcasts are queued here and written
+    # by the spectator's own task, so a slow reader never holds up the game
+    # or the other watchers.  When more than max_queue broadcasts are
+    # waiting, the backlog is thrown away and replaced by a snapshot of the
+    # position at the time it is sent; a spectator that falls behind more
+    # than max_resyncs times without catching up in between is disconnected.
+    def __init__(self, connection, game, max_queue=64, max_resyncs=3):
+        self.connection = connection
+        self.game = game
+        self.max_queue = max_queue
+        self.max_resyncs = max_resyncs
+        self.queue = deque()
+        self.resync = True
+        self.resyncs = 0
+        self.finished = False
+        self.ready = asyncio.Event()
+        self.ready.set()
+        self.task = asyncio.create_task(self.run())
+
+    def push(self, encoded):
+        if self.resync:
+            # The snapshot still to be sent already includes this.
+            return
+        if len(self.queue) >= self.max_queue:
+            self.queue.clear()
+            self.resyncs += 1
+            if self.resyncs > self.max_resyncs:
+                self.drop()
+                return
+            self.resync = True
+        else:
+            self.queue.append(encoded)
+        self.ready.set()
+
+    def drop(self):
+        self.game.spectators.discard(self)
+        self.connection.watching = None
+        self.task.cancel()
+        self.connection.close()
+
+    def request_snapshot(self):
+        self.queue.clear()
+        self.resync = True
+        self.ready.set()
+
+    def finish(self):
+        # Ends the stream once everything queued has been written.
+        self.finished = True
+        self.ready.set()
+
+    async def run(self):
+        connection = self.connection
+        while not connection.writer.is_closing():
+            await self.ready.wait()
+            self.ready.clear()
+            while self.resync or self.queue:
+                if self.resync:
+                    self.resync = False
+                    await connection.send_messages(self.game.position_messages())
+                else:
+                    await connection.send_encoded(self.queue.popleft())
+            # Caught up: only lagging again and again in a row gets a
+            # spectator disconnected.
+            self.resyncs = 0
+            if self.finished:
+                break
+
+
+class EnginePlayer:
+    def __init__(self, difficulty=2, time_limit=1.0):
+        self.difficulty = difficulty
+        self.time_limit = time_limit
+        self.name = f"engine level {difficulty}"
+        self.game = None
+        self.color = None
+
+    async def send(self, line):
+        pass
+
+    async def send_messages(self, messages):
+        pass
+
+    def close(self):
+        pass
+
+
+class ServerGame:
+    def __init__(self, game_id, white, black):
+        self.id = game_id
+        self.board = Board()
+        self.players = {"white": white, "black": black}
+        self.current_turn = "white"
+        self.history = MoveHistory(self.board, self.current_turn)
+        self.move_input = None
+        self.move_count = 0
+        self.finished = False
+        self.result = None
+        self.spectators = set()
+        for color, player in self.players.items():
+            player.game = self
+            player.color = color
+
+    def opponent(self, color):
+        return self.players["black" if color == "white" else "white"]
+
+    async def broadcast(self, line):
+        for player in self.players.values():
+            await player.send(line)
+
+    def publish(self, messages):
+        # Encoded once for every spectator.
+        encoded = EncodedMessages(messages)
+        for spectator in list(self.spectators):
+            spectator.push(encoded)
+
+    def position_messages(self):
+        messages = [self.snapshot()]
+        if self.result is not None:
+            messages.append((MSG_TEXT, self.result))
+        elif not self.finished:
+            messages.append((MSG_TEXT, f"TURN {self.current_turn}"))
+        return messages
+
+    def snapshot(self):
+        return MSG_SNAPSHOT, ("white", "black").index(self.current_turn), self.board.size, self.board.cells()
+
+    def check_move(self, color, start_row, start_col, end_row, end_col):
+        if self.finished:
+            return "Game is over"
+        if color != self.current_turn:
+            return "Not your turn"
+        if not (0 <= start_row < self.board.size and 0 <= start_col < self.board.size):
+            return "Invalid move"
+        piece = self.board.board[start_row][start_col]
+        if piece is None or piece.color != color:
+            return "No piece of yours at start position"
+        if not self.board.valid_move(start_row, start_col, end_row, end_col):
+            return "Invalid move"
+        return None
+
+    def check_hop(self, move_input, start_row, start_col, end_row, end_col):
+        # Returns (error, done) for the next hop of the move being entered.
+        done = move_input.add(start_row, start_col, end_row, end_col)
+        if done is not None:
+            return None, done
+        if move_input.path and move_input.path[-2:] != (start_row, start_col):
+            return "You must continue capturing with the same piece", False
+        if abs(start_row - end_row) == 1 and move_input.moves and abs(move_input.moves[0][0] - move_input.moves[0][2]) == 2:
+            return "You must capture", False
+        return "Invalid move", False
+
+    def play(self, color, start_row, start_col, end_row, end_col, done):
+        undo = self.board.make_move(start_row, start_col, end_row, end_col)
+        self.move_count += 1
+        if done:
+            self.current_turn = "black" if color == "white" else "white"
+        self.history.record(self.board, undo, color, self.current_turn)
+
+    def apply_move(self, color, start_row, start_col, end_row, end_col):
+        return self.apply_path(color, [(start_row, start_col), (end_row, end_col)])
+
+    def apply_path(self, color, path):
+        # A multi-jump arrives as one path and is applied all or nothing.  A
+        # peer that sends it hop by hop keeps the turn until the jump is done.
+        if len(path) < 2:
+            return "Invalid move"
+        move_input = self.move_input or MoveInput(self.board, color)
+        saved = (move_input.path, self.move_count)
+        error = None
+        done = False
+        applied = 0
+        for (start_row, start_col), (end_row, end_col) in zip(path, path[1:]):
+            error = "Invalid move" if done else self.check_move(color, start_row, start_col, end_row, end_col)
+            if not error:
+                error, done = self.check_hop(move_input, start_row, start_col, end_row, end_col)
+            if error:
+                break
+            self.play(color, start_row, start_col, end_row, end_col, done)
+            applied += 1
+        if error:
+            for _ in range(applied):
+                self.current_turn = self.history.undo_hop(self.board)
+            move_input.path, self.move_count = saved
+            return error
+        self.move_input = None if done else move_input
+        return None
+
+
+class GameServer:
+    def __init__(self, host="0.0.0.0", port=12345, idle_timeout=300.0, engine_workers=None,
+                 engine_difficulty=2, engine_time_limit=1.0, storage=None, spectator_queue=64,
+                 spectator_resyncs=3):
+        self.host = host
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self.engine_workers = engine_workers
+        self.engine_difficulty = engine_difficulty
+        self.engine_time_limit = engine_time_limit
+        self.storage = storage
+        self.spectator_queue = spectator_queue
+        self.spectator_resyncs = spectator_resyncs
+        self.lobby = deque()
+        self.connections = set()
+        self.games = {}
+        self.game_ids = itertools.count(1)
+        self.engine_pool = None
+        self.server = None
+
+    async def start(self):
+        self.engine_pool = ProcessPoolExecutor(self.engine_workers)
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        return self.server
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            self.engine_pool.shutdown(cancel_futures=True)
+            if self.storage is not None:
+                self.storage.close()
+
+    async def close(self):
+        self.server.close()
+        for connection in list(self.connections):
+            connection.close()
+        await self.server.wait_closed()
+        self.engine_pool.shutdown(cancel_futures=True)
+        if self.storage is not None:
+            self.storage.close()
+
+    async def handle_client(self, reader, writer):
+        connection = Connection(reader, writer)
+        self.connections.add(connection)
+        await connection.send("WELCOME")
+        try:
+            while True:
+                try:
+                    if connection.mode == BINARY:
+                        data = await asyncio.wait_for(reader.read(65536), self.read_timeout(connection))
+                    else:
+                        data = await asyncio.wait_for(read_line(reader), self.read_timeout(connection))
+                except asyncio.TimeoutError:
+                    if self.waiting_on_server(connection) or time.monotonic() - connection.active < self.idle_timeout:
+                        continue
+                    await connection.send("ERROR Idle timeout")
+                    break
+                if not data:
+                    break
+                connection.active = time.monotonic()
+                if connection.mode == BINARY:
+                    if not await self.handle_frames(connection, data):
+                        break
+                elif not await self.handle_command(connection, data.decode(errors="replace").split()):
+                    break
+        except ConnectionError:
+            pass
+        except ProtocolError as e:
+            await connection.send(f"ERROR {e}")
+        finally:
+            await self.disconnect(connection)
+
+    def waiting_on_server(self, connection):
+        # Spectators, players in the lobby and players waiting for their
+        # opponent have nothing to send, however long that takes.
+        game = connection.game
+        return (connection.watching is not None or connection in self.lobby
+                or (game is not None and not game.finished and game.current_turn != connection.color))
+
+    def read_timeout(self, connection):
+        # The idle timeout counts from the connection's last input or from
+        # the start of its turn, whichever is later.  A connection waiting
+        # on the server is checked again after a full timeout.
+        if self.waiting_on_server(connection):
+            return self.idle_timeout
+        return max(0.0, connection.active + self.idle_timeout - time.monotonic())
+
+    def start_turn(self, game):
+        player = game.players[game.current_turn]
+        if isinstance(player, Connection):
+            player.active = time.monotonic()
+
+    async def handle_frames(self, connection, data):
+        for seq, messages in connection.decoder.feed(data):
+            if not connection.decoder.check_seq(seq):
+                if connection.game is not None:
+                    await connection.send_messages([(MSG_TEXT, "ERROR Frames out of sequence"),
+                                                    connection.game.snapshot()])
+                elif connection.watching is not None:
+                    connection.watching.request_snapshot()
+            for message in messages:
+                if message[0] == MSG_TEXT:
+                    if not await self.handle_command(connection, message[1].split()):
+                        return False
+                elif message[0] == MSG_MOVE:
+                    await self.handle_move(connection, message[1])
+                elif message[0] == MSG_RESYNC:
+                    await self.send_snapshot(connection)
+        return True
+
+    async def handle_command(self, connection, words):
+        if not words:
+            return True
+        command = words[0].upper()
+        if command.lstrip("-").isdigit():
+            command, words = "MOVE", ["MOVE"] + words
+        if command == HELLO.decode():
+            mode = parse_hello(" ".join(words))
+            await connection.send(hello_line(mode).decode().rstrip("\n"))
+            connection.set_mode(mode)
+        elif command == "PLAY":
+            if connection.game is not None:
+                await connection.send("ERROR Already in a game")
+                return True
+            self.unwatch(connection)
+            if len(words) > 1 and words[1].upper() == "AI":
+                difficulty = int(words[2]) if len(words) > 2 and words[2].isdigit() else self.engine_difficulty
+                await self.start_game(connection, EnginePlayer(difficulty, self.engine_time_limit))
+            else:
+                await self.join_lobby(connection)
+        elif command == "MOVE":
+            try:
+                numbers = [int(word) for word in words[1:]]
+            except ValueError:
+                numbers = []
+            if len(numbers) < 4 or len(numbers) % 2:
+                await connection.send("ERROR Expected MOVE start_row start_col end_row end_col [row col ...]")
+                return True
+            await self.handle_move(connection, list(zip(numbers[::2], numbers[1::2])))
+        elif command == "GAMES":
+            lines = [f"GAME {game.id} {game.players['white'].name or '-'} {game.players['black'].name or '-'} "
+                     f"{game.move_count} {len(game.spectators)}" for game in self.games.values()]
+            await connection.send_messages([(MSG_TEXT, line) for line in lines + ["GAMES END"]])
+        elif command == "WATCH":
+            game = self.games.get(int(words[1])) if len(words) == 2 and words[1].isdigit() else None
+            if connection.game is not None:
+                await connection.send("ERROR Already in a game")
+            elif game is None:
+                await connection.send("ERROR No such game")
+            else:
+                await self.watch(connection, game)
+        elif command == "UNWATCH":
+            self.unwatch(connection)
+        elif command == "SYNC":
+            await self.send_snapshot(connection)
+        elif command == "RESIGN":
+            if connection.game is not None:
+                await self.end_game(connection.game, "black" if connection.color == "white" else "white", "resignation")
+        elif command == "NAME":
+            if len(words) != 2:
+                await connection.send("ERROR Expected NAME <name>")
+            elif connection.game is not None:
+                await connection.send("ERROR Already in a game")
+            else:
+                connection.name = words[1]
+                await connection.send(f"NAME {connection.name}")
+        elif command == "LEADERBOARD":
+            if self.storage is None:
+                await connection.send("ERROR No leaderboard on this server")
+            else:
+                lines = [f"RANK {rank} {player['name']} {player['rating']:.0f} {player['wins']} {player['losses']} "
+                         f"{player['draws']}" for rank, player in enumerate(self.storage.leaderboard(), start=1)]
+                await connection.send_messages([(MSG_TEXT, line) for line in lines + ["LEADERBOARD END"]])
+        elif command == "PING":
+            await connection.send("PONG")
+        elif command == "QUIT":
+            return False
+        else:
+            await connection.send(f"ERROR Unknown command {words[0]}")
+        return True
+
+    async def join_lobby(self, connection):
+        while self.lobby:
+            opponent = self.lobby.popleft()
+            if opponent is not connection and not opponent.writer.is_closing():
+                await self.start_game(connection, opponent)
+                return
+        self.lobby.append(connection)
+        await connection.send("WAITING")
+
+    async def start_game(self, first, second):
+        white, black = (first, second) if random.random() < 0.5 else (second, first)
+        game = ServerGame(next(self.game_ids), white, black)
+        self.games[game.id] = game
+        self.start_turn(game)
+        for color, player in game.players.items():
+            messages = [(MSG_TEXT, f"START {game.id} {color}"), (MSG_TEXT, "TURN white")]
+            if getattr(player, "mode", TEXT) == BINARY:
+                messages.insert(1, game.snapshot())
+            await player.send_messages(messages)
+        await self.maybe_engine_move(game)
+
+    async def watch(self, connection, game):
+        self.unwatch(connection)
+        await connection.send(f"WATCHING {game.id} {game.players['white'].name or '-'} "
+                              f"{game.players['black'].name or '-'}")
+        # The spectator's first message is a snapshot, then every move after it.
+        connection.watching = Spectator(connection, game, self.spectator_queue, self.spectator_resyncs)
+        game.spectators.add(connection.watching)
+
+    def unwatch(self, connection):
+        spectator = connection.watching
+        if spectator is not None:
+            spectator.game.spectators.discard(spectator)
+            spectator.task.cancel()
+            connection.watching = None
+
+    async def send_snapshot(self, connection):
+        if connection.watching is not None:
+            connection.watching.request_snapshot()
+        elif connection.game is None:
+            await connection.send("ERROR Not in a game")
+        else:
+            await connection.send_messages([connection.game.snapshot()])
+
+    async def handle_move(self, connection, path):
+        game = connection.game
+        if game is None:
+            await connection.send("ERROR Not in a game")
+            return
+        error = game.apply_path(connection.color, path)
+        if error:
+            await connection.send(f"ERROR {error}")
+            return
+        await self.after_move(game, path)
+
+    async def after_move(self, game, path):
+        winner = game.board.get_winner()
+        messages = [(MSG_MOVE, path)]
+        if not winner:
+            messages.append((MSG_TEXT, f"TURN {game.current_turn}"))
+        game.publish(messages)
+        self.start_turn(game)
+        for player in game.players.values():
+            await player.send_messages(messages)
+        if winner:
+            await self.end_game(game, winner, "no pieces or moves")
+            return
+        await self.maybe_engine_move(game)
+
+    async def maybe_engine_move(self, game):
+        player = game.players[game.current_turn]
+        if game.finished or not isinstance(player, EnginePlayer):
+            return
+        position = BitBoard.from_board(game.board)
+        side = WHITE if game.current_turn == "white" else BLACK
+        loop = asyncio.get_running_loop()
+        move = await loop.run_in_executor(self.engine_pool, engine_move,
+                                          (position.white, position.black, position.kings), side,
+                                          player.difficulty, player.time_limit)
+        if game.finished:
+            return
+        move = game.board.find_move(player.color, move) if move is not None else None
+        path = [move[index:index + 2] for index in range(0, len(move), 2)] if move else []
+        if move is None or game.apply_path(player.color, path):
+            await self.end_game(game, "black" if player.color == "white" else "white", "engine has no move")
+            return
+        await self.after_move(game, path)
+
+    async def end_game(self, game, winner, reason):
+        if game.finished:
+            return
+        game.finished = True
+        self.games.pop(game.id, None)
+        if self.storage is not None:
+            # Players that never sent NAME only count in the totals.
+            self.storage.record_result(game.players["white"].name, game.players["black"].name, winner, "server")
+        game.result = f"END {winner} {reason}"
+        game.publish([(MSG_TEXT, game.result)])
+        for spectator in game.spectators:
+            spectator.connection.watching = None
+            spectator.connection.active = time.monotonic()
+            spectator.finish()
+        game.spectators.clear()
+        await game.broadcast(game.result)
+        for player in game.players.values():
+            player.game = None
+            player.color = None
+
+    async def disconnect(self, connection):
+        self.connections.discard(connection)
+        if connection in self.lobby:
+            self.lobby.remove(connection)
+        if connection.game is not None:
+            game = connection.game
+            await self.end_game(game, "black" if connection.color == "white" else "white", "opponent left")
+        self.unwatch(connection)
+        connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host networked checkers games.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("--idle-timeout", type=float, default=300.0)
+    parser.add_argument("--engine-workers", type=int, default=None)
+    parser.add_argument("--engine-difficulty", type=int, default=2)
+    parser.add_argument("--engine-time-limit", type=float, default=1.0)
+    parser.add_argument("--db", default="checkers.db", help="SQLite file for results and ratings ('' to disable)")
+    parser.add_argument("--spectator-queue", type=int, default=64,
+                        help="broadcasts a spectator may fall behind before it is resynced")
+    parser.add_argument("--spectator-resyncs", type=int, default=3,
+                        help="resyncs in a row after which a lagging spectator is disconnected")
+    args = parser.parse_args(argv)
+
+    server = GameServer(args.host, args.port, args.idle_timeout, args.engine_workers,
+                        args.engine_difficulty, args.engine_time_limit, Storage(args.db) if args.db else None,
+                        args.spectator_queue, args.spectator_resyncs)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
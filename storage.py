@@ -0,0 +1,195 @@
+import bisect
+import sqlite3
+import threading
+import time
+
+DEFAULT_RATING = 1500.0
+K_FACTOR = 32
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    name TEXT PRIMARY KEY,
+    wins INTEGER NOT NULL DEFAULT 0,
+    losses INTEGER NOT NULL DEFAULT 0,
+    draws INTEGER NOT NULL DEFAULT 0,
+    rating REAL NOT NULL DEFAULT 1500
+);
+CREATE INDEX IF NOT EXISTS players_rating ON players (rating DESC, name);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    white TEXT,
+    black TEXT,
+    outcome TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    played REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_white ON results (white);
+CREATE INDEX IF NOT EXISTS results_black ON results (black);
+CREATE TABLE IF NOT EXISTS totals (
+    mode TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    games INTEGER NOT NULL,
+    PRIMARY KEY (mode, outcome)
+);
+"""
+
+
+def expected_score(rating, opponent):
+    return 1 / (1 + 10 ** ((opponent - rating) / 400))
+
+
+class Storage:
+    # Player records, game results and win totals in SQLite (WAL mode, so
+    # readers never wait for the writer).  Results are applied to the
+    # in-memory view at once and written in batches: when batch_size results
+    # are pending, and otherwise by a background thread every flush_interval
+    # seconds.  Player rows are written as increments, so several processes
+    # can share one database without overwriting each other's results.
+    #
+    # The leaderboard is a sorted list of the top_n (-rating, name) pairs,
+    # updated as ratings change.  The database is only queried when a player
+    # drops out of a full list and the next one down has to be found.
+    def __init__(self, path="checkers.db", batch_size=64, flush_interval=2.0, top_n=10):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.top_n = top_n
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.players = {}
+        self.deltas = {}
+        self.results = []
+        self.totals = {(mode, outcome): games for mode, outcome, games in self.db.execute("SELECT * FROM totals")}
+        self.total_deltas = {}
+        self.top = []
+        self.refill_top()
+        self.closed = threading.Event()
+        self.flusher = threading.Thread(target=self.run_flusher, daemon=True)
+        self.flusher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def player(self, name):
+        # [wins, losses, draws, rating], read from the database the first
+        # time a player is seen.
+        with self.lock:
+            record = self.players.get(name)
+            if record is None:
+                row = self.db.execute("SELECT wins, losses, draws, rating FROM players WHERE name = ?",
+                                      (name,)).fetchone()
+                record = self.players[name] = list(row) if row else [0, 0, 0, DEFAULT_RATING]
+            return record
+
+    def adjust(self, name, wins=0, losses=0, draws=0, rating=0.0):
+        record = self.player(name)
+        delta = self.deltas.setdefault(name, [0, 0, 0, 0.0])
+        for index, change in enumerate((wins, losses, draws, rating)):
+            record[index] += change
+            delta[index] += change
+        self.update_top(name, record[3])
+
+    def record_result(self, white, black, winner, mode="single"):
+        # `white` and `black` are player names; None for a side that is not
+        # tracked (it still counts in the totals).  `winner` is "white",
+        # "black" or anything else for a draw.
+        outcome = winner if winner in ("white", "black") else "draw"
+        with self.lock:
+            self.results.append((white, black, outcome, mode, time.time()))
+            key = (mode, outcome)
+            self.totals[key] = self.totals.get(key, 0) + 1
+            self.total_deltas[key] = self.total_deltas.get(key, 0) + 1
+            scores = {"white": (1.0, 0.0), "black": (0.0, 1.0), "draw": (0.5, 0.5)}[outcome]
+            change = [0.0, 0.0]
+            if white is not None and black is not None and white != black:
+                white_rating, black_rating = self.player(white)[3], self.player(black)[3]
+                change = [K_FACTOR * (scores[0] - expected_score(white_rating, black_rating)),
+                          K_FACTOR * (scores[1] - expected_score(black_rating, white_rating))]
+            for name, score, rating in ((white, scores[0], change[0]), (black, scores[1], change[1])):
+                if name is not None:
+                    self.adjust(name, wins=int(score == 1.0), losses=int(score == 0.0), draws=int(score == 0.5),
+                                rating=rating)
+            if len(self.results) >= self.batch_size:
+                self.flush()
+
+    def import_profiles(self, profiles):
+        # The old profiles.json: {name: {"wins": n, "losses": n}}.
+        with self.lock:
+            for name, profile in profiles.items():
+                self.adjust(name, wins=profile.get("wins", 0), losses=profile.get("losses", 0),
+                            draws=profile.get("draws", 0))
+            self.flush()
+
+    def stats(self, mode="single"):
+        with self.lock:
+            return {"white_wins": self.totals.get((mode, "white"), 0),
+                    "black_wins": self.totals.get((mode, "black"), 0),
+                    "draws": self.totals.get((mode, "draw"), 0)}
+
+    def update_top(self, name, rating):
+        # Everyone outside a full list ranks below its last entry, so a key
+        # at or above that entry belongs in the list.
+        last = self.top[-1] if len(self.top) >= self.top_n else None
+        removed = False
+        for index, (_, entry) in enumerate(self.top):
+            if entry == name:
+                del self.top[index]
+                removed = True
+                break
+        key = (-rating, name)
+        if last is None or key <= last:
+            bisect.insort(self.top, key)
+            del self.top[self.top_n:]
+        elif removed:
+            # The player fell out of a full list; the next one down comes
+            # from the rating index.
+            self.refill_top()
+
+    def refill_top(self):
+        self.flush()
+        rows = self.db.execute("SELECT name, rating FROM players ORDER BY rating DESC, name LIMIT ?", (self.top_n,))
+        self.top = sorted((-self.player(name)[3], name) for name, rating in rows.fetchall())
+
+    def leaderboard(self):
+        with self.lock:
+            return [dict(zip(("name", "wins", "losses", "draws", "rating"), [name] + self.player(name)))
+                    for _, name in self.top]
+
+    def flush(self):
+        with self.lock:
+            if not (self.results or self.deltas or self.total_deltas):
+                return
+            with self.db:
+                self.db.executemany("INSERT INTO results (white, black, outcome, mode, played) VALUES (?, ?, ?, ?, ?)",
+                                    self.results)
+                self.db.executemany(
+                    "INSERT INTO players (name, wins, losses, draws, rating) VALUES (?, ?, ?, ?, ? + ?) "
+                    "ON CONFLICT (name) DO UPDATE SET wins = wins + excluded.wins, losses = losses + excluded.losses, "
+                    "draws = draws + excluded.draws, rating = rating + excluded.rating - ?",
+                    [(name, wins, losses, draws, DEFAULT_RATING, rating, DEFAULT_RATING)
+                     for name, (wins, losses, draws, rating) in self.deltas.items()])
+                self.db.executemany(
+                    "INSERT INTO totals (mode, outcome, games) VALUES (?, ?, ?) "
+                    "ON CONFLICT (mode, outcome) DO UPDATE SET games = games + excluded.games",
+                    [key + (games,) for key, games in self.total_deltas.items()])
+            self.results = []
+            self.deltas = {}
+            self.total_deltas = {}
+
+    def run_flusher(self):
+        while not self.closed.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        self.flusher.join()
+        self.flush()
+        self.db.close()
@@ -0,0 +1,288 @@
+import argparse
+import mmap
+import struct
+import sys
+import time
+from array import array
+from itertools import combinations
+
+from bitboard import BitBoard, WHITE, BLACK, TOP_ROW, BOTTOM_ROW, RULES_VERSION
+
+MAGIC = b"CKTB"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHHI")
+SLICE = struct.Struct("<4BQI")
+
+DRAW = 0
+WIN = 1
+LOSS = 2
+MAX_DISTANCE = 127
+
+BINOMIAL = [[0] * 33 for _ in range(33)]
+for _n in range(33):
+    BINOMIAL[_n][0] = 1
+    for _k in range(1, _n + 1):
+        BINOMIAL[_n][_k] = BINOMIAL[_n - 1][_k - 1] + BINOMIAL[_n - 1][_k]
+
+# Each table entry is one byte for the side to move: 0 is a draw, 1-127 a
+# win in that many plies and 128-255 a loss in (value - 128) plies.  Longer
+# distances are clamped to MAX_DISTANCE.
+
+
+def encode(result, distance):
+    if result == WIN:
+        return min(distance, MAX_DISTANCE)
+    if result == LOSS:
+        return 128 + min(distance, MAX_DISTANCE)
+    return 0
+
+
+def decode(value):
+    if value == 0:
+        return DRAW, 0
+    if value < 128:
+        return WIN, value
+    return LOSS, value - 128
+
+
+def position_groups(board):
+    men = ~board.kings
+    return (board.white & men, board.white & board.kings, board.black & men, board.black & board.kings)
+
+
+def material(groups):
+    return tuple(bits.bit_count() for bits in groups)
+
+
+def slice_size(counts):
+    size = 1
+    free = 32
+    for count in counts:
+        size *= BINOMIAL[free][count]
+        free -= count
+    return size
+
+
+def position_rank(groups):
+    # Pieces are placed group by group (white men, white kings, black men,
+    # black kings), each group choosing from the squares still free, and the
+    # choice is ranked in colexicographic order.
+    rank = 0
+    occupied = 0
+    free = 32
+    for bits in groups:
+        count = 0
+        sub = 0
+        rest = bits
+        while rest:
+            low = rest & -rest
+            square = low.bit_length() - 1
+            count += 1
+            sub += BINOMIAL[square - (occupied & (low - 1)).bit_count()][count]
+            rest ^= low
+        rank = rank * BINOMIAL[free][count] + sub
+        occupied |= bits
+        free -= count
+    return rank
+
+
+def iter_slice(counts, index=0, free=0xFFFFFFFF, groups=()):
+    if index == len(counts):
+        yield groups
+        return
+    squares = [square for square in range(32) if free >> square & 1]
+    for chosen in combinations(squares, counts[index]):
+        bits = 0
+        for square in chosen:
+            bits |= 1 << square
+        yield from iter_slice(counts, index + 1, free & ~bits, groups + (bits,))
+
+
+def slice_order(max_pieces):
+    slices = []
+    for total in range(2, max_pieces + 1):
+        for white in range(1, total):
+            black = total - white
+            for white_men in range(white + 1):
+                for black_men in range(black + 1):
+                    slices.append((white_men, white - white_men, black_men, black - black_men))
+    # Captures lead to fewer pieces and promotions to fewer men, so solving by
+    # piece count and then by number of men only ever needs finished slices.
+    slices.sort(key=lambda counts: (sum(counts), counts[0] + counts[2]))
+    return slices
+
+
+def solve_slice(counts, tables):
+    size = slice_size(counts)
+    nodes = 2 * size
+    values = bytearray(nodes)
+    win_distance = array('H', bytes(2 * nodes))
+    loss_distance = array('H', bytes(2 * nodes))
+    remaining = array('H', bytes(2 * nodes))
+    sources = array('I')
+    targets = array('I')
+    buckets = {}
+
+    for groups in iter_slice(counts):
+        white_men, white_kings, black_men, black_kings = groups
+        if white_men & TOP_ROW or black_men & BOTTOM_ROW:
+            continue
+        rank = position_rank(groups)
+        board = BitBoard(white_men | white_kings, black_men | black_kings, white_kings | black_kings)
+        for side in (WHITE, BLACK):
+            node = side * size + rank
+            best_win = 0
+            worst_loss = 0
+            open_moves = 0
+            for move in board.get_all_moves(side):
+                undo = board.make_move(move)
+                if not board.white or not board.black:
+                    best_win = 1
+                else:
+                    child_groups = position_groups(board)
+                    child_counts = material(child_groups)
+                    child_rank = position_rank(child_groups)
+                    if child_counts == counts:
+                        sources.append(node)
+                        targets.append((1 - side) * size + child_rank)
+                        open_moves += 1
+                    else:
+                        result, distance = decode(tables[child_counts][(1 - side) * slice_size(child_counts) + child_rank])
+                        if result == LOSS:
+                            if not best_win or distance + 1 < best_win:
+                                best_win = distance + 1
+                        elif result == WIN:
+                            worst_loss = max(worst_loss, distance + 1)
+                        else:
+                            open_moves += 1
+                board.unmake_move(undo)
+            remaining[node] = open_moves
+            loss_distance[node] = worst_loss
+            if best_win:
+                win_distance[node] = best_win
+                buckets.setdefault(best_win, []).append(node)
+            elif not open_moves:
+                buckets.setdefault(worst_loss, []).append(node)
+
+    # Predecessor lists in compressed form: the parents of node n are
+    # parents[offsets[n]:offsets[n + 1]].
+    offsets = array('I', bytes(4 * (nodes + 1)))
+    for target in targets:
+        offsets[target + 1] += 1
+    for node in range(nodes):
+        offsets[node + 1] += offsets[node]
+    fill = array('I', offsets)
+    parents = array('I', bytes(4 * len(targets)))
+    for source, target in zip(sources, targets):
+        parents[fill[target]] = source
+        fill[target] += 1
+    del sources, targets, fill
+
+    decided = bytearray(nodes)
+    distance = 0
+    while buckets:
+        for node in buckets.pop(distance, ()):
+            if decided[node]:
+                continue
+            if win_distance[node] and win_distance[node] == distance:
+                result = WIN
+            elif not win_distance[node] and not remaining[node] and loss_distance[node] == distance:
+                result = LOSS
+            else:
+                continue
+            decided[node] = 1
+            values[node] = encode(result, distance)
+            for parent in parents[offsets[node]:offsets[node + 1]]:
+                if decided[parent]:
+                    continue
+                if result == LOSS:
+                    if not win_distance[parent] or distance + 1 < win_distance[parent]:
+                        win_distance[parent] = distance + 1
+                        buckets.setdefault(distance + 1, []).append(parent)
+                else:
+                    remaining[parent] -= 1
+                    loss_distance[parent] = max(loss_distance[parent], distance + 1)
+                    if not remaining[parent] and not win_distance[parent]:
+                        buckets.setdefault(loss_distance[parent], []).append(parent)
+        distance += 1
+    return values
+
+
+def generate(path, max_pieces=4, progress=None):
+    if not 2 <= max_pieces <= 8:
+        raise ValueError("max_pieces must be between 2 and 8")
+    tables = {}
+    for counts in slice_order(max_pieces):
+        started = time.monotonic()
+        tables[counts] = solve_slice(counts, tables)
+        if progress is not None:
+            progress(counts, slice_size(counts), time.monotonic() - started)
+
+    offset = HEADER.size + SLICE.size * len(tables)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, RULES_VERSION, max_pieces, len(tables)))
+        for counts, values in tables.items():
+            f.write(SLICE.pack(*counts, offset, len(values) // 2))
+            offset += len(values)
+        for values in tables.values():
+            f.write(values)
+
+
+class Tablebase:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, rules, self.max_pieces, count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a checkers tablebase")
+        if rules != RULES_VERSION:
+            self.close()
+            raise ValueError(f"{path} was generated for different move rules")
+        self.slices = {}
+        for index in range(count):
+            *counts, offset, size = SLICE.unpack_from(self.data, HEADER.size + index * SLICE.size)
+            self.slices[tuple(counts)] = (offset, size)
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def probe(self, board, side):
+        if (board.white | board.black).bit_count() > self.max_pieces:
+            return None
+        groups = position_groups(board)
+        entry = self.slices.get(material(groups))
+        if entry is None:
+            return None
+        offset, size = entry
+        return decode(self.data[offset + side * size + position_rank(groups)])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a checkers endgame tablebase by retrograde analysis.")
+    parser.add_argument("--max-pieces", type=int, default=4)
+    parser.add_argument("--output", default="tablebase.cktb")
+    args = parser.parse_args(argv)
+
+    def progress(counts, size, seconds):
+        print(f"{counts}: {size} positions per side in {seconds:.1f}s", file=sys.stderr)
+
+    generate(args.output, args.max_pieces, progress)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
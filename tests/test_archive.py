@@ -0,0 +1,68 @@
+import io
+
+import pytest
+
+from archive import (ArchiveReader, ArchiveWriter, decode_game, encode_game, history_from_game, read_pdn,
+                     write_pdn)
+from engine import Board
+from evaluation import iter_games
+from tournament import Engine, play_game, random_opening
+
+
+@pytest.fixture(scope="module")
+def game():
+    # Seed 0 plays the double jump 11x18x27.
+    game = play_game(0, Engine("a", max_depth=2), Engine("b", max_depth=3), random_opening(6, 0))
+    assert any(len(path) > 4 for path in game["moves"])
+    return game
+
+
+def moves(game):
+    return history_from_game(Board(), game).moves()
+
+
+def pdn_text(game):
+    f = io.StringIO()
+    write_pdn([game], f)
+    return f.getvalue()
+
+
+def test_archive_round_trip(game, tmp_path):
+    assert moves(decode_game(encode_game(game))) == moves(game)
+    path = tmp_path / "games.ckga"
+    with ArchiveWriter(path) as writer:
+        writer.add(game)
+        writer.add(game)
+    with ArchiveReader(path) as reader:
+        assert len(reader) == 2
+        assert all(moves(stored) == moves(game) for stored in reader)
+    # Tools pick the reader from the extension.
+    assert [moves(stored) for stored in iter_games([str(path)])] == [moves(game)] * 2
+
+
+def test_pdn_round_trip(game):
+    text = pdn_text(game)
+    assert "11x18x27" in text
+    (back,) = read_pdn(io.StringIO(text))
+    assert back["result"] == game["result"]
+    assert moves(back) == moves(game)
+    (again,) = read_pdn(io.StringIO(pdn_text(decode_game(encode_game(back)))))
+    assert moves(again) == moves(game)
+
+
+def test_pdn_short_multi_jump(game):
+    text = pdn_text(game)
+    (full,) = read_pdn(io.StringIO(text))
+    (short,) = read_pdn(io.StringIO(text.replace("11x18x27", "11x27")))
+    assert short["moves"] == full["moves"]
+
+
+@pytest.mark.parametrize("text", ["1. 22-19 *", "1. 22x6 *", "1. 5-9 *"])
+def test_pdn_rejects_illegal_moves(text):
+    with pytest.raises(ValueError):
+        list(read_pdn(io.StringIO(text)))
+
+
+def test_history_rejects_long_hop():
+    with pytest.raises(ValueError):
+        history_from_game(Board(), {"moves": [[5, 0, 3, 2]]})
@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+from archive import parse_fen
+from bench import PERFT_POSITIONS, board_perft, perft
+from bitboard import WHITE, BitBoard, square_index
+from engine import Board, board_from_fen
+
+# Deep enough to cover promotions and multi-jumps while staying quick.
+PERFT_DEPTH = 5
+
+# A white king on 17 with four black men around it: the only move is a
+# four-piece capture that ends back on 17.
+RING = "W:WK17:B14,15,22,23"
+
+
+def snapshot(board):
+    return board.white, board.black, board.kings, board.key
+
+
+@pytest.mark.parametrize("name, text, expected", PERFT_POSITIONS, ids=[p[0] for p in PERFT_POSITIONS])
+def test_perft(name, text, expected):
+    board, side = board_from_fen(text)
+    before = snapshot(board)
+    for depth in range(1, min(PERFT_DEPTH, len(expected)) + 1):
+        assert perft(board, side, depth) == expected[depth - 1]
+    assert snapshot(board) == before
+
+
+@pytest.mark.parametrize("name, text, expected", PERFT_POSITIONS, ids=[p[0] for p in PERFT_POSITIONS])
+def test_list_board_perft(name, text, expected):
+    board = Board()
+    cells, turn = parse_fen(text)
+    board.set_cells(cells)
+    for depth in range(1, 4):
+        assert board_perft(board, turn, depth) == expected[depth - 1]
+
+
+def test_ring_capture_round_trip():
+    board, side = board_from_fen(RING)
+    before = snapshot(board)
+    start = square_index(4, 1)
+    moves = board.get_all_moves(side)
+    assert len(moves) == 1
+    frm, to, captured = moves[0]
+    assert frm == to == start
+    assert bin(captured).count("1") == 4
+
+    undo = board.make_move(moves[0])
+    assert board.white == board.kings == 1 << start
+    assert board.black == 0
+    assert board.key == board.compute_key()
+    assert board.get_winner() == WHITE
+
+    board.unmake_move(undo)
+    assert snapshot(board) == before
+    assert board.key == board.compute_key()
+
+
+def test_ring_capture_path():
+    board, side = board_from_fen(RING)
+    path = board.move_path(board.get_all_moves(side)[0])
+    assert len(path) == 5
+    assert path[0] == path[-1] == square_index(4, 1)
+
+
+def test_move_path_rejects_impossible_capture():
+    board = BitBoard()
+    with pytest.raises(ValueError):
+        board.move_path((square_index(5, 0), square_index(3, 2), 1 << square_index(0, 1)))
+
+
+def test_random_playout_restores_board():
+    rng = random.Random(0)
+    board, side = BitBoard(), WHITE
+    before = snapshot(board)
+    undos = []
+    for _ in range(80):
+        moves = board.get_all_moves(side)
+        if not moves:
+            break
+        undos.append(board.make_move(rng.choice(moves)))
+        assert board.key == board.compute_key()
+        side ^= 1
+    for undo in reversed(undos):
+        board.unmake_move(undo)
+    assert snapshot(board) == before
@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from bitboard import BitBoard, WHITE, square_coords
+from book import FORMAT_VERSION, HEADER, MAGIC, BookBuilder, OpeningBook, find_move
+from engine import board_from_fen
+from tournament import Engine, play_game, random_opening
+
+# A white man on 26 can take 22 and 14 or 23 and 15, landing on 10 either way.
+TWIN_CAPTURES = "W:W26:B14,15,22,23"
+
+
+def path_of(board, move):
+    return [coord for square in board.move_path(move) for coord in square_coords(square)]
+
+
+def test_captures_with_shared_end_points_stay_apart(tmp_path):
+    board, side = board_from_fen(TWIN_CAPTURES)
+    left, right = sorted(board.get_all_moves(side), key=lambda move: move[2])
+    assert left[:2] == right[:2] and left[2] != right[2]
+    assert find_move(board, side, path_of(board, left)) == left
+    assert find_move(board, side, path_of(board, right)) == right
+
+    builder = BookBuilder()
+    builder.positions[board.side_key(side)] = {left: [4, 0, 0], right: [2, 2, 0]}
+    path = tmp_path / "twin.ckbk"
+    assert builder.write(path) == 2
+    with OpeningBook(path) as book:
+        assert book.lookup(board, side) == right
+    with OpeningBook(path, min_games=3) as book:
+        assert book.lookup(board, side) == left
+    with OpeningBook(path, rng=random.Random(0)) as book:
+        assert {book.lookup(board, side) for _ in range(50)} == {left, right}
+
+
+def test_book_replays_recorded_moves(tmp_path):
+    game = play_game(0, Engine("a", max_depth=2), Engine("b", max_depth=3), random_opening(6, 0))
+    builder = BookBuilder(max_plies=len(game["moves"]))
+    builder.add_game(game["moves"], game["result"])
+    path = tmp_path / "opening.ckbk"
+    builder.write(path)
+    board, side = BitBoard(), WHITE
+    with OpeningBook(path) as book:
+        for recorded in game["moves"]:
+            move = book.lookup(board, side)
+            assert move == find_move(board, side, recorded)
+            board.make_move(move)
+            side ^= 1
+
+
+def test_rejects_other_formats(tmp_path):
+    path = tmp_path / "old.ckbk"
+    path.write_bytes(HEADER.pack(MAGIC, FORMAT_VERSION - 1, 0, 0))
+    with pytest.raises(ValueError):
+        OpeningBook(path)
@@ -0,0 +1,91 @@
+import pytest
+
+from bitboard import WHITE, BitBoard
+from cache import AnalysisCache
+from evaluation import Evaluator
+from search import Search
+from variants import VariantBoard
+
+MOVE = (21, 17, 0)
+
+
+def test_lookup_needs_depth_and_a_legal_move():
+    cache = AnalysisCache()
+    cache.store(1, MOVE, 0.5, 6)
+    assert cache.lookup(1, 6, [MOVE]) == (MOVE, 0.5, 6)
+    assert cache.lookup(1, 7, [MOVE]) is None
+    assert cache.lookup(1, 4, [(22, 17, 0)]) is None
+    assert cache.lookup(2, 1, [MOVE]) is None
+
+
+def test_keeps_deeper_entries_and_evicts_least_recent():
+    cache = AnalysisCache()
+    cache.capacity = 2
+    cache.store(1, MOVE, 0.5, 6)
+    cache.store(1, (22, 17, 0), 0.0, 4)
+    assert cache.lookup(1, 1, [MOVE]) == (MOVE, 0.5, 6)
+    cache.store(2, MOVE, 0.0, 1)
+    cache.lookup(1, 1, [MOVE])
+    cache.store(3, MOVE, 0.0, 1)
+    assert len(cache) == 2
+    assert cache.lookup(2, 1, [MOVE]) is None
+    assert cache.lookup(1, 1, [MOVE]) is not None
+
+
+def test_rejects_moves_off_the_8x8_board():
+    cache = AnalysisCache()
+    for move in ((40, 35, 0), (21, 17, 1 << 40), (-1, 17, 0)):
+        with pytest.raises(ValueError):
+            cache.store(1, move, 0.0, 1)
+    assert len(cache) == 0
+
+
+def test_save_merges_with_the_file(tmp_path):
+    path = str(tmp_path / "analysis.ckac")
+    first = AnalysisCache(path=path)
+    first.store(1, MOVE, 0.5, 6)
+    first.store(2, MOVE, 0.25, 3)
+    assert first.save() == 2
+    second = AnalysisCache(path=path)
+    second.store(2, (22, 17, 0), -0.25, 5)
+    second.store(3, MOVE, 0.0, 2)
+    assert second.save() == 3
+    merged = AnalysisCache(path=path)
+    assert merged.lookup(1, 6, [MOVE]) == (MOVE, 0.5, 6)
+    assert merged.lookup(2, 5, [(22, 17, 0)]) == ((22, 17, 0), -0.25, 5)
+    assert merged.lookup(3, 2, [MOVE]) == (MOVE, 0.0, 2)
+
+
+def test_search_answers_from_the_cache():
+    cache = AnalysisCache()
+    board = BitBoard()
+    first = Search(cache=cache)
+    move = first.get_best_move(board, WHITE, max_depth=4)
+    assert len(cache) == 1
+    second = Search(cache=cache)
+    assert second.get_best_move(board, WHITE, max_depth=4) == move
+    assert second.nodes == 0
+    assert cache.hits == 1
+
+
+def test_keys_depend_on_the_evaluator():
+    cache = AnalysisCache()
+    board = BitBoard()
+    default = Search(cache=cache).cache_key(board, WHITE)
+    assert Search(cache=cache, evaluator=Evaluator()).cache_key(board, WHITE) == default
+    tuned = Search(cache=cache, evaluator=Evaluator(weights={"advancement": 0.1})).cache_key(board, WHITE)
+    assert tuned != default
+    Search(cache=cache).get_best_move(board, WHITE, max_depth=2)
+    other = Search(cache=cache, evaluator=Evaluator(weights={"advancement": 0.1}))
+    other.get_best_move(board, WHITE, max_depth=2)
+    assert other.nodes > 0
+    assert len(cache) == 2
+
+
+def test_variant_boards_are_not_cached():
+    cache = AnalysisCache()
+    board = VariantBoard("international")
+    search = Search(cache=cache)
+    assert search.cache_key(board, WHITE) is None
+    search.get_best_move(board, WHITE, max_depth=2)
+    assert len(cache) == 0
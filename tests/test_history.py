@@ -0,0 +1,63 @@
+from archive import decode_game, encode_game, history_from_game, parse_fen
+from engine import Board, MoveInput, move_hops
+from history import MoveHistory
+from tournament import Engine, play_game, random_opening
+
+# Black to move with the double jump (2,3)->(4,1)->(6,3).
+DOUBLE_JUMP = "B:W14,22,30:B10,1"
+
+
+def play(board, history, turn, path):
+    # Hop by hop, the way the GUI and network peers enter a move.
+    move_input = MoveInput(board, turn)
+    for hop in move_hops(path):
+        done = move_input.add(*hop)
+        assert done is not None
+        next_turn = ("black" if turn == "white" else "white") if done else turn
+        history.record(board, board.make_move(*hop), turn, next_turn)
+    return history.turn
+
+
+def test_undo_takes_back_a_double_jump():
+    board = Board()
+    cells, turn = parse_fen(DOUBLE_JUMP)
+    board.set_cells(cells)
+    history = MoveHistory(board, turn, checkpoint_interval=1)
+    assert play(board, history, turn, (2, 3, 4, 1, 6, 3)) == "white"
+    assert len(history) == 2
+    assert history.paths() == [("black", (2, 3, 4, 1, 6, 3))]
+
+    assert history.undo(board) == "black"
+    assert history.turn == "black"
+    assert not history
+    assert board.cells() == cells
+    assert history.checkpoints == [cells]
+
+
+def test_undo_hop_leaves_earlier_moves():
+    board = Board()
+    history = MoveHistory(board, "white")
+    turn = play(board, history, "white", (5, 0, 4, 1))
+    after_first = board.cells()
+    play(board, history, turn, (2, 1, 3, 2))
+    assert history.undo_hop(board) == "black"
+    assert board.cells() == after_first
+    assert history.paths() == [("white", (5, 0, 4, 1))]
+
+
+def test_loaded_games_undo_whole_moves():
+    game = play_game(0, Engine("a", max_depth=2), Engine("b", max_depth=3), random_opening(6, 0))
+    # The archive stores single hops; the moves are found again on loading.
+    loaded = history_from_game(Board(), decode_game(encode_game(game)))
+    assert [path for _, path in loaded.paths()] == [tuple(path) for path in game["moves"]]
+    assert loaded.move_ends()[-1] == len(loaded)
+
+    board = Board()
+    history = history_from_game(board, game)
+    index = next(index for index, path in enumerate(game["moves"]) if len(path) > 4)
+    while len(history.paths()) > index:
+        history.undo(board)
+    assert [path for _, path in history.paths()] == [tuple(path) for path in game["moves"][:index]]
+    replayed = Board()
+    history.seek(replayed, len(history))
+    assert board.cells() == replayed.cells()
@@ -0,0 +1,114 @@
+import socket
+import threading
+
+import pytest
+
+from protocol import (BINARY, CLOCK, TEXT, Channel, FRAME, MAX_FRAME, MSG_CLOCK, MSG_MOVE, MSG_RESYNC, MSG_SNAPSHOT, MSG_TEXT, RECORD,
+                      SNAPSHOT, FrameDecoder, ProtocolError, TextDecoder, decode_record, encode_frame, encode_payload)
+
+MESSAGES = [(MSG_MOVE, [(5, 0), (3, 2), (1, 4)]), (MSG_CLOCK, 12.5, 0.25), (MSG_TEXT, "hello"),
+            (MSG_SNAPSHOT, 0, 8, bytes(64)), (MSG_RESYNC,)]
+
+
+def frame(kind, body, seq=0, count=1):
+    payload = RECORD.pack(kind, len(body)) + body
+    return FRAME.pack(len(payload), seq, count) + payload
+
+
+def test_frame_round_trip():
+    decoder = FrameDecoder()
+    data = encode_frame(0, MESSAGES) + encode_frame(1, [(MSG_TEXT, "bye")])
+    # Byte by byte, so every partial header and payload is seen.
+    frames = [item for i in range(len(data)) for item in decoder.feed(data[i:i + 1])]
+    assert [seq for seq, _ in frames] == [0, 1]
+    assert frames[0][1] == MESSAGES
+    assert frames[1][1] == [(MSG_TEXT, "bye")]
+
+
+def test_unknown_records_are_skipped():
+    assert FrameDecoder().feed(frame(99, b"abc")) == [(0, [])]
+
+
+@pytest.mark.parametrize("kind, body", [
+    (MSG_CLOCK, b""),
+    (MSG_CLOCK, CLOCK.pack(1, 2)[:-1]),
+    (MSG_CLOCK, CLOCK.pack(1, 2) + b"\0"),
+    (MSG_SNAPSHOT, b""),
+    (MSG_SNAPSHOT, b"\0"),
+    (MSG_SNAPSHOT, SNAPSHOT.pack(0, 8) + bytes(63)),
+    (MSG_MOVE, b""),
+    (MSG_MOVE, b"\5\0"),
+    (MSG_MOVE, b"\5\0\3"),
+])
+def test_malformed_records(kind, body):
+    with pytest.raises(ProtocolError):
+        decode_record(kind, body)
+    with pytest.raises(ProtocolError):
+        FrameDecoder().feed(frame(kind, body))
+
+
+def test_truncated_frames():
+    # The header claims more records, or a longer record, than the payload holds.
+    with pytest.raises(ProtocolError):
+        FrameDecoder().feed(frame(MSG_TEXT, b"hi", count=2))
+    payload = RECORD.pack(MSG_TEXT, 10) + b"hi"
+    with pytest.raises(ProtocolError):
+        FrameDecoder().feed(FRAME.pack(len(payload), 0, 1) + payload)
+
+
+def test_oversize_frames():
+    with pytest.raises(ProtocolError):
+        FrameDecoder().feed(FRAME.pack(MAX_FRAME + 1, 0, 1))
+    with pytest.raises(ProtocolError):
+        encode_payload([(MSG_TEXT, "x" * 60000)] * 20)
+
+
+def test_sequence_gaps():
+    decoder = FrameDecoder()
+    assert decoder.check_seq(0)
+    assert not decoder.check_seq(2)
+    assert decoder.check_seq(3)
+
+
+def test_text_decoder():
+    decoder = TextDecoder()
+    assert decoder.feed(b"5 0 4 1") == [(MSG_MOVE, [(5, 0), (4, 1)])]
+    assert decoder.feed(b"\n2 1 3") == []
+    assert decoder.flush() == []
+    assert decoder.feed(b" 0\n") == [(MSG_MOVE, [(2, 1), (3, 0)])]
+    with pytest.raises(ProtocolError):
+        TextDecoder().feed(b"5 0 four 1\n")
+
+
+def test_text_client_reaches_an_old_host():
+    # A client that never sends the hello writes only what a host from
+    # before the binary format parses: four integers per hop.
+    client, host = socket.socketpair()
+    with client, host:
+        channel = Channel(client)
+        channel.negotiated = True
+        channel.send_move([(2, 3), (4, 1), (6, 3)])
+        client.shutdown(socket.SHUT_WR)
+        data = b""
+        while chunk := host.recv(4096):
+            data += chunk
+    assert [tuple(map(int, line.split())) for line in data.decode().splitlines()] == [(2, 3, 4, 1), (4, 1, 6, 3)]
+
+
+@pytest.mark.parametrize("client_mode", [BINARY, TEXT])
+def test_host_accepts_clients_with_and_without_hello(client_mode):
+    client, host = socket.socketpair()
+    with client, host:
+        served = Channel(host)
+        received = []
+        listener = threading.Thread(target=lambda: received.append(served.receive()))
+        listener.start()
+        channel = Channel(client)
+        if client_mode == BINARY:
+            assert channel.negotiate(timeout=2.0) == BINARY
+        else:
+            channel.negotiated = True
+        channel.send_move([(5, 0), (4, 1)])
+        listener.join(2.0)
+    assert served.mode == client_mode
+    assert received == [(MSG_MOVE, [(5, 0), (4, 1)])]
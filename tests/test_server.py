@@ -0,0 +1,194 @@
+import asyncio
+
+from protocol import MSG_SNAPSHOT, MSG_TEXT, FrameDecoder, frame_header
+from server import EncodedMessages, GameServer, ServerGame, Spectator
+
+
+class FakeWriter:
+    def __init__(self):
+        self.closed = False
+
+    def is_closing(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    # Records what a spectator writes; each send waits for a permit so a
+    # test can hold the spectator back and let it fall behind.
+    mode = "text"
+
+    def __init__(self):
+        self.writer = FakeWriter()
+        self.watching = None
+        self.sent = []
+        self.permits = asyncio.Semaphore(0)
+
+    async def send_encoded(self, encoded):
+        await self.permits.acquire()
+        self.sent.append(encoded.messages)
+
+    async def send_messages(self, messages):
+        await self.send_encoded(EncodedMessages(messages))
+
+    def close(self):
+        self.writer.close()
+
+
+class FakePlayer:
+    game = None
+    color = None
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def watch(game, max_queue=2, max_resyncs=1):
+    connection = FakeConnection()
+    spectator = Spectator(connection, game, max_queue, max_resyncs)
+    game.spectators.add(spectator)
+    connection.watching = spectator
+    return connection, spectator
+
+
+def test_encoded_once():
+    encoded = EncodedMessages([(MSG_TEXT, "TURN black")])
+    assert encoded.payload is encoded.payload
+    assert encoded.text is encoded.text
+    assert encoded.text == b"TURN black\n"
+    assert FrameDecoder().feed(frame_header(0, encoded.payload, 1) + encoded.payload) == [(0, encoded.messages)]
+
+
+def test_publish_shares_encoding():
+    async def run():
+        game = ServerGame(1, FakePlayer(), FakePlayer())
+        spectators = [watch(game, max_queue=8)[1] for _ in range(3)]
+        await settle()
+        for spectator in spectators:
+            spectator.resync = False
+        game.publish([(MSG_TEXT, "MOVE 5 0 4 1")])
+        (first,), (second,), (third,) = (spectator.queue for spectator in spectators)
+        assert first is second is third
+
+    asyncio.run(run())
+
+
+def test_spectator_starts_with_snapshot():
+    async def run():
+        game = ServerGame(1, FakePlayer(), FakePlayer())
+        connection, spectator = watch(game)
+        connection.permits.release()
+        await settle()
+        assert connection.sent[0][0][0] == MSG_SNAPSHOT
+        assert connection.sent[0][1] == (MSG_TEXT, "TURN white")
+        spectator.task.cancel()
+
+    asyncio.run(run())
+
+
+def test_occasional_lag_is_forgiven():
+    async def run():
+        game = ServerGame(1, FakePlayer(), FakePlayer())
+        connection, spectator = watch(game, max_queue=2, max_resyncs=1)
+        for _ in range(5):
+            # Falls behind, then catches up with a snapshot.
+            for i in range(3):
+                game.publish([(MSG_TEXT, f"X{i}")])
+            for _ in range(4):
+                connection.permits.release()
+            await settle()
+            assert spectator.resyncs == 0
+        assert not connection.writer.closed
+        assert spectator in game.spectators
+        spectator.task.cancel()
+
+    asyncio.run(run())
+
+
+def test_lag_in_a_row_disconnects():
+    async def run():
+        game = ServerGame(1, FakePlayer(), FakePlayer())
+        connection, spectator = watch(game, max_queue=2, max_resyncs=1)
+        connection.permits.release()
+        await settle()
+        game.publish([(MSG_TEXT, "W")])
+        await settle()
+        # Blocked writing W: the queue overflows and a snapshot is due.
+        for _ in range(3):
+            game.publish([(MSG_TEXT, "Y")])
+        assert spectator.resyncs == 1 and spectator.resync
+        connection.permits.release()
+        await settle()
+        # Blocked writing the snapshot: overflowing again is one too many.
+        for _ in range(3):
+            game.publish([(MSG_TEXT, "Z")])
+        await settle()
+        assert connection.writer.closed
+        assert spectator not in game.spectators
+        assert connection.watching is None
+
+    asyncio.run(run())
+
+
+def test_idle_timeout_spares_waiting_connections():
+    async def readlines(reader, count):
+        return [(await asyncio.wait_for(reader.readline(), 2)).decode().strip() for _ in range(count)]
+
+    async def run():
+        server = GameServer("127.0.0.1", 0, idle_timeout=0.5, engine_workers=1)
+        port = (await server.start()).sockets[0].getsockname()[1]
+        try:
+            first = await asyncio.open_connection("127.0.0.1", port)
+            assert await readlines(first[0], 1) == ["WELCOME"]
+            first[1].write(b"PLAY\n")
+            await readlines(first[0], 1)
+            # Waiting in the lobby for longer than the timeout.
+            await asyncio.sleep(0.8)
+            second = await asyncio.open_connection("127.0.0.1", port)
+            watcher = await asyncio.open_connection("127.0.0.1", port)
+            await readlines(second[0], 1)
+            await readlines(watcher[0], 1)
+            second[1].write(b"PLAY\n")
+            colors = await readlines(first[0], 2)
+            await readlines(second[0], 2)
+            white, black = (first, second) if colors[0].endswith("white") else (second, first)
+            watcher[1].write(b"WATCH 1\n")
+            await readlines(watcher[0], 3)
+
+            white[1].write(b"MOVE 5 0 4 1\n")
+            # Black is to move and never does; white and the spectator wait.
+            await asyncio.sleep(1.2)
+            assert b"ERROR Idle timeout\n" in await asyncio.wait_for(black[0].read(), 2)
+            assert await readlines(white[0], 3) == ["MOVE 5 0 4 1", "TURN black", "END white opponent left"]
+            assert await readlines(watcher[0], 3) == ["MOVE 5 0 4 1", "TURN black", "END white opponent left"]
+        finally:
+            await server.close()
+
+    asyncio.run(run())
+
+
+def test_overlong_line_is_a_protocol_error():
+    async def run():
+        server = GameServer("127.0.0.1", 0, engine_workers=1)
+        port = (await server.start()).sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            assert await reader.readline() == b"WELCOME\n"
+            writer.write(b"x" * 100000 + b"\n")
+            assert await asyncio.wait_for(reader.read(), 2) == b"ERROR Line too long\n"
+            assert not server.connections
+            writer.close()
+            # The server carries on serving other connections.
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            assert await reader.readline() == b"WELCOME\n"
+            writer.write(b"PING\n")
+            assert await asyncio.wait_for(reader.readline(), 2) == b"PONG\n"
+            writer.close()
+        finally:
+            await server.close()
+
+    asyncio.run(run())
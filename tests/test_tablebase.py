@@ -0,0 +1,65 @@
+import pytest
+
+from bitboard import BLACK, BOTTOM_ROW, TOP_ROW, WHITE, BitBoard
+from tablebase import DRAW, LOSS, WIN, Tablebase, generate, iter_slice, slice_order
+
+
+@pytest.fixture(scope="module")
+def tablebase(tmp_path_factory):
+    path = tmp_path_factory.mktemp("tablebase") / "two.cktb"
+    generate(path, max_pieces=2)
+    with Tablebase(path) as tablebase:
+        yield tablebase
+
+
+def expected(tablebase, board, side):
+    # The result one ply of search finds from the stored results of the
+    # positions after each move.
+    wins, losses, draws = [], [], False
+    for move in board.get_all_moves(side):
+        undo = board.make_move(move)
+        if not board.white or not board.black:
+            wins.append(1)
+        else:
+            result, distance = tablebase.probe(board, 1 - side)
+            if result == LOSS:
+                wins.append(distance + 1)
+            elif result == WIN:
+                losses.append(distance + 1)
+            else:
+                draws = True
+        board.unmake_move(undo)
+    if wins:
+        return WIN, min(wins)
+    if draws:
+        return DRAW, 0
+    return LOSS, max(losses, default=0)
+
+
+def test_results_agree_with_one_ply_search(tablebase):
+    positions = 0
+    for counts in slice_order(2):
+        for white_men, white_kings, black_men, black_kings in iter_slice(counts):
+            if white_men & TOP_ROW or black_men & BOTTOM_ROW:
+                continue
+            board = BitBoard(white_men | white_kings, black_men | black_kings, white_kings | black_kings)
+            for side in (WHITE, BLACK):
+                assert tablebase.probe(board, side) == expected(tablebase, board, side), (board, side)
+                positions += 1
+    assert positions == 6976
+
+
+def test_probe_outside_the_table(tablebase):
+    assert tablebase.probe(BitBoard(), WHITE) is None
+
+
+def test_lone_kings_draw(tablebase):
+    board = BitBoard(1 << 0, 1 << 31, 1 << 0 | 1 << 31)
+    assert tablebase.probe(board, WHITE) == (DRAW, 0)
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "bogus.cktb"
+    path.write_bytes(bytes(64))
+    with pytest.raises(ValueError):
+        Tablebase(path)
@@ -0,0 +1,48 @@
+from bitboard import BLACK, WHITE
+from search import Search
+from tournament import Engine, TournamentStats, play_game, random_opening
+
+
+class RecordingSearch(Search):
+    def __init__(self, depths):
+        super().__init__()
+        self.depths = depths
+
+    def get_best_move(self, board, side, difficulty=2, time_limit=None, max_depth=None):
+        self.depths.setdefault(side, set()).add(max_depth)
+        return super().get_best_move(board, side, difficulty, time_limit, max_depth=1)
+
+
+class RecordingEngine(Engine):
+    def __init__(self, depths, **options):
+        super().__init__(**options)
+        self.depths = depths
+
+    def create_search(self):
+        return RecordingSearch(self.depths)
+
+
+def test_depth_does_not_depend_on_color():
+    for difficulty in (1, 2, 3):
+        depths = {}
+        engine = RecordingEngine(depths, name="a", difficulty=difficulty)
+        play_game(0, engine, engine, random_opening(4, 0), max_plies=12)
+        assert depths[WHITE] == depths[BLACK] == {engine.search_depth()}
+
+
+def test_explicit_depth_and_time_limit():
+    assert Engine(max_depth=3, difficulty=1).search_depth() == 3
+    assert Engine(time_limit=0.5).search_depth() is None
+    assert Engine(difficulty=3).search_depth() > Engine(difficulty=1).search_depth()
+
+
+def test_paired_games_record_paths():
+    a, b = Engine("a", max_depth=2), Engine("b", max_depth=2)
+    opening = random_opening(4, 1)
+    stats = TournamentStats(a, b)
+    for index, (white, black) in enumerate(((a, b), (b, a))):
+        game = play_game(index, white, black, opening, max_plies=40)
+        assert game["opening"] == game["moves"][:len(opening)]
+        assert game["plies"] == len(game["moves"])
+        stats.add(game)
+    assert stats.wins + stats.draws + stats.losses == 2
@@ -0,0 +1,46 @@
+import random
+
+import pytest
+
+from bench import VARIANT_PERFT, perft, sample_positions
+from bitboard import BitBoard
+from variants import VariantBoard
+
+PERFT_DEPTH = 4
+
+
+def snapshot(board):
+    return board.white, board.black, board.kings, board.key
+
+
+@pytest.mark.parametrize("name, expected", VARIANT_PERFT, ids=[p[0] for p in VARIANT_PERFT])
+def test_perft(name, expected):
+    board = VariantBoard(name)
+    before = snapshot(board)
+    for depth in range(1, PERFT_DEPTH + 1):
+        assert perft(board, 0, depth) == expected[depth - 1]
+    assert snapshot(board) == before
+
+
+@pytest.mark.parametrize("name", [p[0] for p in VARIANT_PERFT])
+def test_random_playout_restores_board(name):
+    rng = random.Random(0)
+    board, side = VariantBoard(name), 0
+    before = snapshot(board)
+    undos = []
+    for _ in range(120):
+        moves = board.get_all_moves(side)
+        if not moves:
+            break
+        undos.append(board.make_move(rng.choice(moves)))
+        assert board.key == board.compute_key()
+        side ^= 1
+    for undo in reversed(undos):
+        board.unmake_move(undo)
+    assert snapshot(board) == before
+
+
+def test_american_matches_bitboard():
+    for position, side in sample_positions("american", 200):
+        board = BitBoard.from_cells(position.cells())
+        assert sorted(position.get_all_moves(side)) == sorted(board.get_all_moves(side))
@@ -0,0 +1,288 @@
+import argparse
+import importlib
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from bitboard import BitBoard, WHITE, BLACK, square_coords
+from book import OpeningBook
+from evaluation import Evaluator
+from search import Search, difficulty_depth
+from tablebase import Tablebase
+
+COLOR_NAMES = ("white", "black")
+
+
+class Engine:
+    def __init__(self, name="engine", difficulty=2, time_limit=None, max_depth=None, factory=None, tablebase=None,
+                 book=None, weights=None):
+        self.name = name
+        self.difficulty = difficulty
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.factory = factory
+        self.tablebase = tablebase
+        self.book = book
+        self.weights = weights
+
+    @classmethod
+    def parse(cls, spec, name):
+        options = {"name": name}
+        for item in filter(None, spec.split(",")):
+            key, _, value = item.partition("=")
+            key = key.strip()
+            if key in ("difficulty", "max_depth"):
+                options[key] = int(value)
+            elif key == "time_limit":
+                options[key] = float(value)
+            elif key in ("name", "factory", "tablebase", "book", "weights"):
+                options[key] = value.strip()
+            else:
+                raise ValueError(f"Unknown engine option: {key}")
+        return cls(**options)
+
+    def search_depth(self):
+        # A fixed depth unless the engine is timed.  Difficulty maps to the
+        # depth the GUI engine searches as Black whichever color is played:
+        # difficulty_depth shortens White's search as difficulty rises, which
+        # would make a match measure the color split instead of the engines.
+        if self.max_depth is not None or self.time_limit is not None:
+            return self.max_depth
+        return difficulty_depth(BLACK, self.difficulty)
+
+    def create_search(self):
+        if self.factory:
+            module_name, _, attr = self.factory.partition(":")
+            return getattr(importlib.import_module(module_name), attr)()
+        return Search(tablebase=Tablebase(self.tablebase) if self.tablebase else None,
+                      book=OpeningBook(self.book) if self.book else None,
+                      evaluator=Evaluator(self.weights) if self.weights else None)
+
+
+def random_opening(plies, seed):
+    rng = random.Random(seed)
+    board = BitBoard()
+    side = WHITE
+    moves = []
+    for _ in range(plies):
+        legal = board.get_all_moves(side)
+        if not legal:
+            break
+        move = rng.choice(legal)
+        board.make_move(move)
+        moves.append(move)
+        side = 1 - side
+    return moves
+
+
+def path_coords(path):
+    return [coord for square in path for coord in square_coords(square)]
+
+
+def play_game(index, white, black, opening, game_time=None, increment=0.0, max_plies=200,
+              no_progress_plies=80):
+    engines = (white, black)
+    searches = (white.create_search(), black.create_search())
+    clocks = [game_time, game_time]
+    board = BitBoard()
+    side = WHITE
+    plies = 0
+    quiet_plies = 0
+    seen = {}
+    result = reason = None
+    played = []
+    started = time.monotonic()
+
+    for move in opening:
+        played.append(board.move_path(move))
+        board.make_move(move)
+        side = 1 - side
+        plies += 1
+
+    while result is None:
+        moves = board.get_all_moves(side)
+        if not moves:
+            result, reason = COLOR_NAMES[1 - side], "no moves"
+            break
+        key = board.side_key(side)
+        seen[key] = seen.get(key, 0) + 1
+        if seen[key] >= 3:
+            result, reason = "draw", "repetition"
+            break
+        if plies >= max_plies:
+            result, reason = "draw", "max plies"
+            break
+        if quiet_plies >= no_progress_plies:
+            result, reason = "draw", "no progress"
+            break
+
+        engine = engines[side]
+        time_limit = engine.time_limit
+        max_depth = engine.search_depth()
+        if clocks[side] is not None:
+            budget = clocks[side] / 20 + increment
+            time_limit = budget if time_limit is None else min(time_limit, budget)
+        move_started = time.monotonic()
+        move = searches[side].get_best_move(board, side, engine.difficulty, time_limit, max_depth)
+        if clocks[side] is not None:
+            clocks[side] += increment - (time.monotonic() - move_started)
+            if clocks[side] < 0:
+                result, reason = COLOR_NAMES[1 - side], "time"
+                break
+        if move not in moves:
+            move = moves[0]
+
+        was_king = board.kings >> move[0] & 1
+        played.append(board.move_path(move))
+        board.make_move(move)
+        plies += 1
+        quiet_plies = quiet_plies + 1 if was_king and not move[2] else 0
+        side = 1 - side
+        if not board.white or not board.black:
+            result, reason = COLOR_NAMES[WHITE if board.white else BLACK], "no pieces"
+
+    return {
+        "game": index,
+        "white": white.name,
+        "black": black.name,
+        "result": result,
+        "reason": reason,
+        "plies": plies,
+        # Every move is the whole path of squares it passes through, so a
+        # multi-jump keeps its intermediate landings.
+        "opening": [path_coords(path) for path in played[:len(opening)]],
+        "moves": [path_coords(path) for path in played],
+        "seconds": round(time.monotonic() - started, 3),
+    }
+
+
+def elo_interval(wins, draws, losses, z=1.96):
+    games = wins + draws + losses
+    if not games:
+        return 0.0, float('-inf'), float('inf')
+    score = (wins + 0.5 * draws) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = z * math.sqrt(variance / games)
+
+    def to_elo(p):
+        if p <= 0:
+            return float('-inf')
+        if p >= 1:
+            return float('inf')
+        return 400 * math.log10(p / (1 - p))
+
+    return to_elo(score), to_elo(score - margin), to_elo(score + margin)
+
+
+class TournamentStats:
+    def __init__(self, engine_a, engine_b):
+        self.engine_a = engine_a
+        self.engine_b = engine_b
+        self.results = {"white_wins": 0, "black_wins": 0, "draws": 0}
+        self.wins = self.draws = self.losses = 0
+
+    def add(self, game):
+        if game["result"] == "white":
+            self.results["white_wins"] += 1
+        elif game["result"] == "black":
+            self.results["black_wins"] += 1
+        else:
+            self.results["draws"] += 1
+
+        if game["result"] == "draw":
+            self.draws += 1
+        elif game[game["result"]] == self.engine_a.name:
+            self.wins += 1
+        else:
+            self.losses += 1
+
+    def summary(self):
+        elo, elo_low, elo_high = elo_interval(self.wins, self.draws, self.losses)
+        games = self.wins + self.draws + self.losses
+        return dict(self.results, games=games, engine_a=self.engine_a.name, engine_b=self.engine_b.name,
+                    a_wins=self.wins, a_draws=self.draws, a_losses=self.losses,
+                    score=(self.wins + 0.5 * self.draws) / games if games else 0.0,
+                    elo=elo, elo_low=elo_low, elo_high=elo_high)
+
+
+def run_tournament(engine_a, engine_b, games, workers=None, opening_plies=4, seed=None, game_time=None,
+                   increment=0.0, max_plies=200, no_progress_plies=80, output=None, on_result=None):
+    if engine_a.name == engine_b.name:
+        raise ValueError("Engines need distinct names to attribute results")
+    seed = random.randrange(1 << 32) if seed is None else seed
+    stats = TournamentStats(engine_a, engine_b)
+    workers = workers or os.cpu_count() or 1
+
+    def game_args(index):
+        # Games are played in pairs on the same opening with colors swapped.
+        opening = random_opening(opening_plies, seed + index // 2)
+        white, black = (engine_a, engine_b) if index % 2 == 0 else (engine_b, engine_a)
+        return index, white, black, opening, game_time, increment, max_plies, no_progress_plies
+
+    with ProcessPoolExecutor(workers) as pool:
+        pending = set()
+        next_index = 0
+        while next_index < games or pending:
+            while next_index < games and len(pending) < workers * 4:
+                pending.add(pool.submit(play_game, *game_args(next_index)))
+                next_index += 1
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                game = future.result()
+                stats.add(game)
+                if output is not None:
+                    output.write(json.dumps(game) + "\n")
+                    output.flush()
+                if on_result is not None:
+                    on_result(game)
+    return stats.summary()
+
+
+def format_summary(summary):
+    return (f"White Wins: {summary['white_wins']}\n"
+            f"Black Wins: {summary['black_wins']}\n"
+            f"Draws: {summary['draws']}\n"
+            f"{summary['engine_a']} vs {summary['engine_b']}: "
+            f"+{summary['a_wins']} ={summary['a_draws']} -{summary['a_losses']} "
+            f"(score {summary['score']:.3f})\n"
+            f"Elo: {summary['elo']:+.1f} [{summary['elo_low']:+.1f}, {summary['elo_high']:+.1f}]")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play a headless engine-vs-engine checkers match.")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--engine-a", default="difficulty=2",
+                        help="comma-separated options: name, difficulty, time_limit, max_depth, tablebase=path, book=path, "
+                             "weights=path, factory=module:callable")
+    parser.add_argument("--engine-b", default="difficulty=1")
+    parser.add_argument("--opening-plies", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--game-time", type=float, default=None, help="seconds per side per game")
+    parser.add_argument("--increment", type=float, default=0.0)
+    parser.add_argument("--max-plies", type=int, default=200)
+    parser.add_argument("--no-progress-plies", type=int, default=80)
+    parser.add_argument("--output", help="JSONL file that receives one line per finished game")
+    args = parser.parse_args(argv)
+
+    engine_a = Engine.parse(args.engine_a, "A")
+    engine_b = Engine.parse(args.engine_b, "B")
+    output = open(args.output, "a") if args.output else None
+    try:
+        summary = run_tournament(engine_a, engine_b, args.games, args.workers, args.opening_plies, args.seed,
+                                 args.game_time, args.increment, args.max_plies, args.no_progress_plies, output,
+                                 on_result=lambda game: print(f"game {game['game']}: {game['result']} ({game['reason']})",
+                                                              file=sys.stderr))
+    finally:
+        if output is not None:
+            output.close()
+    print(format_summary(summary))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
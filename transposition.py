@@ -0,0 +1,44 @@
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+REPLACE_ALWAYS = "always"
+REPLACE_DEPTH = "depth"
+
+# Rough cost of one occupied slot: the list pointer, the entry tuple and the
+# 64-bit key it holds.  Values and moves are shared with the search.
+ENTRY_BYTES = 160
+
+
+class TranspositionTable:
+    def __init__(self, max_mb=16, replacement=REPLACE_DEPTH):
+        if replacement not in (REPLACE_ALWAYS, REPLACE_DEPTH):
+            raise ValueError(f"Unknown replacement policy: {replacement}")
+        size = 1
+        while size * 2 * ENTRY_BYTES <= max_mb * 1024 * 1024:
+            size *= 2
+        self.size = size
+        self.mask = size - 1
+        self.replacement = replacement
+        self.generation = 0
+        self.entries = [None] * size
+
+    def new_search(self):
+        self.generation += 1
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.generation = 0
+
+    def probe(self, key):
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, flag, value, move):
+        index = key & self.mask
+        entry = self.entries[index]
+        if (entry is None or self.replacement == REPLACE_ALWAYS or entry[0] == key
+                or entry[5] != self.generation or depth >= entry[1]):
+            self.entries[index] = (key, depth, flag, value, move, self.generation)
@@ -0,0 +1,352 @@
+import random
+
+from bitboard import WHITE, BLACK, iter_bits
+
+# Directions in the same order as bitboard.py: up-left, up-right,
+# down-left, down-right.  White moves up the board.
+DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+FORWARD = ((0, 1), (2, 3))
+
+
+class Variant:
+    def __init__(self, name, size, flying_kings=False, men_capture_backwards=False, majority_capture=False,
+                 crown_ends_capture=True):
+        self.name = name
+        self.size = size
+        # Kings move and capture along whole diagonals.
+        self.flying_kings = flying_kings
+        self.men_capture_backwards = men_capture_backwards
+        # Of the available captures, only those taking the most pieces may be
+        # played.
+        self.majority_capture = majority_capture
+        # A man reaching the far row during a capture is crowned and stops;
+        # otherwise it only becomes a king if the move ends there.
+        self.crown_ends_capture = crown_ends_capture
+
+    def __repr__(self):
+        return f"Variant({self.name!r}, {self.size})"
+
+
+VARIANTS = {
+    "american": Variant("american", 8),
+    "brazilian": Variant("brazilian", 8, flying_kings=True, men_capture_backwards=True, majority_capture=True,
+                         crown_ends_capture=False),
+    "international": Variant("international", 10, flying_kings=True, men_capture_backwards=True,
+                             majority_capture=True, crown_ends_capture=False),
+    "canadian": Variant("canadian", 12, flying_kings=True, men_capture_backwards=True,
+                        majority_capture=True, crown_ends_capture=False),
+}
+
+
+class MoveTables:
+    # Everything about the geometry of one board size, computed once: the
+    # playable squares (numbered row by row, so square n is PDN square n + 1),
+    # each square's neighbour and full ray in every direction, row masks and
+    # Zobrist keys.  Move generation only looks things up here.
+    def __init__(self, size):
+        self.size = size
+        self.coords = tuple((row, col) for row in range(size) for col in range(size) if (row + col) % 2)
+        self.squares = len(self.coords)
+        self.index = {coords: square for square, coords in enumerate(self.coords)}
+        self.rays = tuple(tuple(self.ray(square, dr, dc) for square in range(self.squares))
+                          for dr, dc in DIRECTIONS)
+        self.step = tuple(tuple(ray[0] if ray else -1 for ray in rays) for rays in self.rays)
+        # The squares next to each square, as a mask.
+        self.near = tuple(sum(1 << self.step[direction][square] for direction in range(4)
+                              if self.step[direction][square] >= 0) for square in range(self.squares))
+        self.full = (1 << self.squares) - 1
+        self.rows = tuple(sum(1 << square for square, (r, _) in enumerate(self.coords) if r == row)
+                          for row in range(size))
+        self.promotion = (self.rows[0], self.rows[size - 1])
+        # Seeded by size so keys are stable across processes and runs.
+        rng = random.Random(0x5EED + size)
+        self.zobrist = tuple(tuple(rng.getrandbits(64) for _ in range(self.squares)) for _ in range(4))
+        self.zobrist_side = rng.getrandbits(64)
+
+    def ray(self, square, dr, dc):
+        row, col = self.coords[square]
+        squares = []
+        row, col = row + dr, col + dc
+        while 0 <= row < self.size and 0 <= col < self.size:
+            squares.append(self.index[(row, col)])
+            row, col = row + dr, col + dc
+        return tuple(squares)
+
+    def start_position(self):
+        # Men fill all but the two middle rows.
+        men_rows = self.size // 2 - 1
+        black = sum(self.rows[row] for row in range(men_rows))
+        white = sum(self.rows[row] for row in range(self.size - men_rows, self.size))
+        return white, black
+
+
+_tables = {}
+
+
+def move_tables(size):
+    tables = _tables.get(size)
+    if tables is None:
+        tables = _tables[size] = MoveTables(size)
+    return tables
+
+
+class VariantBoard:
+    # The BitBoard interface (get_all_moves, get_captures, make_move,
+    # unmake_move, side_key, evaluate, ...) for any variant and board size,
+    # with moves as (from, to, captured) over the variant's squares.  Search
+    # works on it unchanged; the 8x8 tablebase, book and tuned evaluator do
+    # not apply.
+    __slots__ = ("variant", "tables", "white", "black", "kings", "key")
+
+    def __init__(self, variant="american", white=None, black=None, kings=0):
+        self.variant = VARIANTS[variant] if isinstance(variant, str) else variant
+        self.tables = move_tables(self.variant.size)
+        if white is None or black is None:
+            white, black = self.tables.start_position()
+        self.white = white
+        self.black = black
+        self.kings = kings
+        self.key = self.compute_key()
+
+    @classmethod
+    def from_cells(cls, variant, cells):
+        # Board.cells() layout: one byte per square of the full board.
+        variant = VARIANTS[variant] if isinstance(variant, str) else variant
+        size = variant.size
+        index = move_tables(size).index
+        white = black = kings = 0
+        for position, code in enumerate(cells):
+            if code:
+                bit = 1 << index[(position // size, position % size)]
+                if code <= 2:
+                    white |= bit
+                else:
+                    black |= bit
+                if code in (2, 4):
+                    kings |= bit
+        return cls(variant, white, black, kings)
+
+    def cells(self):
+        size = self.variant.size
+        cells = bytearray(size * size)
+        for square, (row, col) in enumerate(self.tables.coords):
+            bit = 1 << square
+            if (self.white | self.black) & bit:
+                cells[row * size + col] = (1 if self.white & bit else 3) + (1 if self.kings & bit else 0)
+        return bytes(cells)
+
+    def copy(self):
+        return VariantBoard(self.variant, self.white, self.black, self.kings)
+
+    def __eq__(self, other):
+        return (isinstance(other, VariantBoard) and self.variant is other.variant and self.white == other.white
+                and self.black == other.black and self.kings == other.kings)
+
+    def __hash__(self):
+        return self.key
+
+    def compute_key(self):
+        key = 0
+        for kind, bits in enumerate((self.white & ~self.kings, self.white & self.kings,
+                                     self.black & ~self.kings, self.black & self.kings)):
+            keys = self.tables.zobrist[kind]
+            for square in iter_bits(bits):
+                key ^= keys[square]
+        return key
+
+    def side_key(self, side):
+        return self.key ^ self.tables.zobrist_side if side == BLACK else self.key
+
+    def __repr__(self):
+        return (f"VariantBoard({self.variant.name!r}, white={self.white:#x}, black={self.black:#x}, "
+                f"kings={self.kings:#x})")
+
+    def print_board(self):
+        size = self.variant.size
+        cells = self.cells()
+        symbols = (".", "w", "Kw", "b", "Kb")
+        print("  " + " ".join(str(i % 10) for i in range(size)))
+        for row in range(size):
+            print(row % 10, " ".join(symbols[cells[row * size + col]] for col in range(size)))
+        print()
+
+    def sides(self, side):
+        if side == WHITE:
+            return self.white, self.black
+        return self.black, self.white
+
+    def get_all_moves(self, side):
+        captures = self.get_captures(side)
+        if captures:
+            return captures
+        own = self.white if side == WHITE else self.black
+        empty = ~(self.white | self.black) & self.tables.full
+        flying = self.variant.flying_kings
+        rays = self.tables.rays
+        step = self.tables.step
+        moves = []
+        for frm in iter_bits(own & self.kings):
+            for direction in range(4):
+                if flying:
+                    for to in rays[direction][frm]:
+                        if not empty >> to & 1:
+                            break
+                        moves.append((frm, to, 0))
+                else:
+                    to = step[direction][frm]
+                    if to >= 0 and empty >> to & 1:
+                        moves.append((frm, to, 0))
+        for frm in iter_bits(own & ~self.kings):
+            for direction in FORWARD[side]:
+                to = step[direction][frm]
+                if to >= 0 and empty >> to & 1:
+                    moves.append((frm, to, 0))
+        return moves
+
+    def get_captures(self, side):
+        own, opp = self.sides(side)
+        empty = ~(self.white | self.black) & self.tables.full
+        step = self.tables.step
+        near = self.tables.near
+        variant = self.variant
+        man_directions = range(4) if variant.men_capture_backwards else FORWARD[side]
+        promotion = self.tables.promotion[side] if variant.crown_ends_capture else 0
+        moves = []
+        for frm in iter_bits(own):
+            king = self.kings >> frm & 1
+            directions = range(4) if king else man_directions
+            # Most pieces have nothing to take: a jump needs an opponent
+            # next to the piece (or, for a flying king, along a ray).
+            if not king or not variant.flying_kings:
+                if not opp & near[frm]:
+                    continue
+                for direction in directions:
+                    middle = step[direction][frm]
+                    if middle >= 0 and opp >> middle & 1:
+                        to = step[direction][middle]
+                        if to >= 0 and empty >> to & 1:
+                            break
+                else:
+                    continue
+            self.extend_jumps(frm, frm, 0, empty | 1 << frm, opp, king, directions, 0 if king else promotion,
+                              moves)
+        if moves and variant.majority_capture:
+            most = max(captured.bit_count() for _, _, captured in moves)
+            moves = [move for move in moves if move[2].bit_count() == most]
+        return moves
+
+    def extend_jumps(self, frm, square, captured, empty, opp, king, directions, promotion, moves):
+        # As BitBoard.extend_jumps: jumped pieces stay on the board until the
+        # move ends, so they block and cannot be taken twice.  A flying king
+        # jumps the first piece along a ray and may land on any empty square
+        # beyond it.
+        extended = False
+        flying = king and self.variant.flying_kings
+        for direction in directions:
+            if flying:
+                ray = self.tables.rays[direction][square]
+                for index, middle in enumerate(ray):
+                    if not empty >> middle & 1:
+                        break
+                else:
+                    continue
+                if not opp >> middle & 1 or captured >> middle & 1:
+                    continue
+                for to in ray[index + 1:]:
+                    if not empty >> to & 1:
+                        break
+                    extended = True
+                    self.extend_jumps(frm, to, captured | 1 << middle, empty, opp, king, directions, promotion,
+                                      moves)
+                continue
+            step = self.tables.step[direction]
+            middle = step[square]
+            if middle < 0 or not opp >> middle & 1 or captured >> middle & 1:
+                continue
+            to = step[middle]
+            if to < 0 or not empty >> to & 1:
+                continue
+            extended = True
+            if 1 << to & promotion:
+                move = (frm, to, captured | 1 << middle)
+                if move not in moves:
+                    moves.append(move)
+            else:
+                self.extend_jumps(frm, to, captured | 1 << middle, empty, opp, king, directions, promotion, moves)
+        if not extended and captured:
+            move = (frm, square, captured)
+            if move not in moves:
+                moves.append(move)
+
+    def has_moves(self, side):
+        return bool(self.get_all_moves(side))
+
+    def make_move(self, move):
+        frm, to, captured = move
+        from_bit = 1 << frm
+        to_bit = 1 << to
+        moved = from_bit ^ to_bit
+        key = self.key
+        zobrist = self.tables.zobrist
+        if self.white & from_bit:
+            self.white ^= moved
+            self.black ^= captured
+            mover = 0
+            promotion_row = self.tables.promotion[WHITE]
+        else:
+            self.black ^= moved
+            self.white ^= captured
+            mover = 2
+            promotion_row = self.tables.promotion[BLACK]
+        captured_kings = self.kings & captured
+        promoted = 0
+        if self.kings & from_bit:
+            self.kings ^= moved
+            keys = zobrist[mover + 1]
+            new_key = key ^ keys[frm] ^ keys[to]
+        else:
+            promoted = to_bit & promotion_row
+            self.kings |= promoted
+            new_key = key ^ zobrist[mover][frm] ^ zobrist[mover + (1 if promoted else 0)][to]
+        for square in iter_bits(captured):
+            new_key ^= zobrist[2 - mover + (1 if captured_kings >> square & 1 else 0)][square]
+        self.kings ^= captured_kings
+        self.key = new_key
+        return move, captured_kings, promoted, key
+
+    def unmake_move(self, undo):
+        (frm, to, captured), captured_kings, promoted, self.key = undo
+        from_bit = 1 << frm
+        to_bit = 1 << to
+        moved = from_bit ^ to_bit
+        self.kings ^= promoted | captured_kings
+        if self.kings & to_bit:
+            self.kings ^= moved
+        if self.white & to_bit:
+            self.white ^= moved
+            self.black ^= captured
+        else:
+            self.black ^= moved
+            self.white ^= captured
+
+    def apply_move(self, move):
+        board = self.copy()
+        board.make_move(move)
+        return board
+
+    def get_winner(self):
+        if not self.white:
+            return BLACK
+        if not self.black:
+            return WHITE
+        if not self.has_moves(WHITE):
+            return BLACK
+        if not self.has_moves(BLACK):
+            return WHITE
+        return None
+
+    def evaluate(self):
+        white_kings = self.white & self.kings
+        black_kings = self.black & self.kings
+        return (self.black.bit_count() + 2 * black_kings.bit_count()
+                - self.white.bit_count() - 2 * white_kings.bit_count())